@@ -8,14 +8,22 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
-    db.init_app(app)
-    
-    from app.routes import main
-    app.register_blueprint(main)
+    from app import database
+    database.init_app(app)
+
+    from app import instrumentation
+    instrumentation.init_app(app)
+
+    from app import upstream
+    upstream.init_app(app)
     
     with app.app_context():
         # Import models to ensure they are registered with SQLAlchemy
         from app import models
         db.create_all()
+
+    # Registering the blueprint may start the task worker, which needs the tables
+    from app.routes import main
+    app.register_blueprint(main)
     
     return app
\ No newline at end of file
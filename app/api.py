@@ -1,6 +1,9 @@
-import requests
+import os
+from flask import has_request_context
+from app.instrumentation import timed
+from app.upstream import governor
 
-BASE_URL = "https://civitai.com/api/v1"
+BASE_URL = os.environ.get("CIVITAI_API_URL", "https://civitai.com/api/v1")
 
 def _get_headers(api_key=None):
     headers = {}
@@ -8,11 +11,23 @@ def _get_headers(api_key=None):
         headers["Authorization"] = f"Bearer {api_key}"
     return headers
 
-def get_models(params=None, api_key=None):
+def _get(path, params=None, api_key=None, headers=None, interactive=None):
+    request_headers = _get_headers(api_key)
+    if headers:
+        request_headers.update(headers)
+    # Page views go ahead of scans, update checks and other background work.
+    # Threads working for a page pass interactive=True, having no request context.
+    if interactive is None:
+        interactive = has_request_context()
+    with timed("api"):
+        return governor.get(f"{BASE_URL}{path}", interactive=interactive, params=params,
+                            headers=request_headers)
+
+def get_models(params=None, api_key=None, interactive=None):
     """
     Fetches models from the Civitai API.
     """
-    response = requests.get(f"{BASE_URL}/models", params=params, headers=_get_headers(api_key))
+    response = _get("/models", params, api_key, interactive=interactive)
     response.raise_for_status()
     return response.json()
 
@@ -20,7 +35,7 @@ def get_model(model_id, api_key=None):
     """
     Fetches a single model from the Civitai API.
     """
-    response = requests.get(f"{BASE_URL}/models/{model_id}", headers=_get_headers(api_key))
+    response = _get(f"/models/{model_id}", api_key=api_key)
     response.raise_for_status()
     return response.json()
 
@@ -28,7 +43,7 @@ def get_creators(params=None, api_key=None):
     """
     Fetches creators from the Civitai API.
     """
-    response = requests.get(f"{BASE_URL}/creators", params=params, headers=_get_headers(api_key))
+    response = _get("/creators", params, api_key)
     response.raise_for_status()
     return response.json()
 
@@ -36,7 +51,7 @@ def get_creator(creator_id, api_key=None):
     """
     Fetches a single creator from the Civitai API.
     """
-    response = requests.get(f"{BASE_URL}/creators/{creator_id}", headers=_get_headers(api_key))
+    response = _get(f"/creators/{creator_id}", api_key=api_key)
     response.raise_for_status()
     return response.json()
 
@@ -59,7 +74,7 @@ def get_user(api_key):
     # NOTE: If this endpoint doesn't exist, this will fail. 
     # Since I cannot verify this without internet, I will add a comment and a fallback.
     try:
-        response = requests.get(f"{BASE_URL}/me", headers=_get_headers(api_key))
+        response = _get("/me", api_key=api_key)
         if response.status_code == 200:
             return response.json()
     except:
@@ -72,7 +87,7 @@ def get_user(api_key):
     
     # Let's try another common one: /v1/account
     try:
-        response = requests.get(f"{BASE_URL}/account", headers=_get_headers(api_key))
+        response = _get("/account", api_key=api_key)
         if response.status_code == 200:
             return response.json()
     except:
@@ -85,7 +100,7 @@ def get_tags(params=None, api_key=None):
     """
     Fetches tags from the Civitai API.
     """
-    response = requests.get(f"{BASE_URL}/tags", params=params, headers=_get_headers(api_key))
+    response = _get("/tags", params, api_key)
     response.raise_for_status()
     return response.json()
 
@@ -93,6 +108,22 @@ def get_model_version_by_hash(file_hash, api_key=None):
     """
     Fetches a model version by its file hash.
     """
-    response = requests.get(f"{BASE_URL}/model-versions/by-hash/{file_hash}", headers=_get_headers(api_key))
+    response = _get(f"/model-versions/by-hash/{file_hash}", api_key=api_key)
     response.raise_for_status()
     return response.json()
+
+def get_model_if_changed(model_id, etag=None, last_modified=None, api_key=None):
+    """
+    Conditionally fetches a single model. Returns ``(model, etag, last_modified)``;
+    ``model`` is None when the API answered 304 Not Modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = _get(f"/models/{model_id}", api_key=api_key, headers=headers)
+    if response.status_code == 304:
+        return None, etag, last_modified
+    response.raise_for_status()
+    return response.json(), response.headers.get("ETag"), response.headers.get("Last-Modified")
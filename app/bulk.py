@@ -0,0 +1,272 @@
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import api, db
+from app.downloader import download_model, local_filename, select_primary_file, target_directory
+from app.models import Download, LocalFile
+
+SOURCES = ('creator', 'query', 'ids')
+VERSION_RULES = ('latest', 'all')
+LISTING_PAGE_SIZE = 100
+FETCH_WORKERS = 4
+# Failed items listed in the status of a batch
+MAX_REPORTED_FAILURES = 20
+
+def parse_model_ids(value):
+    """Model IDs from a comma or whitespace separated list of IDs and civitai.com model URLs."""
+    model_ids = []
+    for token in re.split(r'[\s,]+', value or ''):
+        if not token:
+            continue
+        match = re.fullmatch(r'\d+', token) or re.search(r'/models/(\d+)', token)
+        if not match:
+            raise ValueError(f"Not a model ID or model URL: {token}")
+        model_id = int(match.group(1) if match.groups() else match.group(0))
+        if model_id not in model_ids:
+            model_ids.append(model_id)
+    return model_ids
+
+def _list_models(params, api_key, limit):
+    """Page a model listing by cursor; returns (models, truncated)."""
+    params = dict(params, limit=min(LISTING_PAGE_SIZE, limit))
+    models = []
+    truncated = False
+    while True:
+        response = api.get_models(params, api_key=api_key)
+        models.extend(response.get('items', []))
+        cursor = response.get('metadata', {}).get('nextCursor')
+        if not cursor:
+            break
+        if len(models) >= limit:
+            truncated = True
+            break
+        params['cursor'] = cursor
+    if len(models) > limit:
+        truncated = True
+    return models[:limit], truncated
+
+def _fetch_model(model_id, api_key):
+    """Runs on a pool thread: network only, no database access."""
+    try:
+        return model_id, api.get_model(model_id, api_key=api_key), None
+    except Exception as e:
+        return model_id, None, str(e)
+
+def resolve_models(source, value, api_key=None, model_type=None):
+    """Return (models, truncated, errors) for a creator's username, a search query or a list of model IDs."""
+    limit = current_app.config['BULK_MAX_MODELS']
+    if source == 'ids':
+        model_ids = parse_model_ids(value)
+        truncated = len(model_ids) > limit
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            results = list(pool.map(lambda model_id: _fetch_model(model_id, api_key), model_ids[:limit]))
+        models = [model for _, model, _ in results if model]
+        errors = [{'model_id': model_id, 'error': error} for model_id, _, error in results if error]
+        if model_type:
+            models = [m for m in models if m.get('type') == model_type]
+        return models, truncated, errors
+
+    params = {'username': value} if source == 'creator' else {'query': value}
+    if model_type:
+        params['types'] = model_type
+    models, truncated = _list_models(params, api_key, limit)
+    return models, truncated, []
+
+def select_versions(model, versions='latest', base_model=None):
+    """
+    Versions of ``model`` to download: the newest one (Civitai lists versions
+    newest first) or all of them, optionally only for one base model.
+    """
+    candidates = [v for v in model.get('modelVersions', []) if not base_model or v.get('baseModel') == base_model]
+    return candidates if versions == 'all' else candidates[:1]
+
+def _free_space(directory):
+    """(device, free bytes) of the filesystem ``directory`` is on or will be created on."""
+    path = os.path.abspath(directory)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev, shutil.disk_usage(path).free
+
+def check_space(items):
+    """
+    Free space per target directory for the items still to download.
+    Directories on one filesystem share its free space, so each is judged
+    on the total needed by all of them plus BULK_FREE_SPACE_MARGIN_MB.
+    """
+    margin = current_app.config['BULK_FREE_SPACE_MARGIN_MB'] * 1024 * 1024
+    needed = {}
+    for item in items:
+        if item['status'] == 'download':
+            needed[item['directory']] = needed.get(item['directory'], 0) + item['size']
+
+    directories = []
+    by_device = {}
+    for directory, size in sorted(needed.items()):
+        device, free = _free_space(directory)
+        by_device[device] = by_device.get(device, 0) + size
+        directories.append({'directory': directory, 'needed': size, 'free': free, 'device': device})
+    for entry in directories:
+        entry['device_needed'] = by_device[entry.pop('device')]
+        entry['enough'] = entry['device_needed'] + margin <= entry['free']
+    return directories
+
+def _plan_item(model, version, downloaded, library_versions, library_hashes):
+    item = {
+        'model_id': model['id'],
+        'version_id': version['id'],
+        'name': model.get('name'),
+        'version': version.get('name'),
+        'type': model.get('type'),
+        'base_model': version.get('baseModel'),
+    }
+    primary_file = select_primary_file(version)
+    if not primary_file:
+        item.update(status='unavailable', reason='No files', size=0)
+        return item
+
+    item['directory'] = target_directory(model.get('type'))
+    item['file'] = local_filename(primary_file)
+    item['size'] = int((primary_file.get('sizeKB') or 0) * 1024)
+    sha256 = (primary_file.get('hashes') or {}).get('SHA256', '').lower()
+    path = os.path.join(item['directory'], item['file'])
+
+    if (model['id'], version['id']) in downloaded:
+        item.update(status='present', reason='Downloaded')
+    elif version['id'] in library_versions or (sha256 and sha256 in library_hashes):
+        item.update(status='present', reason='In library')
+    elif os.path.exists(path):
+        # Sizes from the API are rounded to the KB
+        if abs(os.path.getsize(path) - item['size']) < 1024:
+            item.update(status='present', reason='File exists')
+        else:
+            item.update(status='conflict', reason='A different file exists at the target path')
+    else:
+        item.update(status='download', reason=None)
+    return item
+
+def build_plan(source, value, api_key=None, versions='latest', base_model=None, model_type=None):
+    """
+    Resolve a creator, search query or list of model IDs into a download
+    plan: the selected versions with their size, target directory and
+    whether they are already present, plus free space per directory.
+    """
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+    if versions not in VERSION_RULES:
+        raise ValueError(f"versions must be one of {', '.join(VERSION_RULES)}")
+    if not (value or '').strip():
+        raise ValueError("Nothing to plan: enter a creator, search query or model IDs")
+    value = value.strip()
+
+    models, truncated, errors = resolve_models(source, value, api_key, model_type)
+
+    downloaded = set(db.session.query(Download.model_id, Download.version_id))
+    library_versions = {v for (v,) in db.session.query(LocalFile.version_id).filter(LocalFile.version_id.isnot(None))}
+    library_hashes = {h.lower() for (h,) in db.session.query(LocalFile.sha256).filter(LocalFile.sha256.isnot(None))}
+
+    items = []
+    for model in models:
+        for version in select_versions(model, versions, base_model):
+            items.append(_plan_item(model, version, downloaded, library_versions, library_hashes))
+
+    counts = {}
+    sizes = {}
+    for item in items:
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+        sizes[item['status']] = sizes.get(item['status'], 0) + item['size']
+    directories = check_space(items)
+
+    if source == 'creator':
+        label = f"creator {value}"
+    elif source == 'query':
+        label = f'search "{value}"'
+    else:
+        label = f"{len(parse_model_ids(value))} model ID(s)"
+
+    return {
+        'source': source,
+        'value': value,
+        'versions': versions,
+        'base_model': base_model,
+        'type': model_type,
+        'label': label,
+        'models': len(models),
+        'truncated': truncated,
+        'errors': errors,
+        'items': items,
+        'counts': counts,
+        'total_bytes': sum(sizes.values()),
+        'download_bytes': sizes.get('download', 0),
+        'present_bytes': sizes.get('present', 0),
+        'directories': directories,
+        'enough_space': all(d['enough'] for d in directories),
+    }
+
+def submit_plan(plan, api_key):
+    """Queue the items still to download as one batch job; None if there is nothing to download."""
+    from app.download_manager import download_manager
+
+    items = [
+        {k: item[k] for k in ('model_id', 'version_id', 'name', 'size', 'directory')}
+        for item in plan['items'] if item['status'] == 'download'
+    ]
+    if not items:
+        return None
+    return download_manager.add_task(task_type='batch', api_key=api_key, label=plan['label'], items=items,
+                                     total_bytes=sum(item['size'] for item in items))
+
+def run_batch(task, progress_callback, cancel_event=None):
+    """
+    Download the items of a batch job one after another, reporting progress
+    over the bytes of the whole batch. Items downloaded meanwhile are
+    skipped, and an item is not started without room for it on disk.
+    Setting ``cancel_event`` stops the batch before its next item.
+    Returns (success, message); success unless every attempted item failed.
+    """
+    items = task.get('items') or []
+    total_bytes = sum(item['size'] for item in items) or 1
+    margin = current_app.config['BULK_FREE_SPACE_MARGIN_MB'] * 1024 * 1024
+    batch = {'items': len(items), 'downloaded': 0, 'skipped': 0, 'failed': 0,
+             'bytes_done': 0, 'bytes_total': total_bytes}
+    failures = []
+
+    for n, item in enumerate(items, 1):
+        if cancel_event is not None and cancel_event.is_set():
+            return True, (f"Batch {task.get('label') or 'download'} cancelled after {n - 1} of {len(items)} items: "
+                          f"downloaded {batch['downloaded']}, {batch['failed']} failed.")
+        label = f"{n}/{len(items)}: {item['name']}"
+
+        def item_progress(percentage, msg=None, **extra):
+            done = batch['bytes_done'] + item['size'] * percentage / 100
+            progress_callback(min(int(done / total_bytes * 100), 99), f"Downloading {label} ({percentage}%)",
+                              batch=batch)
+
+        if Download.query.filter_by(model_id=item['model_id'], version_id=item['version_id']).first():
+            batch['skipped'] += 1
+        else:
+            _, free = _free_space(item['directory'])
+            if free < item['size'] + margin:
+                success, message = False, "Not enough free space"
+            else:
+                item_progress(0)
+                success, message = download_model(item['model_id'], item['version_id'], task['api_key'],
+                                                  item_progress)
+            if success:
+                batch['downloaded'] += 1
+            else:
+                batch['failed'] += 1
+                if len(failures) < MAX_REPORTED_FAILURES:
+                    failures.append({'model_id': item['model_id'], 'version_id': item['version_id'],
+                                     'name': item['name'], 'error': message})
+        batch['bytes_done'] += item['size']
+        progress_callback(min(int(batch['bytes_done'] / total_bytes * 100), 99), f"Finished {label}",
+                          batch=batch, failures=failures)
+
+    message = (f"Batch {task.get('label') or 'download'} complete: downloaded {batch['downloaded']}, "
+               f"skipped {batch['skipped']} already present, {batch['failed']} failed.")
+    return not batch['failed'] or batch['downloaded'] > 0, message
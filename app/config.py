@@ -8,4 +8,98 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'civitr.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLite runs in WAL mode so pages read while the worker writes; writers
+    # wait up to SQLITE_BUSY_TIMEOUT_MS for the lock instead of failing
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', 'true').lower() in ('1', 'true', 'yes')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_MB = int(os.environ.get('SQLITE_CACHE_MB', 64))
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    # Background writes (job heartbeats, page cursors, refreshed model metadata)
+    # are applied by one thread per process, up to DB_WRITE_BATCH per transaction
+    DB_WRITE_QUEUE = os.environ.get('DB_WRITE_QUEUE', 'true').lower() in ('1', 'true', 'yes')
+    DB_WRITE_BATCH = 200
+    DB_WRITE_BATCH_WAIT = 0.05
+    # Requests slower than this are logged with their API/DB/render breakdown
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+    # Allow ?_profile=1 to return a sampling profile instead of the page
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROFILE_INTERVAL_MS = 5
+    # Hashes the API could not identify are retried after this many hours,
+    # doubling on every failed attempt up to the maximum
+    UNRESOLVED_RETRY_HOURS = float(os.environ.get('UNRESOLVED_RETRY_HOURS', 24))
+    UNRESOLVED_MAX_RETRY_HOURS = float(os.environ.get('UNRESOLVED_MAX_RETRY_HOURS', 24 * 30))
+    # Library scan pipeline: worker threads per stage and queue bound between stages
+    SCAN_HASH_WORKERS = int(os.environ.get('SCAN_HASH_WORKERS', 2))
+    SCAN_LOOKUP_WORKERS = int(os.environ.get('SCAN_LOOKUP_WORKERS', 4))
+    SCAN_FETCH_WORKERS = int(os.environ.get('SCAN_FETCH_WORKERS', 4))
+    SCAN_QUEUE_SIZE = 64
+    # Scan results and checkpoints are committed together this often, so an
+    # interrupted scan resumes with at most this many files to redo
+    SCAN_COMMIT_EVERY = 50
+    # Model downloads: read size per iteration and posix_fallocate of the target file
+    DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+    DOWNLOAD_PREALLOCATE = os.environ.get('DOWNLOAD_PREALLOCATE', 'true').lower() in ('1', 'true', 'yes')
+    # A download whose SHA256 matches a library file is placed from that file
+    # instead: 'hardlink' or 'reflink' (a copy across filesystems) or 'copy'
+    DOWNLOAD_REUSE_LOCAL = os.environ.get('DOWNLOAD_REUSE_LOCAL', 'true').lower() in ('1', 'true', 'yes')
+    DOWNLOAD_LOCAL_COPY_MODE = os.environ.get('DOWNLOAD_LOCAL_COPY_MODE', 'hardlink')
+    # Locally stored model JSON is served immediately and refreshed in the
+    # background once older than this
+    METADATA_REVALIDATE_SECONDS = int(os.environ.get('METADATA_REVALIDATE_SECONDS', 3600))
+    # Background check of library models for new versions; 0 disables the schedule
+    UPDATE_CHECK_INTERVAL_HOURS = float(os.environ.get('UPDATE_CHECK_INTERVAL_HOURS', 24))
+    UPDATE_CHECK_WORKERS = int(os.environ.get('UPDATE_CHECK_WORKERS', 4))
+    # Run the task worker as a thread of the web process. Set to false when
+    # serving with several processes and run `python worker.py` once instead.
+    EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', 'true').lower() in ('1', 'true', 'yes')
+    JOB_POLL_SECONDS = 1.0
+    # Running jobs without a heartbeat for this long belong to a dead worker
+    JOB_STALE_SECONDS = 120
+    JOB_HISTORY_DAYS = 7
+    # Rendered /, /models and /search pages are cached this many seconds (0 disables)
+    # and stored gzip (and brotli, if installed) compressed
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 60))
+    PAGE_CACHE_MAX_ENTRIES = 256
+    PAGE_CACHE_MIN_COMPRESS_BYTES = 1024
+    # Concurrency of Civitai API calls adapts between these bounds: it grows
+    # while requests succeed and halves on 429/503. Page requests wait at
+    # most UPSTREAM_INTERACTIVE_WAIT seconds; background calls retry throttling.
+    UPSTREAM_INITIAL_CONCURRENCY = int(os.environ.get('UPSTREAM_INITIAL_CONCURRENCY', 4))
+    UPSTREAM_MIN_CONCURRENCY = 1
+    UPSTREAM_MAX_CONCURRENCY = int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', 16))
+    UPSTREAM_INTERACTIVE_WAIT = float(os.environ.get('UPSTREAM_INTERACTIVE_WAIT', 5))
+    UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 3))
+    # Seconds to connect to / wait for data from the API before giving up the slot
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 10))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 60))
+    # Tags and creators for search suggestions are re-paged from the API this often
+    TYPEAHEAD_REFRESH_HOURS = float(os.environ.get('TYPEAHEAD_REFRESH_HOURS', 24))
+    # Cursors of listing pages are reused for this long
+    PAGE_CURSOR_TTL = int(os.environ.get('PAGE_CURSOR_TTL', 3600))
+    # Bulk downloads: models resolved per plan, and space kept free on each
+    # target filesystem after the planned files
+    BULK_MAX_MODELS = int(os.environ.get('BULK_MAX_MODELS', 500))
+    BULK_FREE_SPACE_MARGIN_MB = int(os.environ.get('BULK_FREE_SPACE_MARGIN_MB', 1024))
+    # Creator pages count every model of the creator: listing pages are fetched
+    # CREATOR_STATS_WORKERS at a time, at most CREATOR_STATS_MAX_PAGES of them,
+    # and the totals are kept for CREATOR_STATS_TTL seconds
+    CREATOR_STATS_TTL = int(os.environ.get('CREATOR_STATS_TTL', 6 * 3600))
+    CREATOR_STATS_WORKERS = int(os.environ.get('CREATOR_STATS_WORKERS', 4))
+    CREATOR_STATS_MAX_PAGES = int(os.environ.get('CREATOR_STATS_MAX_PAGES', 50))
+    # Remote preview images are served through /img from a local LRU cache
+    # of at most IMAGE_CACHE_MAX_MB; only these hosts (and subdomains) are fetched
+    IMAGE_PROXY_ENABLED = os.environ.get('IMAGE_PROXY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    IMAGE_PROXY_HOSTS = os.environ.get('IMAGE_PROXY_HOSTS', 'image.civitai.com')
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_cache')
+    IMAGE_CACHE_MAX_MB = int(os.environ.get('IMAGE_CACHE_MAX_MB', 1024))
+    IMAGE_PROXY_MAX_BYTES = 50 * 1024 * 1024
+    # Civitai image URLs never change content, so browsers may keep them for a year
+    IMAGE_PROXY_MAX_AGE = 365 * 24 * 3600
+    # Image CDNs that serve /width=N/ variants; pages request the width each
+    # slot needs and downloads save a PREVIEW_IMAGE_WIDTH preview
+    IMAGE_RESIZE_HOSTS = os.environ.get('IMAGE_RESIZE_HOSTS', 'image.civitai.com')
+    PREVIEW_IMAGE_WIDTH = int(os.environ.get('PREVIEW_IMAGE_WIDTH', 450))
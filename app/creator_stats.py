@@ -0,0 +1,173 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, has_request_context
+from app import api, db
+from app.database import writer
+from app.instrumentation import timed
+from app.models import CreatorStats
+
+# The largest page the Civitai API serves
+PAGE_SIZE = 100
+
+class _Aggregation:
+    """An aggregation in progress that concurrent requests for the same creator wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+_inflight = {}
+_lock = threading.Lock()
+
+def listing_params(username):
+    """Parameters of page 1 of a creator's models; pass that page to get_stats() to reuse it."""
+    return {'username': username, 'limit': PAGE_SIZE}
+
+def _account(api_key):
+    """Results can depend on the account (e.g. its NSFW preferences), so stats are kept per account."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16] if api_key else ''
+
+def _fetch_page(username, page, api_key, interactive):
+    """
+    Runs on a pool thread: network only, no database access. Without a
+    request context of its own, it passes on whether a page view waits on it.
+    """
+    try:
+        response = api.get_models(dict(listing_params(username), page=page), api_key=api_key, interactive=interactive)
+        return page, response, None
+    except Exception as e:
+        return page, None, str(e)
+
+def _fetch_all(username, api_key, first_page):
+    """
+    Every listing page of a creator: the rest in parallel when the first
+    one gives the page count, else by following cursors. Returns
+    (models, pages fetched, truncated, errors).
+    """
+    config = current_app.config
+    max_pages = config['CREATOR_STATS_MAX_PAGES']
+    if first_page is None:
+        first_page = api.get_models(listing_params(username), api_key=api_key)
+    models = list(first_page.get('items', []))
+    metadata = first_page.get('metadata', {})
+    errors = []
+
+    total_pages = metadata.get('totalPages')
+    if total_pages:
+        pages = range(2, min(total_pages, max_pages) + 1)
+        interactive = has_request_context()
+        # The pool threads cannot record into this request's Server-Timing; time them from here
+        with timed("api"), ThreadPoolExecutor(max_workers=config['CREATOR_STATS_WORKERS']) as pool:
+            results = list(pool.map(lambda page: _fetch_page(username, page, api_key, interactive), pages))
+        for page, response, error in results:
+            if error:
+                errors.append({'page': page, 'error': error})
+            else:
+                models.extend(response.get('items', []))
+        return models, 1 + len(pages), total_pages > max_pages, errors
+
+    # Cursor-only listings can only be walked one page after another
+    fetched = 1
+    cursor = metadata.get('nextCursor')
+    while cursor and fetched < max_pages:
+        try:
+            response = api.get_models(dict(listing_params(username), cursor=cursor), api_key=api_key)
+        except Exception as e:
+            errors.append({'page': fetched + 1, 'error': str(e)})
+            break
+        models.extend(response.get('items', []))
+        cursor = response.get('metadata', {}).get('nextCursor')
+        fetched += 1
+    return models, fetched, bool(cursor) and not errors, errors
+
+def aggregate(models):
+    """Totals over ``models``, each counted once, with model counts per type and per base model."""
+    unique = {}
+    for model in models:
+        unique.setdefault(model.get('id'), model)
+
+    types = {}
+    base_models = {}
+    download_count = 0
+    thumbs_up_count = 0
+    version_count = 0
+    for model in unique.values():
+        stats = model.get('stats') or {}
+        download_count += stats.get('downloadCount') or 0
+        thumbs_up_count += stats.get('thumbsUpCount') or 0
+        versions = model.get('modelVersions') or []
+        version_count += len(versions)
+        model_type = model.get('type') or 'Other'
+        types[model_type] = types.get(model_type, 0) + 1
+        for base_model in {v.get('baseModel') for v in versions if v.get('baseModel')}:
+            base_models[base_model] = base_models.get(base_model, 0) + 1
+
+    def ranked(counts):
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    return {
+        'model_count': len(unique),
+        'version_count': version_count,
+        'download_count': download_count,
+        'thumbs_up_count': thumbs_up_count,
+        'types': ranked(types),
+        'base_models': ranked(base_models),
+    }
+
+def _store(username, account, stats):
+    entry = CreatorStats.query.get((username, account))
+    if entry is None:
+        entry = CreatorStats(username=username, account=account)
+        db.session.add(entry)
+    entry.set_data(stats)
+    entry.fetched_at = datetime.utcnow()
+
+def _compute(username, api_key, first_page):
+    models, pages, truncated, errors = _fetch_all(username, api_key, first_page)
+    stats = aggregate(models)
+    stats.update(pages=pages, truncated=truncated, errors=errors, fetched_at=datetime.utcnow().isoformat())
+    if not errors:
+        # Partial totals are shown but not kept
+        writer.submit(_store, username, _account(api_key), stats)
+    return stats
+
+def get_stats(username, api_key=None, first_page=None):
+    """
+    Statistics over all models of ``username``: counts, downloads and model
+    counts per type and base model, as seen by the account of ``api_key``.
+    Served from the database while younger than CREATOR_STATS_TTL;
+    otherwise aggregated from every listing page, with concurrent requests
+    for one creator and account sharing a single aggregation.
+    ``first_page`` is a response for listing_params(username), if the caller has one.
+    """
+    key = (username, _account(api_key))
+    entry = CreatorStats.query.get(key)
+    max_age = timedelta(seconds=current_app.config['CREATOR_STATS_TTL'])
+    if entry and entry.fetched_at and entry.fetched_at >= datetime.utcnow() - max_age:
+        return entry.get_data()
+
+    with _lock:
+        aggregation = _inflight.get(key)
+        leader = aggregation is None
+        if leader:
+            aggregation = _inflight[key] = _Aggregation()
+
+    if not leader:
+        aggregation.done.wait()
+        if aggregation.error:
+            raise aggregation.error
+        return aggregation.result
+
+    try:
+        aggregation.result = _compute(username, api_key, first_page)
+        return aggregation.result
+    except Exception as e:
+        aggregation.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        aggregation.done.set()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import math
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from flask import current_app, request, url_for
+from app import api, db
+from app.database import writer
+from app.models import PageCursor
+
+# Pages walked from the nearest known cursor before falling back to an offset
+MAX_CURSOR_WALK = 5
+# Search listings have no offset to fall back to; pages further than this
+# past the nearest known cursor are refused instead of walked to
+MAX_SEARCH_WALK = 20
+
+
+class PageOutOfReach(ValueError):
+    """A search page too far past the pages visited so far to be walked to."""
+
+def listing_key(params):
+    """Stable hash of a listing's filters, without its position."""
+    filters = {k: v for k, v in params.items() if k not in ('page', 'cursor') and v not in (None, '')}
+    return hashlib.sha256(json.dumps(filters, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _remember(listing, cursors):
+    """Store (page, cursor) pairs of a listing; runs on the database writer."""
+    for page, cursor in cursors:
+        entry = PageCursor.query.filter_by(listing=listing, page=page).first()
+        if entry is None:
+            entry = PageCursor(listing=listing, page=page)
+            db.session.add(entry)
+        entry.cursor = cursor
+        entry.created_at = datetime.utcnow()
+
+def get_models_page(params, page, api_key=None):
+    """
+    Fetch ``page`` of a model listing. Cursors returned upstream are stored
+    per (filters, page), so the next page is requested by cursor rather than
+    a growing offset. Pages close past the nearest known cursor are walked to;
+    others are requested by ``page``. Search listings only support cursors:
+    they are walked from page 1 if need be, and a page more than
+    MAX_SEARCH_WALK pages past the nearest known cursor raises PageOutOfReach
+    without any upstream request.
+    """
+    listing = listing_key(params)
+    start, cursor = 1, None
+    if page > 1:
+        cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['PAGE_CURSOR_TTL'])
+        known = PageCursor.query.filter(
+            PageCursor.listing == listing, PageCursor.page <= page, PageCursor.created_at >= cutoff
+        ).order_by(PageCursor.page.desc()).first()
+        if known:
+            start, cursor = known.page, known.cursor
+        if not params.get('query'):
+            if not known or page - start > MAX_CURSOR_WALK:
+                start, cursor = page, None
+        elif page - start > MAX_SEARCH_WALK:
+            # One sequential upstream call per page in between
+            raise PageOutOfReach(
+                f"Page {page} is too far ahead; search results can only be paged through "
+                f"{MAX_SEARCH_WALK} pages past page {start}."
+            )
+
+    current = start
+    found = []
+    while True:
+        request_params = dict(params)
+        if cursor:
+            request_params['cursor'] = cursor
+        elif current > 1:
+            request_params['page'] = current
+        response = api.get_models(request_params, api_key=api_key)
+        next_cursor = response.get('metadata', {}).get('nextCursor')
+        if next_cursor:
+            found.append((current + 1, str(next_cursor)))
+        if current == page or not next_cursor:
+            break
+        cursor = next_cursor
+        current += 1
+    if found:
+        # Page requests never wait for the write lock
+        writer.submit(_remember, listing, found)
+
+    if current < page:
+        # Past the end of the listing
+        return {'items': [], 'metadata': {}}
+    return response
+
+class CursorPagination:
+    """
+    Page navigation that works with or without a total: when the upstream
+    total is unknown, "next" is offered while there is a next cursor.
+    """
+
+    def __init__(self, page, per_page, response):
+        metadata = response.get('metadata', {})
+        self.page = page
+        self.per_page = per_page
+        self.total = metadata.get('totalItems')
+        self.pages = math.ceil(self.total / per_page) if self.total else None
+        if self.pages:
+            self.has_next = page < self.pages
+        else:
+            self.has_next = bool(metadata.get('nextCursor') or metadata.get('nextPage'))
+        self.has_prev = page > 1
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if self.has_next else None
+
+    def iter_pages(self, left_edge=1, right_edge=1, left_current=2, right_current=2):
+        """Page numbers to link, with None for gaps; without a total it ends at the next page."""
+        last = self.pages or (self.next_num or self.page)
+        previous = 0
+        for num in range(1, last + 1):
+            if num <= left_edge or self.page - left_current <= num <= self.page + right_current \
+                    or (self.pages and num > last - right_edge):
+                if num != previous + 1:
+                    yield None
+                yield num
+                previous = num
+
+    def url(self, page):
+        args = request.args.copy()
+        args.setlist('page', [page])
+        return f"{url_for(request.endpoint, **(request.view_args or {}))}?{urlencode(list(args.items(multi=True)))}"
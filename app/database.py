@@ -0,0 +1,166 @@
+import queue
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from app import db
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def _engine_options(config):
+    """Pool sizes for a file-backed database, so request threads do not queue for a connection."""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory databases use a single shared connection
+        return options
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    return options
+
+def _pragmas(config):
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_MODES)}")
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA synchronous = {synchronous}",
+        f"PRAGMA cache_size = {-int(config['SQLITE_CACHE_MB']) * 1024}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if config['SQLITE_WAL']:
+                try:
+                    # Persistent in the database file; later connections find it set
+                    cursor.execute("PRAGMA journal_mode = WAL")
+                except Exception as e:
+                    print(f"Could not switch the database to WAL mode: {e}")
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    return set_pragmas
+
+def init_app(app):
+    """
+    Set up the database for concurrent use: WAL mode, so pages read while
+    the worker writes, a busy timeout instead of "database is locked"
+    errors, and connection pool sizes for the threads of a web process.
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _pragmas(app.config))
+
+class WriteQueue:
+    """
+    Background writes of this process, applied by a single thread. Queued
+    writes are run in batches of up to DB_WRITE_BATCH, each batch in one
+    transaction, so a burst of small writes (job heartbeats, page cursors,
+    refreshed metadata) takes the SQLite write lock once instead of once
+    per write, and the request or task queuing them never waits for it.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failures = 0
+
+    def submit(self, write, *args):
+        """
+        Run ``write(*args)`` later on the writer thread, in an app context of
+        the current app, and commit it. With DB_WRITE_QUEUE off it runs now.
+        """
+        app = current_app._get_current_object()
+        if not app.config['DB_WRITE_QUEUE']:
+            write(*args)
+            db.session.commit()
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((app, write, args))
+
+    def flush(self):
+        """Wait until every write queued so far is applied."""
+        self._queue.join()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        config = batch[0][0].config
+        # Linger briefly so writes arriving together share a transaction
+        deadline = time.monotonic() + config['DB_WRITE_BATCH_WAIT']
+        while len(batch) < config['DB_WRITE_BATCH']:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                groups = {}
+                for app, write, args in batch:
+                    groups.setdefault(app, []).append((write, args))
+                for app, writes in groups.items():
+                    self._apply(app, writes)
+            except Exception as e:
+                print(f"Database writer error: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _apply(self, app, writes):
+        with app.app_context():
+            try:
+                for write, args in writes:
+                    write(*args)
+                db.session.commit()
+                self.batches += 1
+                self.writes += len(writes)
+                return
+            except Exception:
+                db.session.rollback()
+            # One failing write must not lose the rest of its batch
+            for write, args in writes:
+                try:
+                    write(*args)
+                    db.session.commit()
+                    self.writes += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self.failures += 1
+                    print(f"Background write {getattr(write, '__name__', write)} failed: {e}")
+            self.batches += 1
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'writes': self.writes,
+            'failures': self.failures,
+        }
+
+writer = WriteQueue()
+
+def status():
+    """Effective SQLite settings, pool usage and background writer counters."""
+    engine = db.engine
+    result = {'dialect': engine.dialect.name, 'pool': engine.pool.status(), 'writer': writer.stats()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for pragma in ('journal_mode', 'busy_timeout', 'synchronous', 'cache_size'):
+                result[pragma] = conn.exec_driver_sql(f"PRAGMA {pragma}").scalar()
+    return result
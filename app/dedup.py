@@ -0,0 +1,202 @@
+import errno
+import os
+import shutil
+from collections import defaultdict
+from app import db
+from app.models import HASH_FROM_CONTENT, LocalFile
+from app.scanner import calculate_sha256
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl sharing the extents of one file with another (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+LINK_MODES = ('hardlink', 'reflink')
+COPY_MODES = LINK_MODES + ('copy',)
+
+def find_duplicates():
+    """
+    Group library files with identical content: same size, fingerprint and
+    stored SHA256. Only hashes computed from the files' own bytes count,
+    never ones taken over from an identification or an imported index, and
+    only files unchanged since they were hashed, so no file is read.
+
+    Each group lists its files with device and inode; ``reclaimable`` is the
+    space freed by linking every copy on the same filesystem to one inode.
+    Reflinked copies have separate inodes and are still reported.
+    """
+    verified = db.and_(LocalFile.sha256.isnot(None), LocalFile.sha256_source == HASH_FROM_CONTENT,
+                       LocalFile.fingerprint.isnot(None))
+    keys = set(
+        db.session.query(LocalFile.size, LocalFile.sha256, LocalFile.fingerprint)
+        .filter(verified)
+        .group_by(LocalFile.size, LocalFile.sha256, LocalFile.fingerprint)
+        .having(db.func.count(LocalFile.id) > 1)
+    )
+    if not keys:
+        return []
+
+    files_by_key = defaultdict(list)
+    query = LocalFile.query.filter(verified, LocalFile.sha256.in_({sha256 for _, sha256, _ in keys})) \
+        .order_by(LocalFile.path)
+    for local_file in query:
+        key = (local_file.size, local_file.sha256, local_file.fingerprint)
+        if key not in keys:
+            continue
+        try:
+            stat = os.stat(local_file.path)
+        except OSError:
+            continue
+        if stat.st_size != local_file.size or stat.st_mtime != local_file.mtime:
+            # Changed since it was hashed; the next scan rehashes it
+            continue
+        files_by_key[key].append({
+            'path': local_file.path,
+            'device': stat.st_dev,
+            'inode': stat.st_ino,
+            'links': stat.st_nlink,
+            'mtime': stat.st_mtime,
+        })
+
+    groups = []
+    for (size, sha256, _), files in files_by_key.items():
+        if len(files) < 2:
+            continue
+        inodes = defaultdict(set)
+        for f in files:
+            inodes[f['device']].add(f['inode'])
+        groups.append({
+            'sha256': sha256,
+            'size': size,
+            'files': files,
+            'copies': sum(len(i) for i in inodes.values()),
+            'reclaimable': sum(len(i) - 1 for i in inodes.values()) * size,
+        })
+    groups.sort(key=lambda g: g['reclaimable'], reverse=True)
+    return groups
+
+def summarize(groups):
+    return {
+        'groups': len(groups),
+        'files': sum(len(g['files']) for g in groups),
+        'reclaimable': sum(g['reclaimable'] for g in groups),
+    }
+
+def _reflink(source, target):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def _link(source, target, mode):
+    """Atomically replace ``target`` by a hardlink or reflink of ``source``."""
+    tmp = f"{target}.dedup-tmp"
+    try:
+        if mode == 'reflink':
+            _reflink(source, tmp)
+        else:
+            os.link(source, tmp)
+        os.replace(tmp, target)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+def place_copy(source, target, mode='hardlink'):
+    """
+    Put the content of ``source`` at ``target`` as a hardlink, reflink or
+    plain copy. A link that is not possible (another filesystem, no reflink
+    support) falls back to a copy. Returns the mode used.
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"Unknown copy mode {mode}")
+    if mode in LINK_MODES:
+        try:
+            _link(source, target, mode)
+            return mode
+        except OSError as e:
+            print(f"Could not {mode} {source} to {target}, copying instead: {e}")
+    tmp = f"{target}.copy-tmp"
+    try:
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+    return 'copy'
+
+def _still_matches(f, sha256):
+    """Whether the file ``f`` of a duplicate group is unchanged and still has content ``sha256``; reads it."""
+    stat = os.stat(f['path'])
+    if stat.st_ino != f['inode'] or stat.st_mtime != f['mtime']:
+        return False
+    return calculate_sha256(f['path']) == sha256
+
+def consolidate(mode='hardlink', progress_callback=None):
+    """
+    Replace duplicate copies with links to one file per filesystem. Both
+    files are rehashed just before each link, so a stale stored hash can
+    never replace a file by different content. Returns a status message.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"Unknown link mode {mode}")
+
+    groups = [g for g in find_duplicates() if g['reclaimable']]
+    paths = [f['path'] for g in groups for f in g['files']]
+    rows = {local_file.path: local_file for local_file in LocalFile.query.filter(LocalFile.path.in_(paths))} \
+        if paths else {}
+
+    linked = failed = changed = reclaimed = 0
+    for i, group in enumerate(groups):
+        by_device = defaultdict(list)
+        for f in group['files']:
+            by_device[f['device']].append(f)
+        for files in by_device.values():
+            # Keep the copy that already has the most links, then the oldest
+            keep = max(files, key=lambda f: (f['links'], -f['mtime']))
+            others = [f for f in files if f['inode'] != keep['inode']]
+            try:
+                keep_matches = bool(others) and _still_matches(keep, group['sha256'])
+            except OSError as e:
+                print(f"Could not read {keep['path']}: {e}")
+                keep_matches = False
+            if others and not keep_matches:
+                # The next scan rehashes it
+                changed += 1
+                continue
+            replaced = set()
+            checked = {} # inode -> still matches, for copies already linked to each other
+            for f in others:
+                try:
+                    if f['inode'] not in checked:
+                        checked[f['inode']] = _still_matches(f, group['sha256'])
+                    if not checked[f['inode']]:
+                        changed += 1
+                        continue
+                    _link(keep['path'], f['path'], mode)
+                except OSError as e:
+                    print(f"Could not {mode} {f['path']} to {keep['path']}: {e}")
+                    failed += 1
+                    continue
+                linked += 1
+                if f['links'] == 1 and f['inode'] not in replaced:
+                    reclaimed += group['size']
+                replaced.add(f['inode'])
+
+                # Keep the stored hash valid for the relinked file
+                stat = os.stat(f['path'])
+                local_file = rows.get(f['path'])
+                if local_file:
+                    local_file.size = stat.st_size
+                    local_file.mtime = stat.st_mtime
+        if progress_callback:
+            progress_callback(int((i + 1) / len(groups) * 100), f"Consolidated {i + 1}/{len(groups)} duplicate groups")
+    db.session.commit()
+
+    message = f"Deduplication complete. Replaced {linked} file(s) with {mode}s, freeing {reclaimed / 1024 ** 3:.2f} GB."
+    if failed:
+        message += f" {failed} file(s) could not be linked."
+    if changed:
+        message += f" {changed} file(s) no longer matched their stored hash and were skipped."
+    return message
@@ -1,153 +1,326 @@
+import json
+import os
+import socket
 import threading
 import time
-import queue
+import traceback
+from datetime import datetime, timedelta
 from app.downloader import download_model
 from app import db
+from app.database import writer
+from app.models import Job, Setting
 from flask import current_app
 
+# Columns of Job; any other add_task() keyword is stored in Job.params
+JOB_FIELDS = {'model_id', 'version_id', 'api_key'}
+HEARTBEAT_SECONDS = 1.0
+# Task types that stop early when cancelled while running; any queued job can be cancelled
+CANCELLABLE_TYPES = {'scan', 'batch'}
+# A running job becomes 'cancelling' until its worker notices
+ACTIVE_STATUSES = ('running', 'cancelling')
+# The key scheduled tasks run with, shared by the web processes and a standalone worker
+SCHEDULER_KEY_SETTING = 'scheduler_api_key'
+
+def scheduler_api_key():
+    """The API key of the last login or queued task, for tasks nobody queued (update checks, refreshes)."""
+    setting = Setting.query.get(SCHEDULER_KEY_SETTING)
+    return setting.value if setting and setting.value else None
+
+def set_scheduler_api_key(api_key):
+    """Remember ``api_key`` for scheduled tasks, or forget it with None; the caller commits."""
+    setting = Setting.query.get(SCHEDULER_KEY_SETTING)
+    if setting is None:
+        if not api_key:
+            return
+        setting = Setting(key=SCHEDULER_KEY_SETTING)
+        db.session.add(setting)
+    if setting.value != api_key:
+        setting.value = api_key
+
+def _publish_progress(job_id, values):
+    # Never touch a job that finished since this beat was queued
+    Job.query.filter(Job.id == job_id, Job.status.in_(ACTIVE_STATUSES)).update(values, synchronize_session=False)
+
 class DownloadManager:
+    """
+    Queue of background tasks stored in the Job table.
+
+    Any process can enqueue and read status; jobs are executed by exactly one
+    worker, either a thread of the web process (EMBEDDED_WORKER) or the
+    standalone ``worker.py``.
+    """
     _instance = None
 
     def __new__(cls, app=None):
         if cls._instance is None:
             cls._instance = super(DownloadManager, cls).__new__(cls)
-            cls._instance.queue = queue.Queue()
             cls._instance.current_task = None
-            cls._instance.history = []
             cls._instance.app = app
             cls._instance.running = False
+            cls._instance._wake = threading.Event()
+            cls._instance._cancel = threading.Event() # set to stop the current task
+            cls._instance._lock = threading.Lock()
         return cls._instance
 
     def init_app(self, app):
         self.app = app
-        self.start()
+        if app.config['EMBEDDED_WORKER']:
+            self.start()
 
     def start(self):
-        if not self.running:
+        """Run the worker on a background thread of this process."""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+        thread = threading.Thread(target=self._worker, daemon=True)
+        thread.start()
+
+    def run(self):
+        """Run the worker on the calling thread (standalone worker process)."""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A worker is already running in this process")
             self.running = True
-            thread = threading.Thread(target=self._worker, daemon=True)
-            thread.start()
+        self._worker()
 
     def add_task(self, model_id=None, version_id=None, api_key=None, task_type='download', **kwargs):
-        task = {
-            'type': task_type,
-            'model_id': model_id,
-            'version_id': version_id,
-            'api_key': api_key,
-            'status': 'queued',
-            'progress': 0,
-            'message': 'Queued',
-            **kwargs
-        }
-        self.queue.put(task)
-        return task
+        """
+        Queue a task. The API key is stored with the job only until it
+        finishes, since the worker may be another process.
+        """
+        if api_key:
+            set_scheduler_api_key(api_key)
+        job = Job(
+            type=task_type,
+            model_id=model_id,
+            version_id=version_id,
+            api_key=api_key,
+            params=json.dumps(kwargs) if kwargs else None,
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._wake.set()
+        return job.to_dict()
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job, or ask the worker running a scan or batch to stop.
+        Returns the job's new status, or None if it cannot be cancelled.
+        """
+        if Job.query.filter_by(id=job_id, status='queued').update({
+            'status': 'cancelled',
+            'message': 'Cancelled',
+            'finished_at': datetime.utcnow(),
+            'api_key': None,
+        }, synchronize_session=False):
+            db.session.commit()
+            return 'cancelled'
+        # The worker may be another process: it picks this up on its next heartbeat
+        if Job.query.filter(Job.id == job_id, Job.status == 'running', Job.type.in_(CANCELLABLE_TYPES)).update({
+            'status': 'cancelling',
+            'message': 'Cancelling...',
+        }, synchronize_session=False):
+            db.session.commit()
+            if self.current_task and self.current_task['id'] == job_id:
+                self._cancel.set()
+            return 'cancelling'
+        return None
 
     def get_status(self):
+        current = Job.query.filter(Job.status.in_(ACTIVE_STATUSES)).order_by(Job.started_at).first()
+        recent = Job.query.filter(Job.finished_at.isnot(None)).order_by(Job.finished_at.desc()).limit(5).all()
+        if current:
+            current = current.to_dict()
+            current['cancellable'] = current['type'] in CANCELLABLE_TYPES
         status = {
-            'current_task': self.current_task,
-            'queue_length': self.queue.qsize(),
-            'recent_history': self.history[-5:] if self.history else []
+            'current_task': current,
+            'queue_length': Job.query.filter_by(status='queued').count(),
+            'recent_history': [job.to_dict() for job in reversed(recent)]
         }
         return status
 
+    def _claim_next(self):
+        """Atomically move the oldest queued job to running; None if the queue is empty."""
+        while True:
+            job = Job.query.filter_by(status='queued').order_by(Job.id).first()
+            if job is None:
+                return None
+            now = datetime.utcnow()
+            claimed = Job.query.filter_by(id=job.id, status='queued').update({
+                'status': 'running',
+                'message': 'Starting...',
+                'started_at': now,
+                'heartbeat': now,
+                'worker': f"{socket.gethostname()}:{os.getpid()}",
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                db.session.refresh(job)
+                return job
+
+    def _housekeeping(self):
+        """Fail jobs orphaned by a dead worker, forget old history and keys of finished jobs."""
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=current_app.config['JOB_STALE_SECONDS'])
+        orphaned = Job.query.filter(Job.status.in_(ACTIVE_STATUSES), Job.heartbeat < stale).all()
+        for job in orphaned:
+            job.status = 'failed'
+            job.message = 'Worker stopped before the task finished'
+            job.finished_at = now
+            if job.type == 'scan':
+                # Picks up the scan session's checkpoints
+                db.session.add(Job(type='scan', api_key=job.api_key))
+            job.api_key = None
+        if orphaned:
+            print(f"Marked {len(orphaned)} orphaned job(s) as failed")
+        cutoff = now - timedelta(days=current_app.config['JOB_HISTORY_DAYS'])
+        Job.query.filter(Job.finished_at < cutoff).delete(synchronize_session=False)
+        # Rows finished before keys were cleared on completion
+        Job.query.filter(Job.finished_at.isnot(None), Job.api_key.isnot(None)).update(
+            {'api_key': None}, synchronize_session=False)
+        db.session.commit()
+
+    def _heartbeat(self):
+        """Publish the progress of the current task through the database writer; runs on its own thread."""
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            task = self.current_task
+            if not task:
+                continue
+            try:
+                with self.app.app_context():
+                    values = {
+                        'extra': json.dumps(task['extra']) if task['extra'] else None,
+                        'heartbeat': datetime.utcnow(),
+                    }
+                    if not self._cancel.is_set():
+                        values.update(progress=task['progress'], message=str(task['message'])[:512])
+                    writer.submit(_publish_progress, task['id'], values)
+                    status = db.session.query(Job.status).filter_by(id=task['id']).scalar()
+                if status == 'cancelling' and self.current_task is task:
+                    self._cancel.set()
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
     def _worker(self):
         print("DownloadManager worker started")
+        from app import typeahead, update_checker
+        update_checker.start_scheduler(self.app)
+        typeahead.start_scheduler(self.app)
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        last_housekeeping = 0
         while True:
             try:
-                task = self.queue.get()
-                print(f"Worker picked up task: {task.get('type', 'download')} - {task.get('model_id')}")
-                self.current_task = task
-                task['status'] = 'running'
-                task['message'] = 'Starting...'
-                
-                def progress_callback(percentage, msg=None):
-                    task['progress'] = percentage
-                    if msg:
-                        task['message'] = msg
-                    else:
-                        task['message'] = f"Processing... {percentage}%"
-
-                # Use app context for DB access
                 with self.app.app_context():
-                    print("Worker entering app context")
-                    if task.get('type') == 'scan':
-                        from app.scanner import scan_directory
-                        # Scan all configured directories? Or specific one?
-                        # Implementation plan said iterate over all.
-                        # Let's assume the task contains the list of directories or we fetch them here.
-                        # Better to fetch here to be fresh.
-                        from app.models import Setting
-                        from app.routes import MODEL_TYPES
-                        
-                        total_updated = 0
-                        directories = []
-                        for m_type in MODEL_TYPES:
-                            setting = Setting.query.get(f"dir_{m_type}")
-                            if setting and setting.value:
-                                directories.append((setting.value, m_type))
-                        
-                        # Fallback default dirs
-                        # Actually, if not set, we might not want to scan random places.
-                        # But we have defaults in downloader.
-                        # Let's stick to configured ones for now, or defaults if we use them.
-                        
-                        if not directories:
-                             # Maybe add defaults?
-                             pass
-
-                        count = 0
-                        total_dirs = len(directories)
-                        all_found_ids = set()
-                        
-                        for i, (directory, m_type) in enumerate(directories):
-                            task['message'] = f"Scanning {m_type} directory..."
-                            updated, msg, found_ids = scan_directory(directory, m_type, task['api_key'], progress_callback)
-                            total_updated += updated
-                            all_found_ids.update(found_ids)
-                        
-                        # Cleanup missing models
-                        from app.models import Download
-                        all_downloads = Download.query.all()
-                        removed_count = 0
-                        for download in all_downloads:
-                            if (download.model_id, download.version_id) not in all_found_ids:
-                                db.session.delete(download)
-                                removed_count += 1
-                        
-                        if removed_count > 0:
-                            db.session.commit()
-                        
-                        success = True
-                        message = f"Scan complete. Updated {total_updated} models. Removed {removed_count} missing models."
-                        
+                    if time.time() - last_housekeeping > current_app.config['JOB_STALE_SECONDS']:
+                        self._housekeeping()
+                        last_housekeeping = time.time()
+                    job = self._claim_next()
+                    if job is None:
+                        poll = current_app.config['JOB_POLL_SECONDS']
                     else:
-                        # Normal download
-                        success, message = download_model(
-                            task['model_id'], 
-                            task['version_id'], 
-                            task['api_key'], 
-                            progress_callback
-                        )
-                    
-                    print(f"Task finished: {success} - {message}")
-                
-                task['status'] = 'completed' if success else 'failed'
-                task['message'] = message
-                task['progress'] = 100 if success else 0
-                
-                self.history.append(task)
-                self.current_task = None
-                self.queue.task_done()
-                
+                        task = {
+                            'id': job.id,
+                            'type': job.type,
+                            'model_id': job.model_id,
+                            'version_id': job.version_id,
+                            'api_key': job.api_key,
+                            **job.get_params(),
+                            'progress': 0,
+                            'message': 'Starting...',
+                            'extra': {},
+                        }
+                if job is None:
+                    self._wake.wait(poll)
+                    self._wake.clear()
+                    continue
+                self._run_task(task)
             except Exception as e:
                 print(f"Worker error: {e}")
-                import traceback
                 traceback.print_exc()
-                if self.current_task:
-                    self.current_task['status'] = 'failed'
-                    self.current_task['message'] = str(e)
-                    self.history.append(self.current_task)
-                    self.current_task = None
+                time.sleep(1)
+
+    def _run_task(self, task):
+        print(f"Worker picked up task: {task.get('type', 'download')} - {task.get('model_id')}")
+        self._cancel.clear()
+        self.current_task = task
+
+        def progress_callback(percentage, msg=None, **extra):
+            task['progress'] = percentage
+            if msg:
+                task['message'] = msg
+            else:
+                task['message'] = f"Processing... {percentage}%"
+            # e.g. per-stage throughput and backlog of a scan
+            task['extra'].update(extra)
+
+        try:
+            # Use app context for DB access
+            with self.app.app_context():
+                print("Worker entering app context")
+                success, message = self._execute(task, progress_callback)
+                print(f"Task finished: {success} - {message}")
+                if success and task['type'] in ('download', 'scan', 'batch'):
+                    # Cached pages carry the old "Downloaded" badges
+                    from app import page_cache
+                    page_cache.invalidate()
+        except Exception as e:
+            print(f"Worker error: {e}")
+            traceback.print_exc()
+            success, message = False, str(e)
+        finally:
+            self.current_task = None
+
+        if self._cancel.is_set() and task['type'] in CANCELLABLE_TYPES:
+            status = 'cancelled'
+        else:
+            status = 'completed' if success else 'failed'
+        with self.app.app_context():
+            Job.query.filter_by(id=task['id']).update({
+                'status': status,
+                'message': str(message)[:512],
+                'progress': {'completed': 100, 'cancelled': task['progress']}.get(status, 0),
+                'extra': json.dumps(task['extra']) if task['extra'] else None,
+                'finished_at': datetime.utcnow(),
+                'api_key': None,
+            }, synchronize_session=False)
+            db.session.commit()
+
+    def _execute(self, task, progress_callback):
+        if task.get('type') == 'scan':
+            from app.scan_sessions import run_scan
+            success, message = run_scan(task['api_key'], progress_callback, self._cancel, task.get('fresh', False),
+                                        task['id'])
+
+        elif task.get('type') == 'update_check':
+            from app.update_checker import check_updates
+            message = check_updates(task['api_key'], progress_callback)
+            success = True
+
+        elif task.get('type') == 'typeahead_refresh':
+            from app.typeahead import refresh
+            message = refresh(task['api_key'], progress_callback)
+            success = True
+
+        elif task.get('type') == 'batch':
+            from app.bulk import run_batch
+            success, message = run_batch(task, progress_callback, self._cancel)
+
+        elif task.get('type') == 'dedup':
+            from app.dedup import consolidate
+            message = consolidate(task.get('mode', 'hardlink'), progress_callback)
+            success = True
+
+        else:
+            # Normal download
+            success, message = download_model(
+                task['model_id'], 
+                task['version_id'], 
+                task['api_key'], 
+                progress_callback
+            )
+        return success, message
 
 # Global instance
 download_manager = DownloadManager()
@@ -2,9 +2,12 @@ import os
 import requests
 import json
 import re
+import time
 from app import db
-from app.models import Setting, Download
+from app.models import HASH_FROM_CONTENT, Setting, Download, LocalFile, UpdateCheck
 from app import api
+from app.metadata_store import store_model
+from app.image_variants import sized_url
 from flask import current_app
 
 def sanitize_filename(filename):
@@ -13,9 +16,38 @@ def sanitize_filename(filename):
     """
     return re.sub(r'[\\/*?:"<>|]', "", filename)
 
-def download_file(url, path, api_key=None, progress_callback=None):
+# Bytes read per iteration into a reused buffer
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# Progress is reported at most every PROGRESS_INTERVAL seconds or PROGRESS_BYTES bytes
+PROGRESS_INTERVAL = 0.5
+PROGRESS_BYTES = 256 * 1024 * 1024
+PREVIEW_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+def _write_all(f, data):
+    """Write all of ``data``: an unbuffered file may write fewer bytes than given."""
+    while data:
+        data = data[f.write(data):]
+
+def _preallocate(f, length):
+    if not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(f.fileno(), 0, length)
+        return True
+    except OSError:
+        # Not supported by every filesystem; the download still works without it
+        return False
+
+def download_file(url, path, api_key=None, progress_callback=None, chunk_size=DOWNLOAD_CHUNK_SIZE, preallocate=True):
     """
     Download a file from a URL to a local path with progress reporting.
+
+    The body is streamed in large chunks into a reused buffer, the file is
+    preallocated when the length is known, and progress_callback is called
+    at most every PROGRESS_INTERVAL seconds or PROGRESS_BYTES bytes (and
+    once at the end). Without a content-length the callback also receives a
+    message with the byte count, since no percentage can be computed.
+    A download that fails part way leaves no file behind at ``path``.
     """
     headers = {}
     if api_key:
@@ -24,22 +56,150 @@ def download_file(url, path, api_key=None, progress_callback=None):
     with requests.get(url, stream=True, headers=headers) as r:
         r.raise_for_status()
         total_length = r.headers.get('content-length')
-        
-        with open(path, 'wb') as f:
-            if total_length is None: # no content length header
-                f.write(r.content)
-            else:
+        total_length = int(total_length) if total_length else None
+        r.raw.decode_content = True
+        buffer = memoryview(bytearray(chunk_size))
+
+        try:
+            with open(path, 'wb', buffering=0) as f:
+                preallocated = bool(total_length) and preallocate and _preallocate(f, total_length)
                 dl = 0
-                total_length = int(total_length)
-                for chunk in r.iter_content(chunk_size=8192):
-                    dl += len(chunk)
-                    f.write(chunk)
-                    if progress_callback:
-                        progress_callback(int(dl / total_length * 100))
+                reported_at = time.monotonic()
+                reported_bytes = 0
+                while True:
+                    n = r.raw.readinto(buffer)
+                    if not n:
+                        break
+                    _write_all(f, buffer[:n])
+                    dl += n
+                    if progress_callback and (dl - reported_bytes >= PROGRESS_BYTES
+                                              or time.monotonic() - reported_at >= PROGRESS_INTERVAL):
+                        _report_progress(progress_callback, dl, total_length)
+                        reported_at = time.monotonic()
+                        reported_bytes = dl
+                if preallocated and dl != total_length:
+                    f.truncate(dl)
+        except BaseException:
+            # A preallocated, zero-filled or partial file must not pass for a complete one
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+        if progress_callback:
+            _report_progress(progress_callback, dl, total_length, done=True)
+
+def _report_progress(progress_callback, dl, total_length, done=False):
+    if total_length:
+        progress_callback(100 if done else min(int(dl / total_length * 100), 99))
+    else:
+        progress_callback(100 if done else 0, f"Downloaded {dl / (1024 * 1024):.1f} MB")
+
+def target_directory(model_type):
+    """The configured ``dir_<type>`` directory, or the bundled downloads folder."""
+    setting = Setting.query.get(f"dir_{model_type}")
+    if setting and setting.value:
+        return setting.value
+    return os.path.join(current_app.root_path, 'static', 'downloads', model_type)
+
+def select_primary_file(version):
+    """The version's primary file, falling back to its first file (None if it has none)."""
+    files = version.get('files') or []
+    return next((f for f in files if f.get('primary')), files[0] if files else None)
+
+def local_filename(file_info):
+    """The name a downloaded file is saved under."""
+    base_name, ext = os.path.splitext(file_info['name'])
+    return f"{sanitize_filename(base_name)}{ext}"
+
+def find_local_copy(sha256, size=None, progress_callback=None):
+    """
+    A library file (LocalFile) with content ``sha256``, or None. Candidates
+    must be unchanged since they were recorded, and ``size`` (from the API,
+    rounded to the KB) must match too when given. Each is rehashed before
+    it is returned, since a stored hash may have come from an
+    identification rather than the file's bytes; hashes computed from
+    content are tried first.
+    """
+    from app.scanner import calculate_sha256
+
+    if not sha256:
+        return None
+    sha256 = sha256.lower()
+    candidates = LocalFile.query.filter_by(sha256=sha256).order_by(
+        (LocalFile.sha256_source == HASH_FROM_CONTENT).desc(), LocalFile.id)
+    for local_file in candidates:
+        try:
+            stat = os.stat(local_file.path)
+        except OSError:
+            continue
+        if stat.st_size != local_file.size or stat.st_mtime != local_file.mtime:
+            continue
+        if size is not None and abs(stat.st_size - size) >= 1024:
+            continue
+        if progress_callback:
+            progress_callback(0, f"Verifying {os.path.basename(local_file.path)} in the library")
+        try:
+            if calculate_sha256(local_file.path) != sha256:
+                print(f"{local_file.path} does not have its stored hash, not reusing it")
+                continue
+        except OSError as e:
+            print(f"Could not read {local_file.path}: {e}")
+            continue
+        local_file.sha256_source = HASH_FROM_CONTENT
+        return local_file
+    return None
+
+def _unchanged_copy(target, local_file):
+    """Whether ``target`` is verified to have the content of ``local_file`` and unchanged since."""
+    if target is None or not target.hash_verified or target.sha256 != local_file.sha256:
+        return False
+    stat = os.stat(target.path)
+    return stat.st_size == target.size and stat.st_mtime == target.mtime
+
+def place_local_copy(local_file, path, mode, model_id=None, version_id=None):
+    """
+    Put the library file ``local_file``, verified by find_local_copy(), at
+    ``path`` (see dedup.place_copy) and record the new file with its hash,
+    so it is never rehashed.
+    Returns the mode used, or 'existing' if ``path`` already is that file.
+    """
+    from app.dedup import place_copy
+
+    target = LocalFile.query.filter_by(path=path).first()
+    if os.path.exists(path) and (os.path.samefile(local_file.path, path) or _unchanged_copy(target, local_file)):
+        mode = 'existing'
+    else:
+        mode = place_copy(local_file.path, path, mode)
+    stat = os.stat(path)
+    if target is None:
+        target = LocalFile(path=path)
+        db.session.add(target)
+    # Same content: the hash, fingerprint and parsed header carry over
+    target.size = stat.st_size
+    target.mtime = stat.st_mtime
+    target.sha256 = local_file.sha256
+    target.sha256_source = local_file.sha256_source
+    target.fingerprint = local_file.fingerprint
+    target.header = local_file.header
+    target.model_id = model_id
+    target.version_id = version_id
+    return mode
+
+def _local_preview(model_path):
+    """The preview image saved next to a library model file, if any."""
+    base_name = os.path.splitext(model_path)[0]
+    for ext in PREVIEW_EXTENSIONS:
+        if os.path.isfile(base_name + ext):
+            return base_name + ext
+    return None
 
 def download_model(model_id, version_id, api_key=None, progress_callback=None):
     """
     Download a model version, its preview image, and metadata.
+
+    When a library file already has the primary file's SHA256, the model
+    file (and that file's preview image) are placed from disk instead of
+    downloaded, as DOWNLOAD_LOCAL_COPY_MODE links or copies.
     """
     try:
         # 1. Fetch model details
@@ -54,36 +214,28 @@ def download_model(model_id, version_id, api_key=None, progress_callback=None):
         version_name = version['name']
         
         # 2. Determine target directory
-        setting = Setting.query.get(f"dir_{model_type}")
-        if setting and setting.value:
-            base_dir = setting.value
-        else:
-            base_dir = os.path.join(current_app.root_path, 'static', 'downloads', model_type)
+        base_dir = target_directory(model_type)
         
         if not os.path.exists(base_dir):
             os.makedirs(base_dir)
 
         # 3. Construct filenames
-        primary_file = next((f for f in version.get('files', []) if f.get('primary')), None)
-        if not primary_file:
-            # Fallback to first file
-            primary_file = version['files'][0] if version.get('files') else None
-            
+        primary_file = select_primary_file(version)
         if not primary_file:
             raise ValueError("No files found for this version")
 
-        original_filename = primary_file['name']
-        base_name = os.path.splitext(original_filename)[0]
-        safe_base_name = sanitize_filename(base_name)
-        
-        # File paths
-        model_ext = os.path.splitext(original_filename)[1]
-        model_filename = f"{safe_base_name}{model_ext}"
+        model_filename = local_filename(primary_file)
+        safe_base_name = os.path.splitext(model_filename)[0]
         image_filename = f"{safe_base_name}.webp" 
         
         preview_image_url = None
         if version.get('images'):
-            preview_image_url = version['images'][0]['url']
+            preview = version['images'][0]
+            preview_image_url = preview['url']
+            # A preview-sized variant rather than the multi-MB original
+            preview_width = current_app.config['PREVIEW_IMAGE_WIDTH']
+            if not preview.get('width') or preview['width'] > preview_width:
+                preview_image_url = sized_url(preview_image_url, preview_width)
         
         # Metadata filename
         metadata_filename = f"{safe_base_name}.metadata.json"
@@ -95,13 +247,34 @@ def download_model(model_id, version_id, api_key=None, progress_callback=None):
         downloaded_files = {}
 
         # 4. Download files
-        # Model File
-        print(f"Downloading model to {model_path}...")
-        download_file(primary_file['downloadUrl'], model_path, api_key, progress_callback)
+        # Model File, from the library if a file there has the same bytes
+        local_copy = None
+        if current_app.config['DOWNLOAD_REUSE_LOCAL']:
+            local_copy = find_local_copy((primary_file.get('hashes') or {}).get('SHA256'),
+                                         int((primary_file.get('sizeKB') or 0) * 1024) or None, progress_callback)
+        if local_copy:
+            mode = place_local_copy(local_copy, model_path, current_app.config['DOWNLOAD_LOCAL_COPY_MODE'],
+                                    model_id, version_id)
+            print(f"Placed model at {model_path} from {local_copy.path} ({mode})")
+            if progress_callback:
+                progress_callback(100, f"Placed from {os.path.basename(local_copy.path)} in the library ({mode})")
+        else:
+            print(f"Downloading model to {model_path}...")
+            download_file(primary_file['downloadUrl'], model_path, api_key, progress_callback,
+                          chunk_size=current_app.config['DOWNLOAD_CHUNK_SIZE'],
+                          preallocate=current_app.config['DOWNLOAD_PREALLOCATE'])
         downloaded_files['model'] = model_path
 
         # Preview Image
-        if preview_image_url:
+        local_preview = _local_preview(local_copy.path) if local_copy else None
+        if local_preview:
+            from app.dedup import place_copy
+
+            image_path = os.path.join(base_dir, f"{safe_base_name}{os.path.splitext(local_preview)[1]}")
+            if not (os.path.exists(image_path) and os.path.samefile(local_preview, image_path)):
+                place_copy(local_preview, image_path, 'copy')
+            downloaded_files['image'] = image_path
+        elif preview_image_url:
             # Determine extension from URL or header? 
             # Let's just assume webp if prompt asked, or keep original.
             # If I save as .webp but it's a png, it might be confusing.
@@ -129,6 +302,7 @@ def download_model(model_id, version_id, api_key=None, progress_callback=None):
         with open(metadata_path, 'w') as f:
             json.dump(model, f, indent=4)
         downloaded_files['metadata'] = metadata_path
+        store_model(model, 'api', sidecar_mtime=os.path.getmtime(metadata_path))
 
         # 5. Record in DB
         download = Download(
@@ -139,8 +313,14 @@ def download_model(model_id, version_id, api_key=None, progress_callback=None):
         )
         download.set_files(downloaded_files)
         db.session.add(download)
+        check = UpdateCheck.query.get(model_id)
+        if check and check.latest_version_id == version_id:
+            check.update_available = False
+            check.installed_version_id = version_id
         db.session.commit()
         
+        if local_copy:
+            return True, f"Placed {model_name} from {local_copy.path}"
         return True, f"Successfully downloaded {model_name}"
 
     except Exception as e:
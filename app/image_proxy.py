@@ -0,0 +1,200 @@
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin, urlparse
+import requests
+from flask import current_app, url_for
+
+FETCH_TIMEOUT = 30
+COPY_CHUNK_SIZE = 256 * 1024
+MAX_REDIRECTS = 5
+
+class _Fetch:
+    """A download in progress that concurrent requests for the same image wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class ImageCache:
+    """
+    Size-bounded on-disk LRU of remote images, shared by the threads of a
+    process. Files are named by the SHA256 of their URL; recency survives
+    restarts through file mtimes. Concurrent misses for one URL make a
+    single upstream request.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict() # key -> (path, size), least recently used first
+        self._size = 0
+        self._directory = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _load(self, directory):
+        """Index the files already cached in ``directory``, oldest first."""
+        if self._directory == directory:
+            return
+        files = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                if name.endswith('.tmp'):
+                    # Being written by another process, or left by a crash
+                    continue
+                stat = os.stat(path)
+                files.append((stat.st_mtime, os.path.splitext(name)[0], path, stat.st_size))
+        self._entries.clear()
+        self._size = 0
+        for _, key, path, size in sorted(files):
+            self._entries[key] = (path, size)
+            self._size += size
+        self._directory = directory
+
+    def _evict(self, max_bytes):
+        while self._size > max_bytes and len(self._entries) > 1:
+            _, (path, size) = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, url):
+        """Return (path, mimetype) of the cached image, fetching it on a miss."""
+        config = current_app.config
+        directory = config['IMAGE_CACHE_DIR']
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        with self._lock:
+            self._load(directory)
+            entry = self._entries.get(key)
+            if entry:
+                try:
+                    os.utime(entry[0])
+                except OSError:
+                    # Evicted by another process sharing the directory
+                    del self._entries[key]
+                    self._size -= entry[1]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], mimetypes.guess_type(entry[0])[0]
+            fetch = self._inflight.get(key)
+            leader = fetch is None
+            if leader:
+                fetch = self._inflight[key] = _Fetch()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not fetch.done.wait(FETCH_TIMEOUT):
+                raise TimeoutError(f"Timed out waiting for {url}")
+            if fetch.error:
+                raise fetch.error
+            return fetch.result
+
+        try:
+            path, mimetype, size = self._download(url, key, directory, config['IMAGE_PROXY_MAX_BYTES'])
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old:
+                    self._size -= old[1]
+                self._entries[key] = (path, size)
+                self._size += size
+                self._evict(config['IMAGE_CACHE_MAX_MB'] * 1024 * 1024)
+            fetch.result = (path, mimetype)
+            return fetch.result
+        except Exception as e:
+            fetch.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fetch.done.set()
+
+    def _download(self, url, key, directory, max_bytes):
+        response = _open(url)
+        try:
+            response.raise_for_status()
+            mimetype = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if not mimetype.startswith(('image/', 'video/')):
+                raise ValueError(f"Not an image: {mimetype or 'no content type'}")
+            extension = mimetypes.guess_extension(mimetype) or ''
+            subdirectory = os.path.join(directory, key[:2])
+            os.makedirs(subdirectory, exist_ok=True)
+            path = os.path.join(subdirectory, f"{key}{extension}")
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            size = 0
+            try:
+                with open(tmp, 'wb') as f:
+                    for chunk in response.iter_content(COPY_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise ValueError(f"Image larger than {max_bytes} bytes")
+                        f.write(chunk)
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            return path, mimetype, size
+        finally:
+            response.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'fetching': len(self._inflight),
+            }
+
+_cache = ImageCache()
+
+def is_allowed(url):
+    """Only http(s) URLs on IMAGE_PROXY_HOSTS (or their subdomains) are proxied."""
+    parsed = urlparse(url or '')
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return False
+    hosts = [h.strip().lower() for h in current_app.config['IMAGE_PROXY_HOSTS'].split(',') if h.strip()]
+    host = parsed.hostname.lower()
+    return any(host == h or host.endswith(f".{h}") for h in hosts)
+
+def _open(url):
+    """
+    GET ``url``, following redirects by hand so that every hop is checked
+    against IMAGE_PROXY_HOSTS, not just the first.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        response = requests.get(url, stream=True, timeout=FETCH_TIMEOUT, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        location = urljoin(url, response.headers['Location'])
+        response.close()
+        if not is_allowed(location):
+            raise ValueError("Image redirected to a host that is not allowed")
+        url = location
+    raise ValueError(f"More than {MAX_REDIRECTS} redirects")
+
+def fetch_image(url):
+    if not is_allowed(url):
+        raise ValueError("Image host not allowed")
+    return _cache.get(url)
+
+def proxied_url(url):
+    """Template helper: the local proxy URL for a remote image, or ``url`` unchanged."""
+    if not url or not current_app.config['IMAGE_PROXY_ENABLED'] or not is_allowed(url):
+        return url
+    return url_for('main.image_proxy', url=url)
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,53 @@
+from urllib.parse import urlparse, urlunparse
+from flask import current_app
+from markupsafe import Markup, escape
+from app.image_proxy import proxied_url
+
+# Widths offered per display slot, and the `sizes` hint for how wide the slot renders
+SLOTS = {
+    'thumb': ((64, 128), '64px'),
+    'card': ((320, 450, 640), '(min-width: 1200px) 300px, (min-width: 768px) 50vw, 100vw'),
+    'carousel': ((450, 800, 1200), '(min-width: 992px) 66vw, 100vw'),
+}
+# Transform options that fix the size of the variant
+SIZE_OPTIONS = {'width', 'height', 'original'}
+
+def is_resizable(url):
+    """Whether ``url`` is on a CDN that serves width variants (IMAGE_RESIZE_HOSTS)."""
+    host = (urlparse(url or '').hostname or '').lower()
+    hosts = [h.strip().lower() for h in current_app.config['IMAGE_RESIZE_HOSTS'].split(',') if h.strip()]
+    return any(host == h or host.endswith(f".{h}") for h in hosts)
+
+def sized_url(url, width):
+    """
+    The variant of a Civitai image at most ``width`` pixels wide. Civitai
+    image URLs end in ``/<transform>/<name>``, e.g. ``/width=450/1.jpeg``
+    or ``/original=true/1.jpeg``; other URLs are returned unchanged.
+    """
+    if not is_resizable(url):
+        return url
+    parsed = urlparse(url)
+    segments = parsed.path.split('/')
+    if len(segments) >= 3 and '=' in segments[-2]:
+        options = [o for o in segments[-2].split(',') if o.partition('=')[0] not in SIZE_OPTIONS]
+        segments[-2] = ','.join(options + [f"width={width}"])
+    else:
+        segments.insert(-1, f"width={width}")
+    return urlunparse(parsed._replace(path='/'.join(segments)))
+
+def image_attrs(image, slot='card'):
+    """
+    ``src``, ``srcset`` and ``sizes`` attributes for an <img> in ``slot``,
+    from an image URL or an API image dict (whose ``width`` stops upscaling).
+    Every candidate goes through the image proxy when it is enabled.
+    """
+    url, original_width = (image.get('url'), image.get('width')) if isinstance(image, dict) else (image, None)
+    if not url:
+        return Markup('')
+    widths, sizes = SLOTS[slot]
+    widths = [w for w in widths if not original_width or w < original_width]
+    if not widths or not is_resizable(url):
+        return Markup(f'src="{escape(proxied_url(url))}"')
+    src = proxied_url(sized_url(url, widths[len(widths) // 2]))
+    srcset = ', '.join(f"{proxied_url(sized_url(url, w))} {w}w" for w in widths)
+    return Markup(f'src="{escape(src)}" srcset="{escape(srcset)}" sizes="{escape(sizes)}"')
@@ -0,0 +1,186 @@
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from flask import Response, before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Order and descriptions of the phases reported in the Server-Timing header.
+PHASES = [
+    ("api", "Civitai API"),
+    ("db", "SQLite"),
+    ("render", "Templates"),
+]
+
+
+def _timings():
+    if has_request_context() and "timings" in g:
+        return g.timings
+    return None
+
+
+def record(phase, seconds):
+    """Add ``seconds`` to ``phase`` for the current request, if any."""
+    timings = _timings()
+    if timings is not None:
+        timings[phase][0] += seconds
+        timings[phase][1] += 1
+
+
+@contextmanager
+def timed(phase):
+    """Time the enclosed block as part of ``phase`` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    record("db", time.perf_counter() - start)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        start = context.connection.info["query_start"].pop()
+        record("db", time.perf_counter() - start)
+
+
+def _before_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        # SQL issued while rendering is already counted under "db".
+        g.render_start = (time.perf_counter(), timings["db"][0])
+
+
+def _after_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and "render_start" in g:
+        start, db_before = g.pop("render_start")
+        record("render", time.perf_counter() - start - (timings["db"][0] - db_before))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval.
+
+    Cheap enough to leave a request running at near-normal speed, and unlike
+    cProfile it attributes time spent blocked in network calls.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, limit=40):
+        inclusive = Counter()
+        own = Counter()
+        for stack, count in self.stacks.items():
+            for entry in set(stack):
+                inclusive[entry] += count
+            if stack:
+                own[stack[-1]] += count
+
+        total = max(self.samples, 1)
+        lines = [
+            f"{self.samples} samples every {self.interval * 1000:.1f} ms over {self.duration * 1000:.1f} ms",
+            "",
+            "Inclusive (function and everything it calls):",
+        ]
+        for entry, count in inclusive.most_common(limit):
+            lines.append(f"{count / total * 100:6.1f}%  {count:6d}  {entry}")
+        lines += ["", "Self (innermost frame):"]
+        for entry, count in own.most_common(limit):
+            lines.append(f"{count / total * 100:6.1f}%  {count:6d}  {entry}")
+        lines += ["", "Collapsed stacks (flamegraph.pl input):"]
+        for stack, count in self.stacks.most_common():
+            lines.append(";".join(entry.split(" (")[0] for entry in stack) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _start_request():
+    g.timings = defaultdict(lambda: [0.0, 0])
+    g.request_start = time.perf_counter()
+    if current_app.config["PROFILING_ENABLED"] and request.args.get("_profile"):
+        g.profiler = SamplingProfiler(threading.get_ident(),
+                                      current_app.config["PROFILE_INTERVAL_MS"] / 1000).start()
+
+
+def _finish_request(response):
+    if "request_start" not in g:
+        return response
+    total = time.perf_counter() - g.request_start
+    timings = g.timings
+
+    metrics = []
+    accounted = 0.0
+    for phase, description in PHASES:
+        seconds, count = timings.get(phase, (0.0, 0))
+        accounted += seconds
+        metrics.append(f'{phase};dur={seconds * 1000:.1f};desc="{description} ({count})"')
+    metrics.append(f'app;dur={max(total - accounted, 0) * 1000:.1f};desc="Python"')
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    response.headers["Server-Timing"] = ", ".join(metrics)
+
+    if total * 1000 >= current_app.config["SLOW_REQUEST_MS"]:
+        breakdown = ", ".join(
+            f"{phase}={timings[phase][0] * 1000:.0f}ms/{timings[phase][1]}"
+            for phase, _ in PHASES if phase in timings
+        )
+        current_app.logger.warning(
+            "Slow request %s %s: %.0f ms (%s)", request.method, request.full_path.rstrip("?"),
+            total * 1000, breakdown or "no instrumented calls",
+        )
+
+    profiler = g.pop("profiler", None)
+    if profiler:
+        profiler.stop()
+        report = f"{request.method} {request.full_path}\n{response.headers['Server-Timing']}\n\n{profiler.report()}"
+        profiled = Response(report, mimetype="text/plain")
+        profiled.headers["Server-Timing"] = response.headers["Server-Timing"]
+        return profiled
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
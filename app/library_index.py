@@ -0,0 +1,272 @@
+import json
+import os
+from datetime import datetime
+from app import db
+from app.metadata_store import store_model
+from app.models import Download, LocalFile, ModelMetadata, Setting, UnresolvedHash
+from app.scanner import COMPANION_SUFFIXES, calculate_fingerprint, record_local_file
+
+INDEX_FORMAT = 'civitr-library-index'
+INDEX_VERSION = 1
+IMAGE_SUFFIXES = [s for s in COMPANION_SUFFIXES if s != '.metadata.json']
+# Keys every file entry of an index must have
+FILE_KEYS = ('type', 'path', 'size', 'fingerprint')
+
+def _type_roots():
+    """Each model type's directory as configured, which is how the scanner records its files' paths."""
+    from app.routes import MODEL_TYPES
+
+    roots = {}
+    for model_type in MODEL_TYPES:
+        setting = Setting.query.get(f"dir_{model_type}")
+        if setting and setting.value:
+            roots[model_type] = setting.value
+    return roots
+
+def _relative(path, roots):
+    """Return (model type, '/'-separated path below that type's directory) using the deepest matching root."""
+    best = None
+    for model_type, root in roots.items():
+        if path.startswith(root.rstrip(os.sep) + os.sep) and (best is None or len(root) > len(roots[best])):
+            best = model_type
+    if best is None:
+        return None, None
+    return best, os.path.relpath(path, roots[best]).replace(os.sep, '/')
+
+def _local_path(root, relative):
+    """
+    The local path of an index entry's '/'-separated ``relative`` path below
+    ``root``, or None if it is absolute, has '..' parts or leads outside it.
+    """
+    parts = relative.split('/')
+    if not relative or relative.startswith('/') or any(
+            part in ('', '.', '..') or os.sep in part or (os.altsep and os.altsep in part) for part in parts):
+        return None
+    path = os.path.join(root, *parts)
+    real_root = os.path.realpath(root)
+    if os.path.commonpath([real_root, os.path.realpath(path)]) != real_root:
+        # Through a symlink
+        return None
+    return path
+
+def _invalid_entry(entry):
+    """Why a file entry of an index cannot be applied, or None if it is well-formed."""
+    if not isinstance(entry, dict):
+        return "not an object"
+    missing = [key for key in FILE_KEYS if entry.get(key) in (None, '')]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if not isinstance(entry['path'], str) or not isinstance(entry['size'], int):
+        return "invalid path or size"
+    return None
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+def export_index(since=None):
+    """
+    Build a portable index of the library: files relative to their type's
+    directory with size, fingerprint, SHA256, header and identity, plus the
+    stored model JSON and negative-cache entries they refer to.
+    With ``since``, only files updated after that time are included.
+    """
+    roots = _type_roots()
+    downloads = {(d.model_id, d.version_id): d for d in Download.query.all()}
+
+    query = LocalFile.query
+    if since:
+        query = query.filter(LocalFile.updated_at >= since)
+    files = []
+    model_ids = set()
+    hashes = set()
+    for local_file in query.order_by(LocalFile.path):
+        model_type, path = _relative(local_file.path, roots)
+        if path is None or not local_file.fingerprint:
+            continue
+        entry = {
+            'type': model_type,
+            'path': path,
+            'size': local_file.size,
+            'fingerprint': local_file.fingerprint,
+            'sha256': local_file.sha256,
+            'model_id': local_file.model_id,
+            'version_id': local_file.version_id,
+            'header': local_file.get_header(),
+        }
+        download = downloads.get((local_file.model_id, local_file.version_id))
+        if download:
+            entry['name'] = download.name
+            entry['model_type'] = download.type
+        files.append(entry)
+        if local_file.model_id:
+            model_ids.add(local_file.model_id)
+        if local_file.sha256:
+            hashes.add(local_file.sha256)
+
+    models = {}
+    if model_ids:
+        for metadata in ModelMetadata.query.filter(ModelMetadata.model_id.in_(model_ids)):
+            models[str(metadata.model_id)] = {
+                'source': metadata.source,
+                'fetched_at': metadata.fetched_at.isoformat() if metadata.fetched_at else None,
+                'data': metadata.get_data(),
+            }
+    unresolved = []
+    if hashes:
+        unresolved = [u.to_dict() for u in UnresolvedHash.query.filter(UnresolvedHash.sha256.in_(hashes))]
+
+    return {
+        'format': INDEX_FORMAT,
+        'version': INDEX_VERSION,
+        'exported_at': datetime.utcnow().isoformat(),
+        'since': since.isoformat() if since else None,
+        'files': files,
+        'models': models,
+        'unresolved': unresolved,
+    }
+
+def _import_models(models, merge):
+    count = 0
+    for model_id, entry in models.items():
+        if not str(model_id).isdigit() or not isinstance(entry, dict) or not isinstance(entry.get('data'), dict):
+            continue
+        fetched_at = _parse_time(entry.get('fetched_at'))
+        current = ModelMetadata.query.get(int(model_id))
+        if merge and current and current.fetched_at and (not fetched_at or current.fetched_at >= fetched_at):
+            continue
+        stored = store_model(entry['data'], entry.get('source') or 'api')
+        stored.fetched_at = fetched_at or stored.fetched_at
+        count += 1
+    return count
+
+def _ensure_download(path, entry, models, downloads):
+    """Record a Download for an identified file, writing its metadata sidecar from the index if missing."""
+    key = (entry['model_id'], entry['version_id'])
+    base = os.path.splitext(path)[0]
+    files = {'model': path}
+
+    metadata_path = f"{base}.metadata.json"
+    model = models.get(str(entry['model_id']))
+    if not os.path.exists(metadata_path) and model:
+        with open(metadata_path, 'w') as f:
+            json.dump(model['data'], f, indent=4)
+    if os.path.exists(metadata_path):
+        files['metadata'] = metadata_path
+    for suffix in IMAGE_SUFFIXES:
+        if os.path.exists(f"{base}{suffix}"):
+            files['image'] = f"{base}{suffix}"
+            break
+
+    download = downloads.get(key)
+    if download:
+        return False
+    name = entry.get('name') or (model['data'].get('name') if model else None) or 'Unknown Model'
+    download = Download(model_id=key[0], version_id=key[1], name=name, type=entry.get('model_type') or entry['type'])
+    download.set_files(files)
+    db.session.add(download)
+    downloads[key] = download
+    return True
+
+def _import_unresolved(entries, local_paths, merge):
+    count = 0
+    for entry in entries:
+        sha256 = entry.get('sha256') if isinstance(entry, dict) else None
+        if sha256 not in local_paths:
+            continue
+        next_retry = _parse_time(entry.get('next_retry'))
+        current = UnresolvedHash.query.get(sha256)
+        if merge and current and current.next_retry and (not next_retry or current.next_retry >= next_retry):
+            continue
+        if current is None:
+            current = UnresolvedHash(sha256=sha256, first_seen=_parse_time(entry.get('first_seen')))
+            db.session.add(current)
+        current.path = local_paths[sha256]
+        current.attempts = entry.get('attempts') or 0
+        current.last_error = entry.get('last_error')
+        current.last_attempt = _parse_time(entry.get('last_attempt'))
+        current.next_retry = next_retry
+        count += 1
+    return count
+
+def import_index(index, merge=False):
+    """
+    Apply an exported index to the local library.
+
+    Files are matched by type directory, relative path, size and content
+    fingerprint (a few sampled blocks, no full hash); matches get the
+    exported SHA256 and identity so the next scan neither hashes nor looks
+    them up. Those hashes are stored as unverified (sha256_source 'index').
+    By default the index wins for matching files; with ``merge`` local
+    results are kept and only gaps (and newer metadata) are filled.
+    Returns counts of what was imported, and in ``errors`` the file entries
+    that were malformed or pointed outside the library.
+    """
+    if not isinstance(index, dict) or index.get('format') != INDEX_FORMAT:
+        raise ValueError("Not a library index")
+    if (index.get('version') or 0) > INDEX_VERSION:
+        raise ValueError(f"Unsupported library index version {index.get('version')}")
+
+    if not isinstance(index.get('files') or [], list) or not isinstance(index.get('models') or {}, dict):
+        raise ValueError("Malformed library index")
+
+    roots = _type_roots()
+    models = index.get('models') or {}
+    existing = {local_file.path: local_file for local_file in LocalFile.query.all()}
+    downloads = {(d.model_id, d.version_id): d for d in Download.query.all()}
+    stats = {'files': 0, 'kept': 0, 'missing': 0, 'mismatched': 0, 'invalid': 0, 'downloads': 0, 'models': 0,
+             'unresolved': 0, 'errors': []}
+
+    stats['models'] = _import_models(models, merge)
+
+    local_paths = {}
+    for position, entry in enumerate(index.get('files') or []):
+        error = _invalid_entry(entry)
+        root = roots.get(entry.get('type')) if error is None else None
+        if error is None and root:
+            path = _local_path(root, entry['path'])
+            if path is None:
+                error = "path outside the library"
+        if error:
+            stats['invalid'] += 1
+            stats['errors'].append({'entry': position, 'path': entry.get('path') if isinstance(entry, dict) else None,
+                                    'error': error})
+            continue
+        if not root:
+            stats['missing'] += 1
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stats['missing'] += 1
+            continue
+        if stat.st_size != entry['size']:
+            stats['mismatched'] += 1
+            continue
+
+        local_file = existing.get(path)
+        unchanged = local_file is not None and local_file.size == stat.st_size and local_file.mtime == stat.st_mtime
+        if merge and unchanged and local_file.sha256 and (local_file.version_id or not entry.get('version_id')):
+            stats['kept'] += 1
+            continue
+
+        fingerprint = local_file.fingerprint if unchanged and local_file.fingerprint else \
+            calculate_fingerprint(path, stat.st_size)
+        if fingerprint != entry['fingerprint']:
+            stats['mismatched'] += 1
+            continue
+
+        if local_file is not None and not merge:
+            local_file.model_id = local_file.version_id = None
+        local_file = record_local_file(path, stat, entry.get('header'), entry.get('sha256'), entry.get('model_id'),
+                                       entry.get('version_id'), local_file, fingerprint, 'index')
+        existing[path] = local_file
+        stats['files'] += 1
+        if entry.get('sha256'):
+            local_paths[entry['sha256'].lower()] = path
+        if entry.get('model_id') and entry.get('version_id'):
+            if _ensure_download(path, entry, models, downloads):
+                stats['downloads'] += 1
+
+    stats['unresolved'] = _import_unresolved(index.get('unresolved') or [], local_paths, merge)
+    db.session.commit()
+    return stats
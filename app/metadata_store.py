@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from app import api, db
+from app.database import writer
+from app.models import ModelMetadata
+
+_revalidating = set()
+_lock = threading.Lock()
+
+def as_model(data):
+    """Normalize a saved JSON to a model object (we save models; other tools save versions)."""
+    if not isinstance(data, dict):
+        return None
+    if 'modelVersions' in data:
+        return data
+    if 'modelId' in data and 'files' in data:
+        model_info = data.get('model', {})
+        return {'id': data['modelId'], 'name': model_info.get('name'), 'type': model_info.get('type'),
+                'modelVersions': [data]}
+    return None
+
+def store_model(model, source='api', sidecar_mtime=None):
+    """Insert or replace the stored JSON of a model."""
+    entry = ModelMetadata.query.get(model['id'])
+    if entry is None:
+        entry = ModelMetadata(model_id=model['id'])
+        db.session.add(entry)
+    entry.name = model.get('name')
+    entry.type = model.get('type')
+    entry.set_data(model)
+    entry.source = source
+    if sidecar_mtime is not None:
+        entry.sidecar_mtime = sidecar_mtime
+    if source == 'sidecar' and sidecar_mtime is not None:
+        entry.fetched_at = datetime.utcfromtimestamp(sidecar_mtime)
+    else:
+        entry.fetched_at = datetime.utcnow()
+    return entry
+
+def ingest_sidecar(path, data=None):
+    """
+    Store a <name>.metadata.json file unless the stored copy is at least as
+    recent. Returns the entry, or None if the file is not model JSON.
+    """
+    mtime = os.path.getmtime(path)
+    if data is None:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    model = as_model(data)
+    if not model or 'id' not in model:
+        return None
+
+    entry = ModelMetadata.query.get(model['id'])
+    if entry is not None:
+        if entry.sidecar_mtime is not None and entry.sidecar_mtime >= mtime:
+            return entry
+        if entry.fetched_at and entry.fetched_at >= datetime.utcfromtimestamp(mtime):
+            # A later API revalidation already replaced this sidecar's content
+            entry.sidecar_mtime = mtime
+            return entry
+    return store_model(model, 'sidecar', mtime)
+
+def get_cached_model(model_id):
+    return ModelMetadata.query.get(model_id)
+
+def is_stale(entry):
+    max_age = timedelta(seconds=current_app.config['METADATA_REVALIDATE_SECONDS'])
+    return entry.fetched_at is None or entry.fetched_at < datetime.utcnow() - max_age
+
+def revalidate_async(model_id, api_key=None):
+    """Refresh a stored model from the API in the background; one refresh per model at a time."""
+    with _lock:
+        if model_id in _revalidating:
+            return False
+        _revalidating.add(model_id)
+    app = current_app._get_current_object()
+    threading.Thread(target=_revalidate, args=(app, model_id, api_key), daemon=True).start()
+    return True
+
+def _revalidate(app, model_id, api_key):
+    try:
+        model = api.get_model(model_id, api_key)
+        with app.app_context():
+            writer.submit(store_model, model, 'api')
+    except Exception as e:
+        print(f"Failed to revalidate metadata for model {model_id}: {e}")
+    finally:
+        with _lock:
+            _revalidating.discard(model_id)
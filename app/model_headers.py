@@ -0,0 +1,243 @@
+import json
+import os
+import struct
+
+# Bytes read up front; enough for the __metadata__ block of nearly every file.
+HEADER_READ_SIZE = 64 * 1024
+# Upper bound for reading a full safetensors header when __metadata__ is not
+# found in the first block (e.g. a huge tensor index written before it).
+MAX_SAFETENSORS_HEADER = 8 * 1024 * 1024
+# GGUF metadata is parsed until this many bytes have been consumed; the
+# interesting general.* keys come first, tokenizer vocabularies come last.
+MAX_GGUF_READ = 1024 * 1024
+# GGUF arrays longer than this are summarized by type and length only.
+MAX_GGUF_ARRAY = 16
+
+HEADER_EXTENSIONS = {'.safetensors', '.gguf'}
+
+# Metadata keys that embed a hash of the weights (sha256 of the tensor data,
+# excluding the header - what Civitai calls AutoV3).
+EMBEDDED_HASH_KEYS = ['sshs_model_hash', 'modelspec.hash_sha256']
+
+# Friendly names for the header keys shown in the library.
+SUMMARY_KEYS = [
+    ('title', ['modelspec.title', 'ss_output_name', 'general.name']),
+    ('architecture', ['modelspec.architecture', 'ss_base_model_version', 'general.architecture']),
+    ('base_model', ['ss_sd_model_name']),
+    ('network', ['ss_network_module']),
+    ('network_dim', ['ss_network_dim']),
+    ('network_alpha', ['ss_network_alpha']),
+    ('resolution', ['modelspec.resolution', 'ss_resolution']),
+    ('epochs', ['ss_num_epochs']),
+    ('steps', ['ss_max_train_steps']),
+    ('trigger_words', ['modelspec.trigger_phrase']),
+    ('file_type', ['general.file_type']),
+]
+
+
+class HeaderError(ValueError):
+    pass
+
+
+def read_header(filepath):
+    """
+    Read the embedded header of a .safetensors or .gguf file without loading
+    any weights. Returns None for other file types.
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.safetensors':
+        return read_safetensors_header(filepath)
+    if ext == '.gguf':
+        return read_gguf_header(filepath)
+    return None
+
+
+def read_safetensors_header(filepath):
+    """
+    Parse the JSON header of a .safetensors file.
+
+    Only the ``__metadata__`` block is kept; tensor entries are counted.
+    Usually a single 64 KB read is enough.
+    """
+    with open(filepath, 'rb') as f:
+        block = f.read(HEADER_READ_SIZE)
+        if len(block) < 8:
+            raise HeaderError("File too small for a safetensors header")
+        header_size = struct.unpack('<Q', block[:8])[0]
+        if header_size < 2 or header_size > os.fstat(f.fileno()).st_size - 8:
+            raise HeaderError("Invalid safetensors header size")
+
+        raw = block[8:8 + header_size]
+        result = {'format': 'safetensors', 'header_size': header_size, 'tensor_count': None}
+
+        if len(raw) < header_size:
+            metadata = _extract_metadata_block(raw)
+            if metadata is not None:
+                result['metadata'] = metadata
+                return result
+            if header_size > MAX_SAFETENSORS_HEADER:
+                raise HeaderError("Safetensors header too large")
+            raw += f.read(header_size - len(raw))
+
+    try:
+        header = json.loads(raw.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HeaderError(f"Invalid safetensors header: {e}")
+    if not isinstance(header, dict):
+        raise HeaderError("Invalid safetensors header")
+
+    metadata = header.pop('__metadata__', None) or {}
+    result['metadata'] = {k: v for k, v in metadata.items() if isinstance(v, str)}
+    result['tensor_count'] = len(header)
+    return result
+
+
+def _extract_metadata_block(raw):
+    """Decode just the __metadata__ object from a truncated header."""
+    marker = raw.find(b'"__metadata__"')
+    if marker < 0:
+        return None
+    start = raw.find(b'{', marker)
+    if start < 0:
+        return None
+    try:
+        text = raw[start:].decode('utf-8', errors='ignore')
+        metadata, _ = json.JSONDecoder().raw_decode(text)
+    except ValueError:
+        return None
+    if not isinstance(metadata, dict):
+        return None
+    return {k: v for k, v in metadata.items() if isinstance(v, str)}
+
+
+# GGUF value types: (struct format, size) for scalars.
+_GGUF_SCALARS = {
+    0: ('<B', 1), 1: ('<b', 1), 2: ('<H', 2), 3: ('<h', 2),
+    4: ('<I', 4), 5: ('<i', 4), 6: ('<f', 4), 7: ('<?', 1),
+    10: ('<Q', 8), 11: ('<q', 8), 12: ('<d', 8),
+}
+_GGUF_STRING = 8
+_GGUF_ARRAY = 9
+
+
+class _Reader:
+    def __init__(self, f, budget):
+        self.f = f
+        self.budget = budget
+        self.consumed = 0
+
+    def read(self, n):
+        data = self.f.read(n)
+        if len(data) < n:
+            raise HeaderError("Unexpected end of GGUF header")
+        self.consumed += n
+        return data
+
+    def skip(self, n):
+        self.f.seek(n, os.SEEK_CUR)
+        self.consumed += n
+
+    def unpack(self, fmt, size):
+        return struct.unpack(fmt, self.read(size))[0]
+
+    def string(self):
+        length = self.unpack('<Q', 8)
+        if length > self.budget:
+            raise HeaderError("GGUF string too long")
+        return self.read(length).decode('utf-8', errors='replace')
+
+    def value(self, value_type):
+        if value_type in _GGUF_SCALARS:
+            return self.unpack(*_GGUF_SCALARS[value_type])
+        if value_type == _GGUF_STRING:
+            return self.string()
+        if value_type == _GGUF_ARRAY:
+            item_type = self.unpack('<I', 4)
+            length = self.unpack('<Q', 8)
+            if length <= MAX_GGUF_ARRAY:
+                return [self.value(item_type) for _ in range(length)]
+            if item_type in _GGUF_SCALARS:
+                self.skip(_GGUF_SCALARS[item_type][1] * length)
+            else:
+                for _ in range(length):
+                    self.value(item_type)
+                    if self.consumed > self.budget:
+                        break
+            return {'array': item_type, 'length': length}
+        raise HeaderError(f"Unknown GGUF value type {value_type}")
+
+
+def read_gguf_header(filepath):
+    """
+    Parse the key/value metadata of a GGUF (v2/v3) file.
+
+    Parsing stops after MAX_GGUF_READ bytes, so long tokenizer arrays at the
+    end of the metadata are not read.
+    """
+    with open(filepath, 'rb') as f:
+        reader = _Reader(f, MAX_GGUF_READ)
+        if reader.read(4) != b'GGUF':
+            raise HeaderError("Not a GGUF file")
+        version = reader.unpack('<I', 4)
+        if version < 2:
+            raise HeaderError(f"Unsupported GGUF version {version}")
+        tensor_count = reader.unpack('<Q', 8)
+        kv_count = reader.unpack('<Q', 8)
+
+        metadata = {}
+        for _ in range(kv_count):
+            if reader.consumed > MAX_GGUF_READ:
+                break
+            key = reader.string()
+            metadata[key] = reader.value(reader.unpack('<I', 4))
+
+    return {
+        'format': 'gguf',
+        'version': version,
+        'tensor_count': tensor_count,
+        'metadata': metadata,
+    }
+
+
+def embedded_hashes(header):
+    """
+    Return the weight hashes embedded in a parsed header, lowercase hex
+    without any ``0x`` prefix.
+    """
+    if not header:
+        return []
+    metadata = header.get('metadata') or {}
+    hashes = []
+    for key in EMBEDDED_HASH_KEYS:
+        value = metadata.get(key)
+        if not isinstance(value, str):
+            continue
+        value = value.strip().lower()
+        if value.startswith('0x'):
+            value = value[2:]
+        if len(value) >= 10 and all(c in '0123456789abcdef' for c in value) and value not in hashes:
+            hashes.append(value)
+    return hashes
+
+
+def hashes_match(embedded, known):
+    """Compare hashes that may be truncated (Civitai shows 10-12 char prefixes)."""
+    if not embedded or not known:
+        return False
+    embedded, known = embedded.lower(), known.lower()
+    return embedded.startswith(known) or known.startswith(embedded)
+
+
+def summarize_header(header):
+    """Pick the human-readable fields shown on library entries."""
+    if not header:
+        return {}
+    metadata = header.get('metadata') or {}
+    summary = {'format': header.get('format')}
+    for name, keys in SUMMARY_KEYS:
+        for key in keys:
+            value = metadata.get(key)
+            if value not in (None, '', 'None'):
+                summary[name] = value
+                break
+    return summary
@@ -1,6 +1,7 @@
 from app import db
 from datetime import datetime
 import json
+import zlib
 
 class Setting(db.Model):
     key = db.Column(db.String(64), primary_key=True)
@@ -36,3 +37,238 @@ class Download(db.Model):
 
     def __repr__(self):
         return f'<Download {self.name}>'
+
+# Where LocalFile.sha256 came from. Only HASH_FROM_CONTENT hashes were computed
+# from the file's own bytes; the others are the published hash of the version
+# the file was identified as ('sidecar': by name and size from its metadata
+# JSON, 'header': by its embedded weight hash) or the hash an imported library
+# index gave it ('index').
+HASH_FROM_CONTENT = 'content'
+HASH_SOURCES = (HASH_FROM_CONTENT, 'sidecar', 'header', 'index')
+
+class LocalFile(db.Model):
+    """A model file on disk, with what we know about it without rehashing."""
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(1024), unique=True, nullable=False)
+    size = db.Column(db.BigInteger)
+    mtime = db.Column(db.Float)
+    sha256 = db.Column(db.String(64), index=True)
+    sha256_source = db.Column(db.String(16)) # one of HASH_SOURCES
+    fingerprint = db.Column(db.String(64), index=True) # size + sampled head/middle/tail blocks
+    model_id = db.Column(db.Integer)
+    version_id = db.Column(db.Integer)
+    header = db.Column(db.Text) # JSON of the parsed safetensors/GGUF header
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def hash_verified(self):
+        """Whether ``sha256`` was computed from this file's bytes."""
+        return bool(self.sha256) and self.sha256_source == HASH_FROM_CONTENT
+
+    def set_header(self, header):
+        self.header = json.dumps(header) if header else None
+
+    def get_header(self):
+        return json.loads(self.header) if self.header else None
+
+    @property
+    def header_summary(self):
+        from app.model_headers import summarize_header
+        return summarize_header(self.get_header())
+
+    def __repr__(self):
+        return f'<LocalFile {self.path}>'
+
+class UnresolvedHash(db.Model):
+    """Negative cache: hashes the API could not identify, retried with backoff."""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(1024))
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(256))
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_attempt = db.Column(db.DateTime)
+    next_retry = db.Column(db.DateTime, index=True)
+
+    def to_dict(self):
+        return {
+            'sha256': self.sha256,
+            'path': self.path,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'first_seen': self.first_seen.isoformat() if self.first_seen else None,
+            'last_attempt': self.last_attempt.isoformat() if self.last_attempt else None,
+            'next_retry': self.next_retry.isoformat() if self.next_retry else None,
+        }
+
+    def __repr__(self):
+        return f'<UnresolvedHash {self.sha256[:12]} x{self.attempts}>'
+
+class ModelMetadata(db.Model):
+    """Full model JSON of library models, zlib-compressed, for offline detail pages."""
+    model_id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(256))
+    type = db.Column(db.String(64), index=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    source = db.Column(db.String(16)) # 'sidecar' or 'api'
+    sidecar_mtime = db.Column(db.Float) # mtime of the ingested .metadata.json
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow) # when the JSON was last known fresh
+
+    def set_data(self, model):
+        self.data = zlib.compress(json.dumps(model, separators=(',', ':')).encode('utf-8'), 6)
+
+    def get_data(self):
+        return json.loads(zlib.decompress(self.data).decode('utf-8'))
+
+    def __repr__(self):
+        return f'<ModelMetadata {self.model_id} {self.name}>'
+
+class UpdateCheck(db.Model):
+    """Result of the last background check of a library model for newer versions."""
+    model_id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(256))
+    installed_version_id = db.Column(db.Integer) # newest downloaded version at check time
+    latest_version_id = db.Column(db.Integer)
+    latest_version_name = db.Column(db.String(256))
+    latest_published_at = db.Column(db.String(64))
+    update_available = db.Column(db.Boolean, default=False, index=True)
+    etag = db.Column(db.String(256))
+    last_modified = db.Column(db.String(64))
+    checked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(256))
+    queued_version_id = db.Column(db.Integer) # latest version already auto-queued
+
+    def to_dict(self):
+        return {
+            'model_id': self.model_id,
+            'name': self.name,
+            'installed_version_id': self.installed_version_id,
+            'latest_version_id': self.latest_version_id,
+            'latest_version_name': self.latest_version_name,
+            'latest_published_at': self.latest_published_at,
+            'update_available': self.update_available,
+            'checked_at': self.checked_at.isoformat() if self.checked_at else None,
+            'last_error': self.last_error,
+        }
+
+    def __repr__(self):
+        return f'<UpdateCheck {self.model_id} {self.installed_version_id}->{self.latest_version_id}>'
+
+class Job(db.Model):
+    """A queued background task (download, scan, update check) shared by all processes."""
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(32), nullable=False, default='download')
+    model_id = db.Column(db.Integer)
+    version_id = db.Column(db.Integer)
+    api_key = db.Column(db.String(256))
+    params = db.Column(db.Text) # JSON of extra add_task() arguments
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True) # queued, running, completed, failed
+    progress = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(512), default='Queued')
+    extra = db.Column(db.Text) # JSON of extra progress fields, e.g. scan stage stats
+    worker = db.Column(db.String(64)) # host:pid of the process running it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime, index=True)
+    heartbeat = db.Column(db.DateTime)
+
+    def get_params(self):
+        return json.loads(self.params) if self.params else {}
+
+    def to_dict(self):
+        params = self.get_params()
+        params.pop('items', None) # a batch's plan; its status has the counts
+        task = {
+            'id': self.id,
+            'type': self.type,
+            'model_id': self.model_id,
+            'version_id': self.version_id,
+            **params,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'message': self.message,
+        }
+        if self.extra:
+            task.update(json.loads(self.extra))
+        return task
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.type} {self.status}>'
+
+class TypeaheadTerm(db.Model):
+    """A tag, creator or library model name offered as a search suggestion."""
+    __table_args__ = (db.UniqueConstraint('kind', 'name'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False) # 'tag', 'creator' or 'model'
+    name = db.Column(db.String(256), nullable=False)
+    weight = db.Column(db.Integer, default=0) # e.g. model count, for ranking
+    ref_id = db.Column(db.Integer) # model id of 'model' terms
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TypeaheadTerm {self.kind}:{self.name}>'
+
+class PageCursor(db.Model):
+    """nextCursor of a model listing page, so deep pages cost one upstream call."""
+    __table_args__ = (db.UniqueConstraint('listing', 'page'),)
+    id = db.Column(db.Integer, primary_key=True)
+    listing = db.Column(db.String(64), nullable=False) # hash of the listing's filters
+    page = db.Column(db.Integer, nullable=False) # the page this cursor starts
+    cursor = db.Column(db.String(512), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<PageCursor {self.listing[:8]} p{self.page}>'
+
+class ScanSession(db.Model):
+    """A library scan across all directories that can be cancelled and resumed."""
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer) # the job currently running it
+    status = db.Column(db.String(16), nullable=False, default='running', index=True) # running, cancelled, completed, abandoned
+    total_files = db.Column(db.Integer, default=0)
+    processed_files = db.Column(db.Integer, default=0)
+    updated_count = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total_files': self.total_files,
+            'processed_files': self.processed_files,
+            'updated_count': self.updated_count,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ScanSession {self.id} {self.status}>'
+
+class ScanCheckpoint(db.Model):
+    """A file a scan session is done with, committed together with its LocalFile row."""
+    __table_args__ = (db.UniqueConstraint('session_id', 'path'),)
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, nullable=False, index=True)
+    path = db.Column(db.String(1024), nullable=False)
+    model_id = db.Column(db.Integer) # identity found, for removing missing downloads at the end
+    version_id = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f'<ScanCheckpoint {self.session_id} {self.path}>'
+
+class CreatorStats(db.Model):
+    """Totals over all models of a creator, aggregated from every listing page and kept for CREATOR_STATS_TTL."""
+    username = db.Column(db.String(256), primary_key=True)
+    account = db.Column(db.String(16), primary_key=True, default='') # listings can differ per account
+    data = db.Column(db.Text, nullable=False) # JSON of creator_stats.aggregate()
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def set_data(self, stats):
+        self.data = json.dumps(stats)
+
+    def get_data(self):
+        return json.loads(self.data)
+
+    def __repr__(self):
+        return f'<CreatorStats {self.username} {self.account}>'
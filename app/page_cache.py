@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, make_response, request, session
+from app import db
+from app.models import Setting
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bumped whenever downloads change, so pages with stale "Downloaded" badges
+# are never served - by any process sharing the database.
+VERSION_KEY = 'library_version'
+IGNORED_ARGS = {'_profile'}
+
+class PageCache:
+    """In-process LRU of rendered pages with precompressed variants."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, ttl):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry['created'] > ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry, max_entries):
+        entry['created'] = time.monotonic()
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_cache = PageCache()
+
+def library_version():
+    setting = Setting.query.get(VERSION_KEY)
+    return setting.value if setting else '0'
+
+def invalidate():
+    """Drop every cached page after a download or scan changed the library."""
+    setting = Setting.query.get(VERSION_KEY)
+    if not setting:
+        setting = Setting(key=VERSION_KEY, value='0')
+        db.session.add(setting)
+    setting.value = str(int(setting.value or 0) + 1)
+    db.session.commit()
+    _cache.clear()
+
+def _cache_key():
+    args = sorted(
+        (key, value)
+        for key, values in request.args.lists() if key not in IGNORED_ARGS
+        for value in values if value != ''
+    )
+    # Results can depend on the account (e.g. its NSFW preferences)
+    api_key = session.get('api_key')
+    account = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16] if api_key else ''
+    return (request.endpoint, tuple(args), account, library_version())
+
+def _compress(body):
+    bodies = {'identity': body}
+    if len(body) >= current_app.config['PAGE_CACHE_MIN_COMPRESS_BYTES']:
+        bodies['gzip'] = gzip.compress(body, compresslevel=6)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(body, quality=5)
+    return bodies
+
+def _respond(entry, state):
+    accepted = request.accept_encodings
+    encoding = next((e for e in ('br', 'gzip') if e in entry['bodies'] and accepted[e]), None)
+    response = make_response(entry['bodies'][encoding or 'identity'])
+    response.content_type = entry['content_type']
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['X-Cache'] = state
+    return response
+
+def cached_page(view):
+    """
+    Cache a page's HTML for PAGE_CACHE_TTL seconds, keyed on its normalized
+    query string, the account and the library version. Responses that are
+    not 200 text/html, or that flashed an error while rendering, are not stored.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        ttl = current_app.config['PAGE_CACHE_TTL']
+        if ttl <= 0 or request.method != 'GET' or request.args.get('_profile'):
+            return view(*args, **kwargs)
+
+        key = _cache_key()
+        entry = _cache.get(key, ttl)
+        if entry is not None:
+            return _respond(entry, 'HIT')
+
+        flashes = len(session.get('_flashes', []))
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.mimetype != 'text/html' or response.direct_passthrough \
+                or len(session.get('_flashes', [])) > flashes:
+            return response
+        entry = {'bodies': _compress(response.get_data()), 'content_type': response.content_type}
+        _cache.set(key, entry, current_app.config['PAGE_CACHE_MAX_ENTRIES'])
+        return _respond(entry, 'MISS')
+    return wrapper
@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class Stage:
+    """
+    A pool of worker threads applying ``func`` to every item of ``inbox`` and
+    passing the result on to ``outbox``. Exceptions are stored on the item
+    (``item.error``) so one bad file never stalls the pipeline.
+    """
+
+    def __init__(self, name, func, workers, inbox, outbox, cancelled):
+        self.name = name
+        self.func = func
+        self.workers = max(int(workers), 1)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.cancelled = cancelled
+        self.processed = 0
+        self.errors = 0
+        self.busy = 0.0
+        self._finished = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                with self._lock:
+                    self._finished += 1
+                    last = self._finished == self.workers
+                if last:
+                    self.outbox.put(_DONE)
+                else:
+                    # Let the sibling workers see the end marker too
+                    self.inbox.put(_DONE)
+                return
+            if self.cancelled.is_set():
+                continue
+
+            start = time.perf_counter()
+            try:
+                item = self.func(item)
+            except Exception as e:
+                print(f"{self.name} stage failed: {e}")
+                item.error = e
+                with self._lock:
+                    self.errors += 1
+            with self._lock:
+                self.busy += time.perf_counter() - start
+                self.processed += 1
+            self.outbox.put(item)
+
+    def stats(self, elapsed):
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'backlog': self.inbox.qsize(),
+            'errors': self.errors,
+            'items_per_s': round(self.processed / elapsed, 2) if elapsed else 0,
+            'utilization': round(self.busy / (elapsed * self.workers), 2) if elapsed else 0,
+        }
+
+
+class Pipeline:
+    """
+    A streaming pipeline of bounded stages connected by queues.
+
+    Items come from a source iterable (run on its own thread), flow through
+    each stage in order, and are yielded by ``run()`` on the calling thread,
+    which makes it the natural place for work that must not be threaded
+    (e.g. database writes).
+    """
+
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self.queues = [queue.Queue(maxsize=queue_size)]
+        self.stages = []
+        self.cancelled = threading.Event()
+        self.produced = 0
+        self.source_busy = 0.0
+        self.started = None
+
+    def add_stage(self, name, func, workers=1):
+        outbox = queue.Queue(maxsize=self.queue_size)
+        self.stages.append(Stage(name, func, workers, self.queues[-1], outbox, self.cancelled))
+        self.queues.append(outbox)
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _feed(self, source):
+        inbox = self.queues[0]
+        try:
+            iterator = iter(source)
+            while not self.cancelled.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.source_busy += time.perf_counter() - start
+                self.produced += 1
+                inbox.put(item)
+        except Exception as e:
+            print(f"Pipeline source failed: {e}")
+        finally:
+            inbox.put(_DONE)
+
+    def run(self, source):
+        """Start the stages and yield every item that made it through."""
+        self.started = time.perf_counter()
+        for stage in self.stages:
+            stage.start()
+        threading.Thread(target=self._feed, args=(source,), name="pipeline-source", daemon=True).start()
+
+        outbox = self.queues[-1]
+        finished = False
+        try:
+            while True:
+                item = outbox.get()
+                if item is _DONE:
+                    finished = True
+                    return
+                if not self.cancelled.is_set():
+                    yield item
+        finally:
+            if not finished:
+                # The consumer stopped early: cancel and drain so no thread stays blocked
+                self.cancel()
+                while outbox.get() is not _DONE:
+                    pass
+
+    def stats(self, source_name='source'):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        stats = {
+            source_name: {
+                'workers': 1,
+                'processed': self.produced,
+                'backlog': 0,
+                'errors': 0,
+                'items_per_s': round(self.produced / elapsed, 2) if elapsed else 0,
+                'utilization': round(self.source_busy / elapsed, 2) if elapsed else 0,
+            }
+        }
+        for stage in self.stages:
+            stats[stage.name] = stage.stats(elapsed)
+        return stats
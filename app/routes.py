@@ -13,11 +13,20 @@ from flask import (
 )
 from app import api
 from app import db
-from app.models import Setting, Download
-from app.download_manager import download_manager
+from app import metadata_store
+from app import creator_stats
+from app.models import Setting, Download, LocalFile, UnresolvedHash, UpdateCheck
+from app import update_checker
+from app import page_cache
+from app.page_cache import cached_page
+from app.cursors import CursorPagination, PageOutOfReach, get_models_page
+from app.database import writer
+from app.download_manager import download_manager, set_scheduler_api_key
 from flask_paginate import Pagination, get_page_parameter
+import json
 import os
 import threading
+from datetime import datetime
 
 main = Blueprint("main", __name__)
 
@@ -27,6 +36,7 @@ def record(state):
 
 
 @main.route("/")
+@cached_page
 def index():
     # Get NSFW filter parameter
     nsfw = request.args.get("nsfw", "false")
@@ -171,6 +181,7 @@ MODEL_STATUS_OPTIONS = [
 
 
 @main.route("/models")
+@cached_page
 def models():
     page = request.args.get(get_page_parameter(), type=int, default=1)
     per_page = current_app.config["MODELS_PER_PAGE"]
@@ -191,7 +202,6 @@ def models():
     # Fetch models from the API
     try:
         params = {
-            "page": page,
             "limit": per_page,
             "types": type_filter,
             "sort": sort_by,
@@ -216,18 +226,15 @@ def models():
             elif status == "Featured":
                 params["featured"] = "true"
 
-        response = api.get_models(params, api_key=session.get("api_key"))
+        response = get_models_page(params, page, api_key=session.get("api_key"))
         models = response.get("items", [])
-        total = response.get("metadata", {}).get("totalItems", 0)
     except Exception as e:
         flash(f"Error fetching models from API: {e}", "error")
+        response = {}
         models = []
-        total = 0
 
-    # Create a Pagination object
-    pagination = Pagination(
-        page=page, per_page=per_page, total=total, css_framework="bootstrap4"
-    )
+    # Next/previous by cursor; page numbers when upstream reports a total
+    pagination = CursorPagination(page, per_page, response)
 
     # Get popular tags from the API
     try:
@@ -268,11 +275,20 @@ def models():
 
 @main.route("/models/<int:model_id>")
 def model_detail(model_id):
-    try:
-        model = api.get_model(model_id, api_key=session.get("api_key"))
-    except Exception as e:
-        flash(f"Error fetching model from API: {e}", "error")
-        return redirect(url_for("main.index"))
+    # Library models render from the local metadata store and refresh in the background
+    local_copy = metadata_store.get_cached_model(model_id)
+    if local_copy:
+        model = local_copy.get_data()
+        if metadata_store.is_stale(local_copy):
+            metadata_store.revalidate_async(model_id, session.get("api_key"))
+    else:
+        try:
+            model = api.get_model(model_id, api_key=session.get("api_key"))
+        except Exception as e:
+            flash(f"Error fetching model from API: {e}", "error")
+            return redirect(url_for("main.index"))
+        if Download.query.filter_by(model_id=model_id).first():
+            writer.submit(metadata_store.store_model, model, 'api')
 
     versions = model.get("modelVersions", [])
     preview_images = []
@@ -296,6 +312,7 @@ def model_detail(model_id):
         similar_models=similar_models,
         related_by_type=related_by_type,
         model_types=model_types,
+        local_copy=local_copy,
     )
 
 
@@ -345,31 +362,36 @@ def creator_detail(creator_id):
 
     # Get creator's models
     try:
-        params = {"username": creator.get("username")}
+        params = creator_stats.listing_params(creator.get("username"))
         response = api.get_models(params, api_key=session.get("api_key"))
         models = response.get("items", [])
     except Exception as e:
         flash(f"Error fetching models from API: {e}", "error")
+        response = None
         models = []
 
-    # Calculate statistics
-    model_count = len(models)
-    download_count = sum(model.get("stats", {}).get("downloadCount", 0) for model in models)
-
-    # The API does not directly provide model types for the creator's model list.
-    model_types = []
+    # Statistics cover every page of the creator's models, not just the first
+    stats = None
+    if response is not None:
+        try:
+            stats = creator_stats.get_stats(creator.get("username"), session.get("api_key"), first_page=response)
+        except Exception as e:
+            flash(f"Error fetching creator statistics from API: {e}", "warning")
 
     return render_template(
         "creator_detail.html",
         creator=creator,
         models=models,
-        model_count=model_count,
-        download_count=download_count,
-        model_types=model_types,
+        stats=stats,
+        model_count=stats["model_count"] if stats else len(models),
+        download_count=stats["download_count"] if stats else
+            sum(model.get("stats", {}).get("downloadCount", 0) for model in models),
+        model_types=stats["types"] if stats else [],
     )
 
 
 @main.route("/search")
+@cached_page
 def search():
     query = request.args.get("q", "")
     base_model_filter = request.args.get("base_model", "")
@@ -383,24 +405,23 @@ def search():
     # Search models
     try:
         params = {
-            "page": page,
             "limit": per_page,
             "query": query,
             "baseModels": base_model_filter,
             "nsfw": nsfw == "true",
         }
-        response = api.get_models(params, api_key=session.get("api_key"))
+        response = get_models_page(params, page, api_key=session.get("api_key"))
         models = response.get("items", [])
-        total = response.get("metadata", {}).get("totalItems", 0)
+    except PageOutOfReach as e:
+        flash(str(e), "warning")
+        response = {}
+        models = []
     except Exception as e:
         flash(f"Error fetching models from API: {e}", "error")
+        response = {}
         models = []
-        total = 0
 
-    # Create a Pagination object for models
-    model_pagination = Pagination(
-        page=page, per_page=per_page, total=total, css_framework="bootstrap4"
-    )
+    model_pagination = CursorPagination(page, per_page, response)
 
     # Search creators
     try:
@@ -435,6 +456,8 @@ def settings():
         if action == "clear":
             session.pop("api_key", None)
             session.pop("user", None)
+            set_scheduler_api_key(None)
+            db.session.commit()
             flash("API Key cleared.", "info")
         else:
             # Handle API Key
@@ -442,6 +465,7 @@ def settings():
             if api_key:
                 user = api.get_user(api_key)
                 session["api_key"] = api_key
+                set_scheduler_api_key(api_key)
                 if user:
                     session["user"] = user
                     flash(f"Logged in as {user.get('username', 'Unknown')}", "success")
@@ -459,6 +483,8 @@ def settings():
                         setting = Setting(key=dir_key)
                         db.session.add(setting)
                     setting.value = dir_value
+
+            update_checker.set_auto_queue(request.form.get("auto_queue_updates") == "on")
             
             db.session.commit()
             flash("Settings saved.", "success")
@@ -474,7 +500,19 @@ def settings():
         setting = Setting.query.get(f"dir_{model_type}")
         directories[model_type] = setting.value if setting else ""
         
-    return render_template("settings.html", api_key=api_key, user=user, model_types=MODEL_TYPES, directories=directories)
+    unresolved = UnresolvedHash.query.order_by(UnresolvedHash.path).all()
+
+    from app.dedup import find_duplicates, summarize
+    duplicates = summarize(find_duplicates())
+
+    from app.scan_sessions import resumable_session
+    unfinished_scan = resumable_session()
+
+    return render_template("settings.html", api_key=api_key, user=user, model_types=MODEL_TYPES, directories=directories,
+                           unresolved=unresolved, auto_queue_updates=update_checker.auto_queue_enabled(),
+                           last_update_check=update_checker.last_check(),
+                           updates_available=UpdateCheck.query.filter_by(update_available=True).count(),
+                           duplicates=duplicates, unfinished_scan=unfinished_scan)
 
 
 @main.route("/download/<int:model_id>/<int:version_id>")
@@ -489,10 +527,157 @@ def download(model_id, version_id):
     flash("Download added to queue.", "info")
     return redirect(request.referrer or url_for("main.model_detail", model_id=model_id))
 
+def _bulk_args(values):
+    return {
+        "source": values.get("source", "creator"),
+        "value": values.get("value", ""),
+        "versions": values.get("versions", "latest"),
+        "base_model": values.get("base_model") or None,
+        "model_type": values.get("type") or None,
+    }
+
+@main.route("/bulk")
+def bulk():
+    from app.bulk import SOURCES, VERSION_RULES, build_plan
+
+    args = _bulk_args(request.args)
+    plan = None
+    if args["value"]:
+        try:
+            plan = build_plan(api_key=session.get("api_key"), **args)
+        except ValueError as e:
+            flash(str(e), "warning")
+        except Exception as e:
+            flash(f"Error building download plan: {e}", "error")
+    return render_template(
+        "bulk.html",
+        plan=plan,
+        args=args,
+        sources=SOURCES,
+        version_rules=VERSION_RULES,
+        model_types=MODEL_TYPES,
+        base_models=BASE_MODELS,
+    )
+
+@main.route("/bulk", methods=["POST"])
+def bulk_queue():
+    from app.bulk import build_plan, submit_plan
+
+    api_key = session.get("api_key")
+    if not api_key:
+        flash("You must be logged in to download models.", "warning")
+        return redirect(url_for("main.settings"))
+
+    args = _bulk_args(request.form)
+    query = {k if k != "model_type" else "type": v for k, v in args.items() if v}
+    try:
+        plan = build_plan(api_key=api_key, **args)
+    except ValueError as e:
+        flash(str(e), "warning")
+        return redirect(url_for("main.bulk", **query))
+    except Exception as e:
+        flash(f"Error building download plan: {e}", "error")
+        return redirect(url_for("main.bulk", **query))
+
+    if not plan["enough_space"] and request.form.get("force") != "1":
+        flash("Not enough free space for this plan; free some space or confirm to queue it anyway.", "warning")
+        return redirect(url_for("main.bulk", **query))
+    task = submit_plan(plan, api_key)
+    if task is None:
+        flash("Everything in this plan is already in the library.", "info")
+    else:
+        flash(f"Queued {plan['counts']['download']} download(s), "
+              f"{plan['download_bytes'] / 1024 ** 3:.2f} GB, as one batch.", "info")
+    return redirect(url_for("main.bulk", **query))
+
+@main.route("/api/bulk/plan", methods=["POST"])
+def api_bulk_plan():
+    from app.bulk import build_plan
+
+    try:
+        plan = build_plan(api_key=session.get("api_key"), **_bulk_args(request.get_json(silent=True) or {}))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(plan)
+
+@main.route("/api/bulk/queue", methods=["POST"])
+def api_bulk_queue():
+    from app.bulk import build_plan, submit_plan
+
+    api_key = session.get("api_key")
+    if not api_key:
+        return jsonify({"error": "You must be logged in to download models."}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        plan = build_plan(api_key=api_key, **_bulk_args(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not plan["enough_space"] and not data.get("force"):
+        return jsonify({"error": "Not enough free space", "directories": plan["directories"]}), 409
+    task = submit_plan(plan, api_key)
+    return jsonify({"job": task, "counts": plan["counts"], "download_bytes": plan["download_bytes"]})
+
+@main.route("/img")
+def image_proxy():
+    from app.image_proxy import fetch_image, is_allowed
+
+    url = request.args.get("url", "")
+    if not is_allowed(url):
+        return jsonify({"error": "Image host not allowed"}), 400
+    try:
+        path, mimetype = fetch_image(url)
+    except Exception as e:
+        print(f"Image proxy could not fetch {url}: {e}")
+        return jsonify({"error": "Could not fetch image"}), 502
+    # Files are named by the hash of their URL; their mtime tracks recency, not content
+    etag = os.path.splitext(os.path.basename(path))[0]
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=current_app.config["IMAGE_PROXY_MAX_AGE"])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@main.route("/api/images/stats")
+def image_proxy_stats():
+    from app.image_proxy import stats
+
+    return jsonify(stats())
+
+@main.app_template_filter("proxied")
+def proxied_image(url):
+    from app.image_proxy import proxied_url
+
+    return proxied_url(url)
+
+@main.app_template_global("image_attrs")
+def responsive_image_attrs(image, slot="card"):
+    from app.image_variants import image_attrs
+
+    return image_attrs(image, slot)
+
 @main.route("/api/downloads/status")
 def download_status():
     return jsonify(download_manager.get_status())
 
+@main.route("/api/typeahead")
+def typeahead_suggestions():
+    from app.typeahead import suggest
+
+    kinds = set(filter(None, request.args.get("kinds", "").split(","))) or None
+    limit = min(request.args.get("limit", 8, type=int), 50)
+    return jsonify({"q": request.args.get("q", ""), "results": suggest(request.args.get("q", ""), limit, kinds)})
+
+@main.route("/api/upstream/status")
+def upstream_status():
+    from app.upstream import governor
+
+    return jsonify(governor.stats())
+
+@main.route("/api/database/status")
+def database_status():
+    from app import database
+
+    return jsonify(database.status())
+
 @main.route("/settings/scan", methods=["POST"])
 def scan_library():
     api_key = session.get("api_key")
@@ -500,8 +685,151 @@ def scan_library():
     # Yes, but API lookup might be rate limited or restricted.
     # But we pass api_key if available.
     
-    download_manager.add_task(task_type='scan', api_key=api_key)
-    flash("Library scan started in background.", "info")
+    fresh = request.form.get("fresh") == "1"
+    download_manager.add_task(task_type='scan', api_key=api_key, fresh=fresh)
+    flash("Library scan started over in background." if fresh else "Library scan started in background.", "info")
+    return redirect(url_for("main.settings"))
+
+@main.route("/api/downloads/<int:job_id>/cancel", methods=["POST"])
+def cancel_task(job_id):
+    status = download_manager.cancel(job_id)
+    if status is None:
+        return jsonify({"error": "Only queued tasks and running scans or batches can be cancelled."}), 409
+    return jsonify({"id": job_id, "status": status})
+
+@main.route("/api/library/scan")
+def scan_session_status():
+    from app.scan_sessions import latest_session
+
+    scan = latest_session()
+    return jsonify(scan.to_dict() if scan else None)
+
+@main.route("/settings/unresolved/retry", methods=["POST"])
+def retry_unresolved_files():
+    from app.scanner import retry_unresolved
+
+    count = retry_unresolved(request.form.get("sha256"))
+    download_manager.add_task(task_type='scan', api_key=session.get("api_key"))
+    flash(f"Retrying {count} unidentified file(s); library scan started in background.", "info")
+    return redirect(url_for("main.settings"))
+
+@main.route("/api/library/unresolved")
+def unresolved_files():
+    entries = UnresolvedHash.query.order_by(UnresolvedHash.path).all()
+    return jsonify([entry.to_dict() for entry in entries])
+
+@main.route("/api/library/unresolved/retry", methods=["POST"])
+def api_retry_unresolved():
+    from app.scanner import retry_unresolved
+
+    data = request.get_json(silent=True) or {}
+    count = retry_unresolved(data.get("sha256") or request.args.get("sha256"))
+    task = None
+    if data.get("scan", True):
+        task = download_manager.add_task(task_type='scan', api_key=session.get("api_key"))
+    return jsonify({"retrying": count, "scan_queued": task is not None})
+
+@main.route("/settings/updates/check", methods=["POST"])
+def check_for_updates():
+    download_manager.add_task(task_type='update_check', api_key=session.get("api_key"))
+    flash("Update check started in background.", "info")
+    return redirect(request.referrer or url_for("main.settings"))
+
+@main.route("/api/library/updates")
+def library_updates():
+    checks = UpdateCheck.query.filter_by(update_available=True).order_by(UpdateCheck.name).all()
+    last = update_checker.last_check()
+    return jsonify({
+        "last_check": last.isoformat() if last else None,
+        "updates": [check.to_dict() for check in checks],
+    })
+
+@main.route("/api/library/updates/check", methods=["POST"])
+def api_check_for_updates():
+    task = download_manager.add_task(task_type='update_check', api_key=session.get("api_key"))
+    return jsonify({"status": task["status"]})
+
+@main.route("/api/library/updates/queue", methods=["POST"])
+def api_queue_updates():
+    api_key = session.get("api_key")
+    if not api_key:
+        return jsonify({"error": "You must be logged in to download models."}), 401
+    data = request.get_json(silent=True) or {}
+    return jsonify({"queued": update_checker.queue_updates(api_key, data.get("model_id"))})
+
+@main.route("/api/library/index")
+def export_library_index():
+    from app.library_index import export_index
+
+    try:
+        since = datetime.fromisoformat(request.args["since"]) if request.args.get("since") else None
+    except ValueError:
+        return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+    response = jsonify(export_index(since))
+    response.headers["Content-Disposition"] = "attachment; filename=civitr-library-index.json"
+    return response
+
+def _read_library_index():
+    if "index" in request.files:
+        return json.load(request.files["index"])
+    return request.get_json(silent=True) or {}
+
+@main.route("/api/library/index", methods=["POST"])
+def import_library_index():
+    from app.library_index import import_index
+
+    merge = (request.args.get("mode") or request.form.get("mode")) == "merge"
+    try:
+        stats = import_index(_read_library_index(), merge=merge)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    page_cache.invalidate()
+    return jsonify(stats)
+
+@main.route("/settings/library/import", methods=["POST"])
+def import_library_index_form():
+    from app.library_index import import_index
+
+    try:
+        stats = import_index(_read_library_index(), merge=request.form.get("mode") == "merge")
+    except ValueError as e:
+        flash(f"Could not import library index: {e}", "warning")
+        return redirect(url_for("main.settings"))
+    page_cache.invalidate()
+    flash(f"Imported {stats['files']} file(s) and {stats['models']} model(s); {stats['kept']} kept, "
+          f"{stats['missing']} not found here, {stats['mismatched']} different.", "success")
+    if stats['invalid']:
+        flash(f"Skipped {stats['invalid']} invalid file entr{'y' if stats['invalid'] == 1 else 'ies'} "
+              f"of the index, e.g. {stats['errors'][0]['error']}.", "warning")
+    return redirect(url_for("main.settings"))
+
+@main.route("/api/library/duplicates")
+def library_duplicates():
+    from app.dedup import find_duplicates, summarize
+
+    groups = find_duplicates()
+    return jsonify({"summary": summarize(groups), "groups": groups})
+
+@main.route("/api/library/duplicates/consolidate", methods=["POST"])
+def api_consolidate_duplicates():
+    from app.dedup import LINK_MODES
+
+    mode = (request.get_json(silent=True) or {}).get("mode", "hardlink")
+    if mode not in LINK_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(LINK_MODES)}"}), 400
+    task = download_manager.add_task(task_type='dedup', mode=mode)
+    return jsonify({"status": task["status"]})
+
+@main.route("/settings/duplicates/consolidate", methods=["POST"])
+def consolidate_duplicates():
+    from app.dedup import LINK_MODES
+
+    mode = request.form.get("mode", "hardlink")
+    if mode not in LINK_MODES:
+        flash(f"Unknown link mode {mode}.", "warning")
+    else:
+        download_manager.add_task(task_type='dedup', mode=mode)
+        flash("Duplicate consolidation started in background.", "info")
     return redirect(url_for("main.settings"))
 
 @main.context_processor
@@ -530,18 +858,33 @@ def inject_downloaded_models():
 @main.route("/library")
 def library():
     type_filter = request.args.get("type")
+    updates_only = request.args.get("updates") == "1"
     
     query = Download.query
     if type_filter:
         query = query.filter_by(type=type_filter)
+    if updates_only:
+        query = query.join(UpdateCheck, UpdateCheck.model_id == Download.model_id).filter(
+            UpdateCheck.update_available.is_(True))
         
     models = query.all()
+
+    # Results of the background update check, for the "Update" badges
+    updates = {check.model_id: check for check in UpdateCheck.query.filter_by(update_available=True)}
+
+    # Embedded header metadata (training info, architecture) keyed by model path
+    paths = [m.model_path for m in models if m.model_path]
+    headers = {}
+    if paths:
+        for local_file in LocalFile.query.filter(LocalFile.path.in_(paths)):
+            headers[local_file.path] = local_file.header_summary
     
     # Get unique types for sidebar
     all_types = db.session.query(Download.type).distinct().all()
     types = [t[0] for t in all_types if t[0]]
     
-    return render_template("library.html", models=models, types=types, current_type=type_filter)
+    return render_template("library.html", models=models, types=types, current_type=type_filter, headers=headers,
+                           updates=updates, updates_only=updates_only)
 
 @main.route("/files/<path:filename>")
 def serve_file(filename):
@@ -0,0 +1,161 @@
+import os
+import time
+from datetime import datetime
+from app import db
+from app.models import Download, LocalFile, ScanCheckpoint, ScanSession, Setting, UnresolvedHash
+from app.scanner import list_model_files, scan_directory
+
+# Work of a file unchanged since the last scan (a stat and its sidecar),
+# in bytes: new and changed files cost their size on top, for hashing
+UNCHANGED_FILE_COST = 1024 * 1024
+UNFINISHED = ('running', 'cancelled')
+
+def _directories():
+    from app.routes import MODEL_TYPES
+
+    directories = []
+    for model_type in MODEL_TYPES:
+        setting = Setting.query.get(f"dir_{model_type}")
+        if setting and setting.value and os.path.isdir(setting.value):
+            directories.append((setting.value, model_type))
+    return directories
+
+def latest_session():
+    return ScanSession.query.order_by(ScanSession.id.desc()).first()
+
+def resumable_session():
+    """The most recent scan that was cancelled or interrupted, if any."""
+    return ScanSession.query.filter(ScanSession.status.in_(UNFINISHED)).order_by(ScanSession.id.desc()).first()
+
+def _estimate_work(directories):
+    """Work per model file path, so progress and ETA follow the hashing still to do."""
+    known = {path: (size, mtime) for path, size, mtime in
+             db.session.query(LocalFile.path, LocalFile.size, LocalFile.mtime)}
+    costs = {}
+    for directory, _ in directories:
+        for filename in list_model_files(directory):
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            unchanged = known.get(path) == (stat.st_size, stat.st_mtime)
+            costs[path] = UNCHANGED_FILE_COST if unchanged else UNCHANGED_FILE_COST + stat.st_size
+    return costs
+
+def _format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds} s"
+    if seconds < 3600:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600} h {seconds % 3600 // 60:02d} min"
+
+def _finish(session):
+    """Drop downloads, files and negative-cache entries the completed scan did not find."""
+    found_ids = set(
+        db.session.query(ScanCheckpoint.model_id, ScanCheckpoint.version_id)
+        .filter(ScanCheckpoint.session_id == session.id, ScanCheckpoint.version_id.isnot(None))
+    )
+    removed_count = 0
+    for download in Download.query.all():
+        if (download.model_id, download.version_id) not in found_ids:
+            db.session.delete(download)
+            removed_count += 1
+
+    # Forget files that are gone; moved ones were re-linked during the scan
+    for local_file in LocalFile.query.all():
+        if not os.path.exists(local_file.path):
+            db.session.delete(local_file)
+    db.session.flush()
+
+    # Drop negative-cache entries for hashes no longer on disk
+    known_hashes = db.session.query(LocalFile.sha256).filter(LocalFile.sha256.isnot(None))
+    UnresolvedHash.query.filter(UnresolvedHash.sha256.notin_(known_hashes)).delete(synchronize_session=False)
+
+    ScanCheckpoint.query.filter_by(session_id=session.id).delete(synchronize_session=False)
+    session.status = 'completed'
+    session.finished_at = datetime.utcnow()
+    db.session.commit()
+    return removed_count
+
+def run_scan(api_key=None, progress_callback=None, cancel_event=None, fresh=False, job_id=None):
+    """
+    Scan every configured directory as one session.
+
+    Each scanned file is checkpointed in the same commit as its library
+    row, so a scan that is cancelled, or whose worker dies, resumes where
+    it stopped; ``fresh`` abandons an unfinished session instead. Progress
+    and the ETA cover all directories, weighted by the bytes still to hash.
+    Missing downloads are only removed once a session has seen every file.
+    Returns (success, message).
+    """
+    if fresh:
+        ScanSession.query.filter(ScanSession.status.in_(UNFINISHED)).update(
+            {'status': 'abandoned', 'finished_at': datetime.utcnow()}, synchronize_session=False)
+        session = None
+    else:
+        session = resumable_session()
+    if session is None:
+        session = ScanSession(processed_files=0, updated_count=0)
+        db.session.add(session)
+    session.status = 'running'
+    session.job_id = job_id
+
+    directories = _directories()
+    done = {path for (path,) in db.session.query(ScanCheckpoint.path).filter_by(session_id=session.id)}
+    costs = _estimate_work(directories)
+    session.total_files = len(costs)
+    db.session.commit()
+
+    total_work = sum(costs.values()) or 1
+    work_before = sum(costs[path] for path in done if path in costs)
+    progress = {'files': len(done & costs.keys()), 'work': 0}
+    started = time.monotonic()
+
+    def on_item(item, updated):
+        model_version = item.model_version or {}
+        db.session.add(ScanCheckpoint(session_id=session.id, path=item.filepath,
+                                      model_id=model_version.get('modelId'), version_id=model_version.get('id')))
+        session.processed_files += 1
+        session.updated_count += updated
+        progress['files'] += 1
+        progress['work'] += costs.get(item.filepath, UNCHANGED_FILE_COST)
+
+    def reporter(model_type):
+        def report(percentage, msg=None, **extra):
+            if not progress_callback:
+                return
+            remaining = total_work - work_before - progress['work']
+            eta = int(remaining * (time.monotonic() - started) / progress['work']) if progress['work'] else None
+            message = f"Scanning {model_type}: {progress['files']}/{len(costs)} files"
+            if eta is not None:
+                message += f", about {_format_duration(eta)} left"
+            progress_callback(min(int((work_before + progress['work']) / total_work * 100), 99), message,
+                              scan={'session': session.id, 'files_done': progress['files'],
+                                    'files_total': len(costs), 'resumed_at': len(done), 'eta_seconds': eta},
+                              **extra)
+        return report
+
+    for directory, model_type in directories:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        scan_directory(directory, model_type, api_key, reporter(model_type), skip_paths=done, on_item=on_item,
+                       cancel_event=cancel_event)
+
+    if cancel_event is not None and cancel_event.is_set():
+        session.status = 'cancelled'
+        db.session.commit()
+        return True, (f"Scan cancelled after {progress['files']} of {len(costs)} files; "
+                      f"the next scan resumes from there.")
+
+    removed_count = _finish(session)
+    message = f"Scan complete. Updated {session.updated_count} models. Removed {removed_count} missing models."
+    if done:
+        message += f" Resumed after {len(done)} files."
+
+    from app.dedup import find_duplicates, summarize
+    duplicates = summarize(find_duplicates())
+    if duplicates['reclaimable']:
+        message += (f" {duplicates['files']} duplicate files could free "
+                    f"{duplicates['reclaimable'] / 1024 ** 3:.2f} GB.")
+    return True, message
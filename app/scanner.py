@@ -1,12 +1,22 @@
 import os
 import hashlib
 import json
+import threading
+import time
+import requests
+from datetime import datetime, timedelta
 from app import api, db
-from app.models import Download, Setting
+from app.models import HASH_FROM_CONTENT, Download, Setting, LocalFile, UnresolvedHash, ModelMetadata
 from app.downloader import download_file, sanitize_filename
+from app.image_variants import sized_url
+from app.model_headers import HEADER_EXTENSIONS, HeaderError, read_header, embedded_hashes, hashes_match
+from app.pipeline import Pipeline
+from app.metadata_store import as_model, ingest_sidecar
 from flask import current_app
 
-MODEL_EXTENSIONS = {'.safetensors', '.ckpt', '.pt', '.bin'}
+MODEL_EXTENSIONS = {'.safetensors', '.ckpt', '.pt', '.bin', '.gguf'}
+COMPANION_SUFFIXES = ['.metadata.json', '.webp', '.png', '.jpg', '.jpeg', '.preview.png']
+FINGERPRINT_BLOCK_SIZE = 128 * 1024
 
 def calculate_sha256(filepath, block_size=65536):
     """Calculate SHA256 hash of a file."""
@@ -16,143 +26,570 @@ def calculate_sha256(filepath, block_size=65536):
             sha256.update(block)
     return sha256.hexdigest()
 
-def scan_directory(directory, model_type, api_key=None, progress_callback=None):
+def calculate_fingerprint(filepath, size=None, block_size=FINGERPRINT_BLOCK_SIZE):
     """
-    Scan a directory for models, identify them, and download missing metadata/images.
+    Cheap content fingerprint: the file size plus SHA256 of sampled head,
+    middle and tail blocks. Reads at most 3 * block_size bytes.
     """
-    if not os.path.exists(directory):
-        return 0, "Directory does not exist", []
+    if size is None:
+        size = os.path.getsize(filepath)
+    sha256 = hashlib.sha256(size.to_bytes(8, 'little'))
+    with open(filepath, 'rb') as f:
+        if size <= 3 * block_size:
+            sha256.update(f.read())
+        else:
+            for offset in (0, (size - block_size) // 2, size - block_size):
+                f.seek(offset)
+                sha256.update(f.read(block_size))
+    return sha256.hexdigest()
 
-    files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-    model_files = [f for f in files if os.path.splitext(f)[1].lower() in MODEL_EXTENSIONS]
-    
-    total_files = len(model_files)
-    processed = 0
-    updated_count = 0
-    found_ids = []
-    
-    for filename in model_files:
-        filepath = os.path.join(directory, filename)
-        base_name = os.path.splitext(filename)[0]
-        
-        # Report progress
-        processed += 1
-        if progress_callback:
-            progress_callback(int(processed / total_files * 100), f"Scanning {filename}...")
+def _move_companions(old_path, new_path):
+    """Carry metadata and preview files over when a model file was renamed."""
+    old_base = os.path.splitext(old_path)[0]
+    new_base = os.path.splitext(new_path)[0]
+    for suffix in COMPANION_SUFFIXES:
+        old_companion = f"{old_base}{suffix}"
+        new_companion = f"{new_base}{suffix}"
+        if os.path.exists(old_companion) and not os.path.exists(new_companion):
+            try:
+                os.replace(old_companion, new_companion)
+            except OSError as e:
+                print(f"Could not move {old_companion}: {e}")
+
+def _with_model_info(version, model):
+    """Versions nested in a model JSON lack the 'model' dict the by-hash API adds."""
+    if 'model' not in version:
+        version = dict(version, model={'name': model.get('name'), 'type': model.get('type')})
+    return version
+
+def _size_matches(file_info, size):
+    size_kb = file_info.get('sizeKB')
+    if size_kb is None:
+        return True
+    # sizeKB is rounded by the API; allow a kilobyte of slack.
+    return abs(size_kb * 1024 - size) <= 1024
+
+def identify_from_sidecar(filename, size, sidecar_model):
+    """
+    Identify a file from the model JSON saved next to it by the downloader,
+    by matching filename and size against the files of every version.
+    Only an unambiguous match is trusted. Renamed files are left to the
+    embedded weight hash, move detection or hashing.
+
+    Returns (model_version, sha256) where sha256 comes from the matched file's
+    published hashes, or (None, None). That hash was not computed from the
+    file: store it with sha256_source 'sidecar', never as a content hash.
+    """
+    if not sidecar_model:
+        return None, None
+
+    matches = []
+    for version in sidecar_model.get('modelVersions', []):
+        for file_info in version.get('files', []):
+            name = file_info.get('name') or ''
+            base, ext = os.path.splitext(name)
+            if _size_matches(file_info, size) and filename in (name, f"{sanitize_filename(base)}{ext}"):
+                matches.append((version, file_info))
+
+    if len(matches) != 1:
+        return None, None
+    version, file_info = matches[0]
+    return _with_model_info(version, sidecar_model), file_info.get('hashes', {}).get('SHA256')
+
+def identify_by_embedded_hash(header, sidecar_model=None, api_key=None):
+    """
+    Identify a file from the weight hash embedded in its header, without
+    reading the weights. Known versions from the sidecar metadata are tried
+    first, then the by-hash API.
+
+    Returns (model_version, sha256) where sha256 comes from the matched file's
+    published hashes, or (None, None). That hash was not computed from the
+    file: store it with sha256_source 'header', never as a content hash.
+    """
+    hashes = embedded_hashes(header)
+    if not hashes:
+        return None, None
+
+    if sidecar_model:
+        for version in sidecar_model.get('modelVersions', []):
+            for file_info in version.get('files', []):
+                known = file_info.get('hashes', {}).get('AutoV3')
+                if any(hashes_match(h, known) for h in hashes):
+                    return _with_model_info(version, sidecar_model), file_info['hashes'].get('SHA256')
 
-        # Check for metadata
-        metadata_path = os.path.join(directory, f"{base_name}.metadata.json")
-        image_path = os.path.join(directory, f"{base_name}.webp") # Default check
+    for embedded in hashes:
+        try:
+            version = api.get_model_version_by_hash(embedded, api_key)
+        except Exception:
+            continue
+        sha256 = None
+        verified = True
+        for file_info in version.get('files', []):
+            known = file_info.get('hashes', {}).get('AutoV3')
+            if known:
+                verified = hashes_match(embedded, known)
+                if verified:
+                    sha256 = file_info['hashes'].get('SHA256')
+                    break
+        if verified:
+            return version, sha256
+    return None, None
+
+def mark_unresolved(sha256, path, error):
+    """Record a failed lookup and schedule the next retry with exponential backoff."""
+    entry = UnresolvedHash.query.get(sha256)
+    if entry is None:
+        entry = UnresolvedHash(sha256=sha256, attempts=0)
+        db.session.add(entry)
+    entry.path = path
+    entry.attempts = (entry.attempts or 0) + 1
+    entry.last_error = str(error)[:256]
+    entry.last_attempt = datetime.utcnow()
+    hours = min(current_app.config['UNRESOLVED_RETRY_HOURS'] * 2 ** (entry.attempts - 1),
+                current_app.config['UNRESOLVED_MAX_RETRY_HOURS'])
+    entry.next_retry = entry.last_attempt + timedelta(hours=hours)
+    return entry
+
+def retry_unresolved(sha256=None):
+    """Make one (or every) cached unresolved hash due on the next scan."""
+    query = UnresolvedHash.query
+    if sha256:
+        query = query.filter_by(sha256=sha256.lower())
+    count = query.update({UnresolvedHash.next_retry: None})
+    db.session.commit()
+    return count
+
+def _is_not_found(error):
+    return isinstance(error, requests.HTTPError) and error.response is not None \
+        and error.response.status_code == 404
+
+def record_local_file(filepath, stat, header, sha256=None, model_id=None, version_id=None, local_file=None,
+                      fingerprint=None, hash_source=None):
+    """Create or update the LocalFile of ``filepath``; ``hash_source`` says where ``sha256`` came from."""
+    if local_file is None:
+        local_file = LocalFile(path=filepath)
+        db.session.add(local_file)
+    if fingerprint:
+        local_file.fingerprint = fingerprint
+    local_file.size = stat.st_size
+    local_file.mtime = stat.st_mtime
+    local_file.set_header(header)
+    if sha256:
+        local_file.sha256 = sha256.lower()
+        local_file.sha256_source = hash_source
+    if version_id:
+        local_file.model_id = model_id
+        local_file.version_id = version_id
+    return local_file
+
+
+class LibrarySnapshot:
+    """
+    What the database knows about the library, loaded once per scan so the
+    hashing and lookup stages can run on worker threads without a session.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.by_fingerprint = {}
+        for local_file in LocalFile.query.all():
+            info = {
+                'id': local_file.id,
+                'path': local_file.path,
+                'size': local_file.size,
+                'mtime': local_file.mtime,
+                'sha256': local_file.sha256,
+                'sha256_source': local_file.sha256_source,
+                'fingerprint': local_file.fingerprint,
+                'model_id': local_file.model_id,
+                'version_id': local_file.version_id,
+                'header': local_file.header,
+            }
+            self.files[local_file.path] = info
+            if local_file.fingerprint:
+                self.by_fingerprint.setdefault((local_file.fingerprint, local_file.size), []).append(info)
+        self.downloads = {
+            (d.model_id, d.version_id): (d.name, d.type) for d in Download.query.all()
+        }
+        self.unresolved = {u.sha256: u.next_retry for u in UnresolvedHash.query.all()}
+        self.metadata_mtimes = dict(
+            db.session.query(ModelMetadata.model_id, ModelMetadata.sidecar_mtime).all()
+        )
+        self._claimed = set()
+        self._lock = threading.Lock()
+
+    def claim_moved(self, fingerprint, size):
+        """A known file with this fingerprint whose recorded path is gone, claimed at most once."""
+        for info in self.by_fingerprint.get((fingerprint, size), []):
+            if os.path.exists(info['path']):
+                continue
+            with self._lock:
+                if info['id'] in self._claimed:
+                    continue
+                self._claimed.add(info['id'])
+            return info
+        return None
+
+    def known_version(self, model_id, version_id, sidecar_model=None):
+        """Rebuild a version object for an already identified file without the API."""
+        if sidecar_model and sidecar_model.get('id') == model_id:
+            for version in sidecar_model.get('modelVersions', []):
+                if version.get('id') == version_id:
+                    return _with_model_info(version, sidecar_model)
+        if (model_id, version_id) in self.downloads:
+            name, type = self.downloads[(model_id, version_id)]
+            return {'id': version_id, 'modelId': model_id, 'model': {'name': name, 'type': type}}
+        return None
+
+    def unresolved_due(self, sha256):
+        """False while a hash is in the negative cache and not yet due for a retry."""
+        if sha256 not in self.unresolved:
+            return True
+        next_retry = self.unresolved[sha256]
+        return next_retry is None or next_retry <= datetime.utcnow()
+
+
+class ScanItem:
+    """One model file travelling through the scan pipeline."""
+
+    def __init__(self, directory, filename):
+        self.directory = directory
+        self.filename = filename
+        self.filepath = os.path.join(directory, filename)
+        self.base_name = os.path.splitext(filename)[0]
+        self.stat = None
+        self.known = None
+        self.unchanged = False
+        self.moved_from = None
+        self.fingerprint = None
+        self.header = None
+        self.sidecar_model = None
+        self.model_version = None
+        self.file_hash = None
+        self.hash_source = None # see LocalFile.sha256_source
+        self.skipped = False
+        self.not_found = False
+        self.error = None
+        self.downloaded_files = None
+        self.updated = 0
+
+    def locate_companions(self):
+        self.metadata_path = os.path.join(self.directory, f"{self.base_name}.metadata.json")
+        self.image_path = os.path.join(self.directory, f"{self.base_name}.webp") # Default check
         # Also check other image exts if webp missing
-        if not os.path.exists(image_path):
+        if not os.path.exists(self.image_path):
             for ext in ['.png', '.jpg', '.jpeg', '.preview.png']:
-                alt_path = os.path.join(directory, f"{base_name}{ext}")
+                alt_path = os.path.join(self.directory, f"{self.base_name}{ext}")
                 if os.path.exists(alt_path):
-                    image_path = alt_path
+                    self.image_path = alt_path
                     break
 
-        model_version = None
-        
-        # 1. Try to load from metadata
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'r') as f:
-                    data = json.load(f)
-                    # Check if it looks like a model version or model
-                    if 'id' in data and 'modelId' in data:
-                        # It's likely a version object (from get_model_version)
-                        # Or a model object (from get_model) which has 'id' as modelId.
-                        # Wait, get_model returns model object. get_model_version returns version object.
-                        # Our downloader saves the *Model* object (with versions list).
-                        # If we saved the model object, data['id'] is model_id.
-                        # But we need version_id.
-                        # If we saved model object, we can't easily know which version this file belongs to 
-                        # unless we match filename to files in versions.
-                        pass
-            except:
-                pass
-
-        # 2. If not identified or missing metadata, calculate hash
-        if not model_version:
+    def load_sidecar(self):
+        if not os.path.exists(self.metadata_path):
+            return
+        try:
+            with open(self.metadata_path, 'r') as f:
+                self.sidecar_model = as_model(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Could not read metadata for {self.filename}: {e}")
+
+
+def _discover(directory, model_files, snapshot):
+    """
+    Source stage: stat each file and identify it from what is already known
+    (sidecar metadata, unchanged database rows). Never reads model bytes.
+    """
+    for filename in model_files:
+        item = ScanItem(directory, filename)
+        try:
+            item.stat = os.stat(item.filepath)
+        except OSError as e:
+            item.error = e
+            yield item
+            continue
+
+        known = snapshot.files.get(item.filepath)
+        if known:
+            item.known = known
+            item.unchanged = known['size'] == item.stat.st_size and known['mtime'] == item.stat.st_mtime
+        if item.unchanged:
+            item.file_hash = known['sha256']
+            item.hash_source = known['sha256_source']
+            item.fingerprint = known['fingerprint']
+
+        item.locate_companions()
+
+        # 1. Try to identify from the saved metadata (no hashing, no API)
+        item.load_sidecar()
+        item.model_version, sidecar_hash = identify_from_sidecar(filename, item.stat.st_size, item.sidecar_model)
+        if item.model_version and not item.file_hash:
+            item.file_hash, item.hash_source = sidecar_hash, 'sidecar'
+
+        # 2. Reuse the identity of a known, unchanged file
+        if not item.model_version and item.unchanged and known['version_id']:
+            item.model_version = snapshot.known_version(known['model_id'], known['version_id'], item.sidecar_model)
+
+        yield item
+
+
+def _hash_stage(snapshot):
+    def run(item):
+        if item.error:
+            return item
+
+        # New paths are fingerprinted to detect renames and moves
+        if not item.fingerprint:
+            item.fingerprint = calculate_fingerprint(item.filepath, item.stat.st_size)
+            if not item.known:
+                moved = snapshot.claim_moved(item.fingerprint, item.stat.st_size)
+                if moved:
+                    print(f"Detected move of {moved['path']} to {item.filepath}")
+                    _move_companions(moved['path'], item.filepath)
+                    item.moved_from = moved
+                    item.unchanged = True
+                    if not item.file_hash:
+                        item.file_hash, item.hash_source = moved['sha256'], moved['sha256_source']
+                    item.locate_companions()
+                    item.load_sidecar()
+                    if not item.model_version and moved['version_id']:
+                        item.model_version = snapshot.known_version(moved['model_id'], moved['version_id'],
+                                                                    item.sidecar_model)
+
+        if os.path.splitext(item.filename)[1].lower() in HEADER_EXTENSIONS:
+            cached = item.known if item.unchanged else item.moved_from
+            if cached and cached['header']:
+                item.header = json.loads(cached['header'])
+            else:
+                try:
+                    item.header = read_header(item.filepath)
+                except (OSError, HeaderError) as e:
+                    print(f"Could not read header of {item.filepath}: {e}")
+
+        # Hash now unless identified, or the embedded weight hash may spare us the read
+        if not item.model_version and not item.file_hash and not embedded_hashes(item.header):
+            item.file_hash, item.hash_source = calculate_sha256(item.filepath), HASH_FROM_CONTENT
+        return item
+    return run
+
+
+def _identify_stage(snapshot, api_key):
+    def run(item):
+        if item.error or item.model_version:
+            return item
+
+        # 3. Try the weight hash embedded in the safetensors header
+        if not item.file_hash:
+            item.model_version, item.file_hash = identify_by_embedded_hash(item.header, item.sidecar_model, api_key)
+            if item.model_version:
+                item.hash_source = 'header'
+                return item
+            item.file_hash, item.hash_source = calculate_sha256(item.filepath), HASH_FROM_CONTENT
+
+        # 4. Look the hash up, unless it is a known local-only file not yet due for a retry
+        if not snapshot.unresolved_due(item.file_hash):
+            item.skipped = True
+            return item
+        try:
+            item.model_version = api.get_model_version_by_hash(item.file_hash, api_key)
+        except Exception as e:
+            print(f"Failed to identify {item.filename}: {e}")
+            item.not_found = _is_not_found(e)
+            item.error = e
+        return item
+    return run
+
+
+def _fetch_stage(api_key):
+    # Stage workers run outside the app context
+    app = current_app._get_current_object()
+    preview_width = app.config['PREVIEW_IMAGE_WIDTH']
+
+    def run(item):
+        if item.error or not item.model_version:
+            return item
+
+        # 5. Download missing files
+        model_version = item.model_version
+        downloaded_files = {'model': item.filepath}
+
+        # Metadata
+        if not os.path.exists(item.metadata_path):
+            # Downloader saves `api.get_model(model_id)`; do the same to be consistent.
             try:
-                file_hash = calculate_sha256(filepath)
-                model_version = api.get_model_version_by_hash(file_hash, api_key)
+                full_model = api.get_model(model_version['modelId'], api_key)
+                with open(item.metadata_path, 'w') as f:
+                    json.dump(full_model, f, indent=4)
+                item.sidecar_model = full_model
+                downloaded_files['metadata'] = item.metadata_path
+                item.updated += 1
             except Exception as e:
-                print(f"Failed to identify {filename}: {e}")
-                continue
+                print(f"Failed to download metadata for {item.filename}: {e}")
+        else:
+            downloaded_files['metadata'] = item.metadata_path
 
-        if model_version:
-            # We identified the version!
-            version_id = model_version['id']
-            model_id = model_version['modelId']
-            
-            # Fetch full model details to get type and name if needed, 
-            # but model_version usually has model info too?
-            # get_model_version_by_hash returns the version object.
-            # It usually contains 'model' dict with name and type.
-            
-            model_name = model_version.get('model', {}).get('name', 'Unknown Model')
-            model_type_api = model_version.get('model', {}).get('type', model_type)
-            
-            # 3. Download missing files
-            downloaded_files = {'model': filepath}
-            
-            # Metadata
-            if not os.path.exists(metadata_path):
-                # We need full model details for the metadata file we usually save?
-                # Downloader saves `api.get_model(model_id)`.
-                # Let's do that to be consistent.
+        # Image
+        if not os.path.exists(item.image_path):
+            if model_version.get('images'):
+                preview = model_version['images'][0]
+                image_url = preview['url']
+                # Determine ext
+                if '.png' in image_url: ext = '.png'
+                elif '.jpg' in image_url or '.jpeg' in image_url: ext = '.jpg'
+                else: ext = '.webp'
+                # A preview-sized variant rather than the multi-MB original, as the downloader saves
+                if not preview.get('width') or preview['width'] > preview_width:
+                    with app.app_context():
+                        image_url = sized_url(image_url, preview_width)
+
+                new_image_path = os.path.join(item.directory, f"{item.base_name}{ext}")
                 try:
-                    full_model = api.get_model(model_id, api_key)
-                    with open(metadata_path, 'w') as f:
-                        json.dump(full_model, f, indent=4)
-                    downloaded_files['metadata'] = metadata_path
-                    updated_count += 1
+                    download_file(image_url, new_image_path, api_key)
+                    downloaded_files['image'] = new_image_path
+                    item.updated += 1
                 except Exception as e:
-                    print(f"Failed to download metadata for {filename}: {e}")
+                    print(f"Failed to download image for {item.filename}: {e}")
+        else:
+            downloaded_files['image'] = item.image_path
 
-            else:
-                downloaded_files['metadata'] = metadata_path
-
-            # Image
-            if not os.path.exists(image_path):
-                if model_version.get('images'):
-                    image_url = model_version['images'][0]['url']
-                    # Determine ext
-                    if '.png' in image_url: ext = '.png'
-                    elif '.jpg' in image_url or '.jpeg' in image_url: ext = '.jpg'
-                    else: ext = '.webp'
-                    
-                    new_image_path = os.path.join(directory, f"{base_name}{ext}")
-                    try:
-                        download_file(image_url, new_image_path, api_key)
-                        downloaded_files['image'] = new_image_path
-                        updated_count += 1
-                    except Exception as e:
-                        print(f"Failed to download image for {filename}: {e}")
-            else:
-                downloaded_files['image'] = image_path
-
-            # 4. Update Database
-            # Check if exists
-            existing = Download.query.filter_by(model_id=model_id, version_id=version_id).first()
-            if not existing:
-                download = Download(
-                    model_id=model_id,
-                    version_id=version_id,
-                    name=model_name,
-                    type=model_type_api
-                )
-                download.set_files(downloaded_files)
-                db.session.add(download)
-                updated_count += 1
-            else:
-                # Update files if changed
-                existing.set_files(downloaded_files)
-            
+        item.downloaded_files = downloaded_files
+        return item
+    return run
+
+
+def _write_item(item, model_type, snapshot):
+    """
+    Sink stage, on the calling thread: apply one scanned file to the database.
+    Returns the number of updated models.
+    """
+    if item.stat is None:
+        return 0
+
+    if item.moved_from:
+        local_file = LocalFile.query.get(item.moved_from['id'])
+        local_file.path = item.filepath
+    elif item.known:
+        local_file = LocalFile.query.get(item.known['id'])
+        if local_file and not item.unchanged:
+            local_file.sha256 = local_file.sha256_source = local_file.fingerprint = local_file.header = None
+            local_file.model_id = local_file.version_id = None
+    else:
+        local_file = None
+
+    if not item.model_version:
+        if item.not_found and item.file_hash:
+            mark_unresolved(item.file_hash, item.filepath, item.error)
+        record_local_file(item.filepath, item.stat, item.header, item.file_hash, local_file=local_file,
+                          fingerprint=item.fingerprint, hash_source=item.hash_source)
+        return 0
+
+    # 6. Update Database
+    updated_count = item.updated
+    version_id = item.model_version['id']
+    model_id = item.model_version['modelId']
+    model_name = item.model_version.get('model', {}).get('name', 'Unknown Model')
+    model_type_api = item.model_version.get('model', {}).get('type', model_type)
+
+    if item.file_hash and item.file_hash.lower() in snapshot.unresolved:
+        entry = UnresolvedHash.query.get(item.file_hash.lower())
+        if entry:
+            db.session.delete(entry)
+
+    existing = Download.query.filter_by(model_id=model_id, version_id=version_id).first()
+    if not existing:
+        download = Download(
+            model_id=model_id,
+            version_id=version_id,
+            name=model_name,
+            type=model_type_api
+        )
+        download.set_files(item.downloaded_files)
+        db.session.add(download)
+        updated_count += 1
+    else:
+        # Update files if changed
+        existing.set_files(item.downloaded_files)
+
+    record_local_file(item.filepath, item.stat, item.header, item.file_hash, model_id, version_id, local_file,
+                      item.fingerprint, item.hash_source)
+
+    # Keep the local metadata store in step with the sidecar for offline detail pages
+    if item.sidecar_model and item.sidecar_model.get('id') == model_id:
+        stored_mtime = snapshot.metadata_mtimes.get(model_id)
+        try:
+            mtime = os.path.getmtime(item.metadata_path)
+            if stored_mtime is None or stored_mtime < mtime:
+                ingest_sidecar(item.metadata_path, item.sidecar_model)
+                snapshot.metadata_mtimes[model_id] = mtime
+        except OSError as e:
+            print(f"Could not store metadata for {item.filename}: {e}")
+    return updated_count
+
+
+def list_model_files(directory):
+    """Names of the model files directly inside ``directory``."""
+    files = [f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
+    return [f for f in files if os.path.splitext(f)[1].lower() in MODEL_EXTENSIONS]
+
+
+def scan_directory(directory, model_type, api_key=None, progress_callback=None, skip_paths=None, on_item=None,
+                   cancel_event=None):
+    """
+    Scan a directory for models, identify them, and download missing metadata/images.
+
+    Files stream through a pipeline of bounded stages so disk and network
+    work overlap: discovery -> hashing -> identification -> companion fetch,
+    with database writes on the calling thread.
+
+    Paths in ``skip_paths`` are left alone. ``on_item(item, updated)`` runs
+    after each file is written, in the same transaction. Setting
+    ``cancel_event`` stops the scan after committing the files done so far.
+    """
+    if not os.path.exists(directory):
+        return 0, "Directory does not exist", []
+
+    model_files = list_model_files(directory)
+    if skip_paths:
+        model_files = [f for f in model_files if os.path.join(directory, f) not in skip_paths]
+    
+    total_files = len(model_files)
+    processed = 0
+    updated_count = 0
+    found_ids = []
+
+    config = current_app.config
+    snapshot = LibrarySnapshot()
+    pipeline = Pipeline(queue_size=config['SCAN_QUEUE_SIZE'])
+    pipeline.add_stage('hashing', _hash_stage(snapshot), config['SCAN_HASH_WORKERS'])
+    pipeline.add_stage('identification', _identify_stage(snapshot, api_key), config['SCAN_LOOKUP_WORKERS'])
+    pipeline.add_stage('companions', _fetch_stage(api_key), config['SCAN_FETCH_WORKERS'])
+
+    last_commit = time.monotonic()
+    for item in pipeline.run(_discover(directory, model_files, snapshot)):
+        processed += 1
+        updated = _write_item(item, model_type, snapshot)
+        updated_count += updated
+        if item.model_version:
+            found_ids.append((item.model_version['modelId'], item.model_version['id']))
+        if on_item:
+            on_item(item, updated)
+
+        if processed % config['SCAN_COMMIT_EVERY'] == 0 or time.monotonic() - last_commit > 1:
             db.session.commit()
-            
-            # Add to found list
-            found_ids.append((model_id, version_id))
+            last_commit = time.monotonic()
+
+        # Report progress
+        if progress_callback:
+            progress_callback(int(processed / total_files * 100), f"Scanned {item.filename}",
+                              stages=pipeline.stats('discovery'))
+
+        if cancel_event is not None and cancel_event.is_set():
+            # Leaving the loop cancels the pipeline; files in flight are redone next time
+            break
+
+    db.session.commit()
+    if cancel_event is not None and cancel_event.is_set():
+        return updated_count, f"Scan cancelled after {processed} of {total_files} files.", found_ids
+    if progress_callback and total_files:
+        progress_callback(100, f"Scanned {total_files} files", stages=pipeline.stats('discovery'))
 
     return updated_count, f"Scanned {total_files} files, updated {updated_count} models.", found_ids
@@ -226,4 +226,98 @@ document.addEventListener("DOMContentLoaded", function () {
       });
     });
   }
+
+  // Typeahead suggestions from the local tag/creator/model index.
+  // data-typeahead="tag,creator" limits the kinds; with data-typeahead-field
+  // the chosen name is added to the form as that field instead of navigating.
+  document.querySelectorAll("input[data-typeahead]").forEach(function (input) {
+    var menu = document.createElement("div");
+    menu.className = "dropdown-menu typeahead-menu";
+    input.parentNode.classList.add("position-relative");
+    input.parentNode.appendChild(menu);
+    input.setAttribute("autocomplete", "off");
+
+    var cache = {};
+    var timer = null;
+    var active = -1;
+
+    function choose(item) {
+      var field = input.dataset.typeaheadField;
+      if (field) {
+        var hidden = document.createElement("input");
+        hidden.type = "hidden";
+        hidden.name = field;
+        hidden.value = item.name;
+        input.form.appendChild(hidden);
+        input.value = "";
+        input.form.submit();
+      } else {
+        window.location = item.url;
+      }
+    }
+
+    function render(results) {
+      menu.innerHTML = "";
+      active = -1;
+      results.forEach(function (item) {
+        var link = document.createElement("a");
+        link.className = "dropdown-item d-flex justify-content-between";
+        link.href = item.url;
+        link.textContent = item.name;
+        var kind = document.createElement("small");
+        kind.className = "text-muted ms-3";
+        kind.textContent = item.kind;
+        link.appendChild(kind);
+        link.addEventListener("mousedown", function (e) {
+          e.preventDefault();
+          choose(item);
+        });
+        menu.appendChild(link);
+      });
+      menu.classList.toggle("show", results.length > 0);
+    }
+
+    function lookup() {
+      var q = input.value.trim();
+      if (!q) {
+        render([]);
+        return;
+      }
+      if (cache[q]) {
+        render(cache[q]);
+        return;
+      }
+      var url = "/api/typeahead?q=" + encodeURIComponent(q) + "&kinds=" + encodeURIComponent(input.dataset.typeahead);
+      fetch(url)
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          cache[data.q.trim()] = data.results;
+          if (data.q.trim() === input.value.trim()) render(data.results);
+        })
+        .catch(function (err) { console.error("Typeahead failed:", err); });
+    }
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(lookup, 60);
+    });
+    input.addEventListener("keydown", function (e) {
+      var items = menu.querySelectorAll(".dropdown-item");
+      if (!items.length || !menu.classList.contains("show")) return;
+      if (e.key === "ArrowDown" || e.key === "ArrowUp") {
+        e.preventDefault();
+        if (active >= 0) items[active].classList.remove("active");
+        active = (active + (e.key === "ArrowDown" ? 1 : items.length - 1)) % items.length;
+        items[active].classList.add("active");
+      } else if (e.key === "Enter" && active >= 0) {
+        e.preventDefault();
+        items[active].dispatchEvent(new MouseEvent("mousedown"));
+      } else if (e.key === "Escape") {
+        render([]);
+      }
+    });
+    input.addEventListener("blur", function () {
+      menu.classList.remove("show");
+    });
+  });
 });
@@ -0,0 +1,232 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import url_for
+from app import api, db
+from app.models import Download, Job, Setting, TypeaheadTerm
+
+PAGE_SIZE = 200
+VERSION_KEY = 'typeahead_version' # bumped after every stored page
+REFRESHED_KEY = 'typeahead_refreshed' # when the last full refresh finished
+CURSOR_KEY = 'typeahead_cursor_{}' # next page of an interrupted refresh
+# Web processes check the version this often and rebuild the index if it changed
+RELOAD_SECONDS = 30
+# Results for prefixes up to this length are precomputed, their ranges are huge
+SHORT_PREFIX = 2
+SHORT_PREFIX_RESULTS = 50
+SCHEDULER_POLL_SECONDS = 600
+
+_SEPARATORS = re.compile(r'[\s_\-/.,:()]+')
+SOURCES = [
+    # kind, API call, name field
+    ('tag', api.get_tags, 'name'),
+    ('creator', api.get_creators, 'username'),
+]
+
+class PrefixIndex:
+    """
+    Sorted in-memory index of suggestion keys. A name is findable by its
+    start and by the start of each of its words. Lookups are a bisect plus,
+    for short prefixes, a precomputed top list per kind.
+    """
+
+    def __init__(self, terms):
+        entries = []
+        for kind, name, weight, ref_id in terms:
+            term = (kind, name, weight or 0, ref_id)
+            lowered = name.lower()
+            keys = {lowered}
+            for match in _SEPARATORS.finditer(lowered):
+                if match.end() < len(lowered):
+                    keys.add(lowered[match.end():])
+            for key in keys:
+                entries.append((key, term))
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [key for key, _ in entries]
+        self.terms = [term for _, term in entries]
+
+        short = {}
+        for key, term in entries:
+            for length in range(1, SHORT_PREFIX + 1):
+                if len(key) >= length:
+                    short.setdefault(key[:length], {}).setdefault(term[0], {})[term[:2]] = term
+        # Per kind, so a filtered lookup never comes up empty behind more common kinds
+        self.short = {
+            prefix: {kind: heapq.nlargest(SHORT_PREFIX_RESULTS, terms.values(), key=_rank)
+                     for kind, terms in by_kind.items()}
+            for prefix, by_kind in short.items()
+        }
+
+    def __len__(self):
+        return len(self.terms)
+
+    def search(self, prefix, limit=10, kinds=None):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            candidates = [term for kind, terms in self.short.get(prefix, {}).items()
+                          if not kinds or kind in kinds for term in terms]
+        else:
+            lo = bisect.bisect_left(self.keys, prefix)
+            hi = bisect.bisect_left(self.keys, prefix + '\uffff', lo)
+            candidates = self.terms[lo:hi]
+            if kinds:
+                candidates = [term for term in candidates if term[0] in kinds]
+
+        results = {}
+        for term in heapq.nlargest(limit * 2, candidates, key=_rank):
+            results.setdefault(term[:2], term)
+            if len(results) >= limit:
+                break
+        return list(results.values())
+
+def _rank(term):
+    return (term[2], -len(term[1]))
+
+_index = None
+_index_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def _get_setting(key):
+    setting = Setting.query.get(key)
+    return setting.value if setting else None
+
+def _set_setting(key, value):
+    setting = Setting.query.get(key)
+    if not setting:
+        setting = Setting(key=key)
+        db.session.add(setting)
+    setting.value = value
+
+def get_index():
+    """The process-wide index, rebuilt from the database when a refresh stored new terms."""
+    global _index, _index_version, _checked_at
+    if _index is not None and time.monotonic() - _checked_at < RELOAD_SECONDS:
+        return _index
+    with _lock:
+        version = _get_setting(VERSION_KEY)
+        if _index is None or version != _index_version:
+            terms = db.session.query(TypeaheadTerm.kind, TypeaheadTerm.name, TypeaheadTerm.weight,
+                                     TypeaheadTerm.ref_id).all()
+            _index = PrefixIndex(terms)
+            _index_version = version
+        _checked_at = time.monotonic()
+    return _index
+
+def suggest(prefix, limit=10, kinds=None):
+    results = []
+    for kind, name, weight, ref_id in get_index().search(prefix, limit, kinds):
+        if kind == 'tag':
+            url = url_for('main.models', tags=name)
+        elif kind == 'model':
+            url = url_for('main.model_detail', model_id=ref_id)
+        else:
+            url = url_for('main.search', q=name)
+        results.append({'kind': kind, 'name': name, 'weight': weight, 'url': url})
+    return results
+
+def _upsert(kind, items):
+    """Store (name, weight, ref_id) items of one kind; returns the numbers of new and of changed terms."""
+    names = [name for name, _, _ in items]
+    existing = {term.name: term for term in TypeaheadTerm.query.filter(
+        TypeaheadTerm.kind == kind, TypeaheadTerm.name.in_(names))} if names else {}
+    added = changed = 0
+    for name, weight, ref_id in items:
+        term = existing.get(name)
+        if term is None:
+            term = TypeaheadTerm(kind=kind, name=name)
+            db.session.add(term)
+            existing[name] = term
+            added += 1
+        elif term.weight != weight or term.ref_id != ref_id:
+            changed += 1
+        if term.weight != weight:
+            term.weight = weight
+        if term.ref_id != ref_id:
+            term.ref_id = ref_id
+    return added, changed
+
+def _bump_version():
+    _set_setting(VERSION_KEY, datetime.utcnow().isoformat())
+
+def refresh(api_key=None, progress_callback=None):
+    """
+    Page all tags and creators from the API into the suggestion table, and
+    add the names of library models. Every run fetches every page again,
+    since the API offers no way to ask what changed; only pages that add
+    or change terms are written and published to the web processes. Each
+    page is committed as it arrives, and an interrupted refresh resumes
+    from its last page. Returns a status message.
+    """
+    added = 0
+    for position, (kind, fetch, name_field) in enumerate(SOURCES):
+        cursor_key = CURSOR_KEY.format(kind)
+        page = int(_get_setting(cursor_key) or 1)
+        while True:
+            response = fetch({'limit': PAGE_SIZE, 'page': page}, api_key=api_key)
+            items = response.get('items', [])
+            page_added, page_changed = _upsert(kind, [
+                (item[name_field][:256], item.get('modelCount') or 0, None)
+                for item in items if item.get(name_field)
+            ])
+            added += page_added
+            total_pages = response.get('metadata', {}).get('totalPages')
+            page += 1
+            done = not items or (page > total_pages if total_pages else len(items) < PAGE_SIZE)
+            _set_setting(cursor_key, None if done else str(page))
+            if page_added or page_changed:
+                # Makes every web process rebuild its index
+                _bump_version()
+            db.session.commit()
+            if progress_callback:
+                share = (page - 1) / total_pages if total_pages else 0
+                progress_callback(int((position + min(share, 1)) / len(SOURCES) * 100),
+                                  f"Indexed {page - 1} page(s) of {kind}s")
+            if done:
+                break
+
+    # Names of models in the library, linking to their detail page
+    models = {}
+    for model_id, name in db.session.query(Download.model_id, Download.name):
+        # Stored names are truncated, so the stale-term delete below must compare truncated names
+        models.setdefault(name[:256], [0, model_id])[0] += 1
+    added += _upsert('model', [(name, count, model_id) for name, (count, model_id) in models.items()])[0]
+    TypeaheadTerm.query.filter(TypeaheadTerm.kind == 'model', TypeaheadTerm.name.notin_(list(models))).delete(
+        synchronize_session=False)
+
+    _set_setting(REFRESHED_KEY, datetime.utcnow().isoformat())
+    _bump_version()
+    db.session.commit()
+    return f"Search suggestions refreshed; {added} new term(s), {TypeaheadTerm.query.count()} in total."
+
+def refresh_due(interval_hours):
+    refreshed = _get_setting(REFRESHED_KEY)
+    return not refreshed or datetime.fromisoformat(refreshed) < datetime.utcnow() - timedelta(hours=interval_hours)
+
+def start_scheduler(app):
+    """Queue a refresh on the task worker when none ran for TYPEAHEAD_REFRESH_HOURS."""
+    interval_hours = app.config['TYPEAHEAD_REFRESH_HOURS']
+    if interval_hours <= 0:
+        return
+    threading.Thread(target=_schedule, args=(app, interval_hours), daemon=True).start()
+
+def _schedule(app, interval_hours):
+    from app.download_manager import download_manager, scheduler_api_key
+
+    delay = 5 # populate soon after the first start
+    while True:
+        time.sleep(delay)
+        delay = SCHEDULER_POLL_SECONDS
+        try:
+            with app.app_context():
+                pending = Job.query.filter(Job.type == 'typeahead_refresh',
+                                           Job.status.in_(['queued', 'running'])).first()
+                if not pending and refresh_due(interval_hours):
+                    download_manager.add_task(task_type='typeahead_refresh', api_key=scheduler_api_key())
+        except Exception as e:
+            print(f"Typeahead scheduler error: {e}")
@@ -0,0 +1,179 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from flask import current_app
+from app import api, db
+from app.metadata_store import store_model
+from app.models import Download, Setting, UpdateCheck
+
+LAST_CHECK_KEY = 'last_update_check'
+AUTO_QUEUE_KEY = 'auto_queue_updates'
+# How often the scheduler wakes up to see whether a check is due
+SCHEDULER_POLL_SECONDS = 600
+COMMIT_EVERY = 50
+
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+
+def _get_setting(key):
+    setting = Setting.query.get(key)
+    return setting.value if setting else None
+
+def _set_setting(key, value):
+    setting = Setting.query.get(key)
+    if not setting:
+        setting = Setting(key=key)
+        db.session.add(setting)
+    setting.value = value
+
+def auto_queue_enabled():
+    return _get_setting(AUTO_QUEUE_KEY) == 'true'
+
+def set_auto_queue(enabled):
+    _set_setting(AUTO_QUEUE_KEY, 'true' if enabled else 'false')
+
+def last_check():
+    value = _get_setting(LAST_CHECK_KEY)
+    return datetime.fromisoformat(value) if value else None
+
+def _fetch(model_id, etag, last_modified, api_key):
+    """Runs on a pool thread: network only, no database access."""
+    try:
+        model, etag, last_modified = api.get_model_if_changed(model_id, etag, last_modified, api_key)
+        return model_id, model, etag, last_modified, None
+    except Exception as e:
+        return model_id, None, etag, last_modified, e
+
+def _apply(check, model, installed):
+    """Update a check row from a fetched model (None when not modified)."""
+    if model is not None:
+        versions = model.get('modelVersions') or []
+        check.name = model.get('name') or check.name
+        if versions:
+            latest = versions[0]
+            check.latest_version_id = latest['id']
+            check.latest_version_name = latest.get('name')
+            check.latest_published_at = latest.get('publishedAt') or latest.get('createdAt')
+    check.installed_version_id = max(installed)
+    # Civitai version ids only grow, so anything above the newest installed one is newer
+    check.update_available = bool(check.latest_version_id) and \
+        check.latest_version_id not in installed and check.latest_version_id > check.installed_version_id
+
+def check_updates(api_key=None, progress_callback=None, auto_queue=None):
+    """
+    Check every downloaded model for a newer version.
+
+    Requests run on a bounded thread pool and are conditional on the ETag /
+    Last-Modified of the previous check, so unchanged models cost a 304.
+    Results are written on the calling thread. Returns a status message.
+    """
+    installed = {}
+    for model_id, version_id in db.session.query(Download.model_id, Download.version_id):
+        installed.setdefault(model_id, set()).add(version_id)
+    checks = {check.model_id: check for check in UpdateCheck.query.all()}
+
+    # Models no longer in the library
+    for model_id, check in checks.items():
+        if model_id not in installed:
+            db.session.delete(check)
+    _set_setting(LAST_CHECK_KEY, datetime.utcnow().isoformat())
+    db.session.commit()
+
+    total = len(installed)
+    done = changed = errors = 0
+    workers = current_app.config['UPDATE_CHECK_WORKERS']
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = []
+        for model_id in installed:
+            check = checks.get(model_id)
+            futures.append(pool.submit(_fetch, model_id, check.etag if check else None,
+                                       check.last_modified if check else None, api_key))
+
+        for future in as_completed(futures):
+            model_id, model, etag, last_modified, error = future.result()
+            check = checks.get(model_id)
+            if check is None:
+                check = UpdateCheck(model_id=model_id)
+                db.session.add(check)
+                checks[model_id] = check
+            check.checked_at = datetime.utcnow()
+            if error is not None:
+                check.last_error = str(error)[:256]
+                errors += 1
+            else:
+                check.last_error = None
+                check.etag, check.last_modified = etag, last_modified
+                if model is not None:
+                    changed += 1
+                    # The fresh JSON also refreshes the local copy used by detail pages
+                    store_model(model, 'api')
+                _apply(check, model, installed[model_id])
+
+            done += 1
+            if done % COMMIT_EVERY == 0:
+                db.session.commit()
+            if progress_callback:
+                progress_callback(int(done / total * 100), f"Checked {done}/{total} models for updates")
+    db.session.commit()
+
+    available = UpdateCheck.query.filter_by(update_available=True).count()
+    message = f"Update check complete. {available} update(s) available; {changed} model(s) changed"
+    if errors:
+        message += f", {errors} failed"
+    if auto_queue is None:
+        auto_queue = auto_queue_enabled()
+    if auto_queue:
+        if api_key:
+            message += f"; queued {queue_updates(api_key)} download(s)"
+        else:
+            message += "; not queuing downloads without an API key"
+    return message + "."
+
+def queue_updates(api_key, model_id=None):
+    """Queue the latest version of models with an update, once per version."""
+    from app.download_manager import download_manager
+
+    query = UpdateCheck.query.filter_by(update_available=True)
+    if model_id:
+        query = query.filter_by(model_id=model_id)
+    queued = 0
+    for check in query:
+        if check.queued_version_id == check.latest_version_id:
+            continue
+        download_manager.add_task(check.model_id, check.latest_version_id, api_key)
+        check.queued_version_id = check.latest_version_id
+        queued += 1
+    db.session.commit()
+    return queued
+
+def check_due(interval_hours):
+    last = last_check()
+    return last is None or last < datetime.utcnow() - timedelta(hours=interval_hours)
+
+def start_scheduler(app):
+    """Periodically queue an update check on the download manager's worker."""
+    global _scheduler_started
+    interval_hours = app.config['UPDATE_CHECK_INTERVAL_HOURS']
+    if interval_hours <= 0:
+        return
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        _scheduler_started = True
+    threading.Thread(target=_schedule, args=(app, interval_hours), daemon=True).start()
+
+def _schedule(app, interval_hours):
+    from app.download_manager import download_manager, scheduler_api_key
+
+    while True:
+        time.sleep(SCHEDULER_POLL_SECONDS)
+        try:
+            with app.app_context():
+                if check_due(interval_hours) and Download.query.first():
+                    # Stamp now so a long queue does not get a second check added
+                    _set_setting(LAST_CHECK_KEY, datetime.utcnow().isoformat())
+                    db.session.commit()
+                    download_manager.add_task(task_type='update_check', api_key=scheduler_api_key())
+        except Exception as e:
+            print(f"Update check scheduler error: {e}")
@@ -0,0 +1,160 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# Responses that mean "slow down" rather than "this request is wrong"
+THROTTLE_STATUSES = {429, 503}
+
+
+class RateLimited(requests.HTTPError):
+    """Civitai is rate limiting us and an interactive request could not wait any longer."""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamGovernor:
+    """
+    Shared concurrency limit for calls to the Civitai API.
+
+    The limit grows by about one slot per window of successful responses and
+    halves on a 429/503 or network error (AIMD), at most once per window:
+    failures of calls started before the last decrease are not counted again.
+    ``Retry-After`` pauses all new calls until it expires. Background callers
+    leave ``interactive_reserve`` slots free and always queue behind waiting
+    interactive (page) requests. Calls without their own ``timeout`` get
+    the (connect, read) ``timeout`` so a stalled server cannot hold a slot.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, interactive_reserve=1, interactive_wait=5.0,
+                 retries=3, default_backoff=1.0, timeout=(10.0, 60.0)):
+        self._cond = threading.Condition()
+        self.configure(initial=initial, minimum=minimum, maximum=maximum, interactive_reserve=interactive_reserve,
+                       interactive_wait=interactive_wait, retries=retries, default_backoff=default_backoff,
+                       timeout=timeout)
+        self.active = 0
+        self.waiting_interactive = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def configure(self, **settings):
+        with self._cond:
+            for name, value in settings.items():
+                setattr(self, name, value)
+            self.limit = float(min(max(self.initial, self.minimum), self.maximum))
+            self._cond.notify_all()
+
+    def _capacity(self, interactive):
+        capacity = int(self.limit)
+        if not interactive:
+            capacity = max(capacity - self.interactive_reserve, 1)
+        return capacity
+
+    def acquire(self, interactive=False):
+        """
+        Wait for a slot and return the time it was granted (pass it to
+        ``release``). Interactive callers give up after ``interactive_wait`` seconds.
+        """
+        deadline = time.monotonic() + self.interactive_wait if interactive else None
+        with self._cond:
+            if interactive:
+                self.waiting_interactive += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now >= self.blocked_until and self.active < self._capacity(interactive) \
+                            and (interactive or not self.waiting_interactive):
+                        self.active += 1
+                        return now
+                    timeout = max(self.blocked_until - now, 0.0) or None
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise RateLimited("Civitai is rate limiting requests; try again shortly")
+                        timeout = min(timeout or deadline - now, deadline - now)
+                    self._cond.wait(timeout)
+            finally:
+                if interactive:
+                    self.waiting_interactive -= 1
+
+    def release(self, status=None, retry_after=None, started=None):
+        """Return a slot and adapt the limit to the outcome (``status`` None for a network error)."""
+        with self._cond:
+            self.active -= 1
+            self.requests += 1
+            now = time.monotonic()
+            if status in THROTTLE_STATUSES or status is None:
+                if status is None:
+                    self.errors += 1
+                else:
+                    self.throttled += 1
+                    pause = parse_retry_after(retry_after)
+                    self.blocked_until = max(self.blocked_until, now + (pause if pause is not None
+                                                                         else self.default_backoff))
+                # A burst of failures from one congested window counts once
+                if started is None or started >= self._last_decrease:
+                    self.limit = max(self.limit / 2, float(self.minimum))
+                    self._last_decrease = now
+            elif status < 500:
+                self.limit = min(self.limit + 1 / self.limit, float(self.maximum))
+            self._cond.notify_all()
+
+    def get(self, url, interactive=False, **kwargs):
+        """
+        ``requests.get`` under the governor. Throttled background calls are
+        retried up to ``retries`` times; interactive calls once.
+        """
+        attempts = 1 + (min(self.retries, 1) if interactive else self.retries)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(attempts):
+            started = self.acquire(interactive)
+            try:
+                response = requests.get(url, **kwargs)
+            except requests.RequestException:
+                self.release(None, started=started)
+                raise
+            self.release(response.status_code, response.headers.get("Retry-After"), started)
+            if response.status_code not in THROTTLE_STATUSES:
+                break
+        return response
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "active": self.active,
+                "waiting_interactive": self.waiting_interactive,
+                "paused_for": round(max(self.blocked_until - time.monotonic(), 0.0), 2),
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "errors": self.errors,
+            }
+
+
+governor = UpstreamGovernor()
+
+
+def init_app(app):
+    governor.configure(
+        initial=app.config["UPSTREAM_INITIAL_CONCURRENCY"],
+        minimum=app.config["UPSTREAM_MIN_CONCURRENCY"],
+        maximum=app.config["UPSTREAM_MAX_CONCURRENCY"],
+        interactive_wait=app.config["UPSTREAM_INTERACTIVE_WAIT"],
+        retries=app.config["UPSTREAM_RETRIES"],
+        timeout=(app.config["UPSTREAM_CONNECT_TIMEOUT"], app.config["UPSTREAM_READ_TIMEOUT"]),
+    )
@@ -0,0 +1,263 @@
+"""
+A local stand-in for the Civitai API and file CDN.
+
+Serves ``/api/v1/models`` (with page and cursor paging), ``/api/v1/models/<id>`` (with ETags),
+``/api/v1/model-versions/by-hash/<hash>``, ``/api/v1/tags``, ``/api/v1/creators``,
+``/api/v1/creators/<id>`` and the file and image downloads referenced by a
+synthetic catalog (see ``synthetic_library.build_catalog``).
+
+``latency`` adds a fixed delay in seconds to every request and
+``bandwidth`` caps response bodies in bytes per second, so network-bound
+code paths can be measured reproducibly. ``max_concurrency`` answers API
+requests beyond that many in flight with 429 and ``Retry-After``.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.synthetic_library import iter_file_bytes
+
+PNG_BYTES = (
+    b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89"
+    b"\x00\x00\x00\rIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa7\x35\x81\x84\x00\x00\x00\x00IEND\xaeB`\x82"
+)
+# Catalog images are IMAGE_SIZE originals; like the Civitai CDN, a
+# ``width=N`` path segment serves a compressed variant that wide
+IMAGE_SIZE = (1024, 1536)
+
+
+def image_bytes(transform=None):
+    """A PNG padded to the size an image (or its width variant) would have."""
+    width, height = IMAGE_SIZE
+    size = int(width * height * 1.5)
+    for option in (transform or "").split(","):
+        name, _, value = option.partition("=")
+        if name == "width" and value.isdigit() and int(value) < width:
+            size = int(int(value) ** 2 * height / width * 0.25)
+    return PNG_BYTES + b"\0" * max(size - len(PNG_BYTES), 0)
+
+
+class FakeCivitai:
+    def __init__(self, latency=0.0, bandwidth=None, host="127.0.0.1", port=0, max_concurrency=None,
+                 retry_after=1):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.throttled_count = 0
+        self.models = {}
+        self.versions = {}
+        self.hashes = {}
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        return f"{self.base_url}/api/v1"
+
+    def load_catalog(self, catalog):
+        """Register the models of a synthetic catalog with the server."""
+        for model in catalog:
+            self.models[model["id"]] = model
+            for version in model.get("modelVersions", []):
+                self.versions[version["id"]] = version
+                for file_info in version.get("files", []):
+                    for value in file_info.get("hashes", {}).values():
+                        self.hashes[value.lower()] = version
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.throttled_count = 0
+
+    def _count(self):
+        with self._lock:
+            self.request_count += 1
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            fake._count()
+            throttled = fake.max_concurrency is not None and self.path.startswith("/api/v1/")
+            if throttled:
+                with fake._lock:
+                    if fake.in_flight >= fake.max_concurrency:
+                        fake.throttled_count += 1
+                        return self._error(429, {"Retry-After": str(fake.retry_after)})
+                    fake.in_flight += 1
+            try:
+                self._route()
+            finally:
+                if throttled:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+        def _route(self):
+            if fake.latency:
+                time.sleep(fake.latency)
+
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            path = url.path
+
+            if path == "/api/v1/models":
+                return self._models(query)
+            match = re.fullmatch(r"/api/v1/models/(\d+)", path)
+            if match:
+                model = fake.models.get(int(match.group(1)))
+                return self._conditional_json(model) if model else self._error(404)
+            match = re.fullmatch(r"/api/v1/model-versions/by-hash/(\w+)", path)
+            if match:
+                version = fake.hashes.get(match.group(1).lower())
+                return self._json(version) if version else self._error(404)
+            if path == "/api/v1/tags":
+                return self._listing([{"name": t, "link": ""} for t in ("synthetic", "benchmark")], query)
+            if path == "/api/v1/creators":
+                return self._listing(self._creators(), query)
+            match = re.fullmatch(r"/api/v1/creators/(\d+)", path)
+            if match:
+                creator = next((c for c in self._creators() if c["id"] == int(match.group(1))), None)
+                return self._json(creator) if creator else self._error(404)
+            match = re.fullmatch(r"/api/download/models/(\d+)", path)
+            if match:
+                return self._file(int(match.group(1)))
+            match = re.fullmatch(r"/images/(?:\d+/([^/]+)/)?\d+\.png", path)
+            if match:
+                return self._body(image_bytes(match.group(1)), "image/png")
+            return self._error(404)
+
+        def _creators(self):
+            counts = {}
+            for m in fake.models.values():
+                counts[m["creator"]["username"]] = counts.get(m["creator"]["username"], 0) + 1
+            return [{"id": n, "username": c, "modelCount": counts[c], "link": ""}
+                    for n, c in enumerate(sorted(counts), 1)]
+
+        def _models(self, query):
+            items = list(fake.models.values())
+            if query.get("types"):
+                items = [m for m in items if m["type"] == query["types"]]
+            if query.get("username"):
+                items = [m for m in items if m["creator"]["username"] == query["username"]]
+            if query.get("query"):
+                items = [m for m in items if query["query"].lower() in m["name"].lower()]
+            return self._listing(items, query, cursors=True)
+
+        def _listing(self, items, query, cursors=False):
+            limit = int(query.get("limit") or 100)
+            if cursors and query.get("cursor"):
+                # Like upstream: cursor pages carry no totals
+                start = int(query["cursor"])
+                metadata = {"pageSize": limit}
+            else:
+                page = int(query.get("page") or 1)
+                start = (page - 1) * limit
+                metadata = {
+                    "totalItems": len(items),
+                    "currentPage": page,
+                    "pageSize": limit,
+                    "totalPages": (len(items) + limit - 1) // limit if limit else 0,
+                }
+            if cursors and start + limit < len(items):
+                metadata["nextCursor"] = str(start + limit)
+            return self._json({"items": items[start:start + limit], "metadata": metadata})
+
+        def _file(self, version_id):
+            version = fake.versions.get(version_id)
+            if not version:
+                return self._error(404)
+            file_info = next(f for f in version["files"] if f.get("primary"))
+            size = file_info["_size"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            for chunk in iter_file_bytes(file_info["_index"], size, chunk_size=256 * 1024):
+                self._write(chunk)
+
+        def _conditional_json(self, data):
+            body = json.dumps(data).encode("utf-8")
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self._write(body)
+
+        def _json(self, data):
+            self._body(json.dumps(data).encode("utf-8"), "application/json")
+
+        def _body(self, body, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self._write(body)
+
+        def _error(self, status, headers=None):
+            body = json.dumps({"error": "Not found" if status == 404 else "Error"}).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write(self, data):
+            if not fake.bandwidth:
+                self.wfile.write(data)
+                return
+            # Throttle in 64 KB slices to approximate a steady link.
+            view = memoryview(data)
+            step = 64 * 1024
+            for offset in range(0, len(view), step):
+                piece = view[offset:offset + step]
+                started = time.perf_counter()
+                self.wfile.write(piece)
+                remaining = len(piece) / fake.bandwidth - (time.perf_counter() - started)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+    return Handler
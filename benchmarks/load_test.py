@@ -0,0 +1,349 @@
+"""
+End-to-end HTTP load test of the web routes.
+
+Seeds a fresh database with a library of ``--library`` downloaded models,
+serves the app in a separate process (so the load generator does not share
+its GIL) against a local fake Civitai server, and drives the main routes
+from ``--concurrency`` keep-alive clients for ``--duration`` seconds after
+a warm-up. Reports latency percentiles, throughput and error rate per route
+as JSON. Route order and model IDs are seeded, so runs are repeatable.
+``--scan`` writes the library to disk and rescans it during the load, to
+measure pages against a busy background writer.
+
+    python -m benchmarks.load_test --library 2000 --concurrency 16 -o before.json
+    python -m benchmarks.load_test --library 2000 --concurrency 16 --compare before.json --max-regression 20
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from benchmarks.fake_civitai import FakeCivitai
+from benchmarks.run_benchmarks import parse_size
+from benchmarks.synthetic_library import build_catalog, write_library
+
+# name -> (path, weight); placeholders are filled per request from a random catalog model
+ROUTES = {
+    "index": ("/", 1),
+    "models": ("/models", 3),
+    "model_detail": ("/models/{model_id}", 3),
+    "search": ("/search?q={query}", 2),
+    "library": ("/library", 2),
+    "library_type": ("/library?type={model_type}", 1),
+    "downloads_status": ("/api/downloads/status", 4),
+    "typeahead": ("/api/typeahead?q={prefix}", 2),
+}
+SEED_TYPES = ("LORA", "Checkpoint", "TextualInversion", "LoCon")
+PERCENTILES = (50, 95, 99)
+REQUEST_TIMEOUT = 60
+
+
+def make_app(workdir, **settings):
+    from app import create_app
+    from app.config import Config
+
+    attributes = {"SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "civitr.db"),
+                  "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache")}
+    attributes.update(settings)
+    return create_app(type("LoadTestConfig", (Config,), attributes))
+
+
+def seed_database(app, workdir, catalog, library_size, jobs, write_files=False):
+    """
+    Record the first ``library_size`` catalog models as downloaded, with
+    their local files, spread over a few model types, plus ``jobs``
+    finished download jobs for the status endpoint. ``write_files`` also
+    writes the files, recorded as changed so a scan rehashes every one.
+    """
+    from app import db
+    from app.models import Download, Job, LocalFile, Setting
+
+    now = datetime.utcnow()
+    with app.app_context():
+        for index, model_type in enumerate(SEED_TYPES):
+            directory = os.path.join(workdir, "library", model_type)
+            db.session.add(Setting(key=f"dir_{model_type}", value=directory))
+            if write_files:
+                write_library(directory, catalog[index:library_size:len(SEED_TYPES)])
+        for index, model in enumerate(catalog[:library_size]):
+            version = model["modelVersions"][0]
+            file_info = version["files"][0]
+            model_type = SEED_TYPES[index % len(SEED_TYPES)]
+            path = os.path.join(workdir, "library", model_type, file_info["name"])
+            download = Download(model_id=model["id"], version_id=version["id"], name=model["name"], type=model_type)
+            download.set_files({"model": path, "image": os.path.splitext(path)[0] + ".png"})
+            db.session.add(download)
+            db.session.add(LocalFile(path=path, size=file_info["_size"], mtime=0.0 if write_files else time.time(),
+                                     sha256=file_info["hashes"]["SHA256"].lower(),
+                                     model_id=model["id"], version_id=version["id"]))
+        for index in range(jobs):
+            model = catalog[index % len(catalog)]
+            finished = now - timedelta(minutes=index)
+            db.session.add(Job(type="download", model_id=model["id"], version_id=model["modelVersions"][0]["id"],
+                               status="completed", progress=100, message="Download complete",
+                               created_at=finished, started_at=finished, finished_at=finished))
+        db.session.commit()
+
+
+def _serve(workdir, api_url, settings, port_queue):
+    """Runs in the server process: serve the seeded app until terminated."""
+    from werkzeug.serving import make_server
+
+    from app import api
+
+    api.BASE_URL = api_url
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, make_app(workdir, **settings), threaded=True)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def start_server(workdir, api_url, settings, timeout=60):
+    """Start the app in a fresh interpreter; returns (process, base URL)."""
+    context = multiprocessing.get_context("spawn")
+    port_queue = context.Queue()
+    process = context.Process(target=_serve, args=(workdir, api_url, settings, port_queue), daemon=True)
+    process.start()
+    port = port_queue.get(timeout=timeout)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+class LoadGenerator:
+    """
+    Closed-loop clients, each with its own keep-alive session, requesting
+    routes in a seeded weighted order until the deadline. Samples taken
+    before ``measure_from`` are warm-up and not kept.
+    """
+
+    def __init__(self, base_url, routes, catalog, concurrency, seed):
+        self.base_url = base_url
+        self.routes = routes
+        self.catalog = catalog
+        self.concurrency = concurrency
+        self.seed = seed
+        self.samples = [] # (route, status or None, seconds)
+        self._lock = threading.Lock()
+
+    def _request_path(self, name, rng):
+        model = rng.choice(self.catalog)
+        words = model["name"].split()
+        return ROUTES[name][0].format(model_id=model["id"], query=words[-1], prefix=words[0][:3].lower(),
+                                      model_type=rng.choice(SEED_TYPES))
+
+    def _client(self, worker, measure_from, deadline):
+        rng = random.Random(self.seed * 1000 + worker)
+        schedule = [name for name in self.routes for _ in range(ROUTES[name][1])]
+        samples = []
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                name = rng.choice(schedule)
+                url = self.base_url + self._request_path(name, rng)
+                started = time.perf_counter()
+                try:
+                    # Redirects would be timed as part of another route
+                    response = session.get(url, timeout=REQUEST_TIMEOUT, allow_redirects=False)
+                    response.content
+                    status = response.status_code
+                except requests.RequestException:
+                    status = None
+                finished = time.perf_counter()
+                if started >= measure_from:
+                    samples.append((name, status, finished - started))
+        with self._lock:
+            self.samples.extend(samples)
+
+    def run(self, duration, warmup):
+        measure_from = time.perf_counter() + warmup
+        deadline = measure_from + duration
+        threads = [threading.Thread(target=self._client, args=(worker, measure_from, deadline), daemon=True)
+                   for worker in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.samples
+
+
+def summarize(samples, duration):
+    """Latency percentiles (ms), throughput and errors per route and in total."""
+    by_route = {}
+    for name, status, seconds in samples:
+        by_route.setdefault(name, []).append((status, seconds))
+    by_route["total"] = [(status, seconds) for _, status, seconds in samples]
+
+    results = {}
+    for name, entries in by_route.items():
+        latencies = sorted(seconds * 1000 for _, seconds in entries)
+        statuses = {}
+        for status, _ in entries:
+            key = str(status) if status is not None else "error"
+            statuses[key] = statuses.get(key, 0) + 1
+        # Every route answers 2xx under normal operation
+        errors = sum(1 for status, _ in entries if status is None or status >= 400)
+        result = {
+            "requests": len(entries),
+            "rps": round(len(entries) / duration, 2),
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 4) if entries else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "max_ms": round(latencies[-1], 2) if latencies else None,
+            "statuses": statuses,
+        }
+        for p in PERCENTILES:
+            value = percentile(latencies, p)
+            result[f"p{p}_ms"] = round(value, 2) if value is not None else None
+        results[name] = result
+    return results
+
+
+def compare(current, previous, max_regression=None):
+    """Print the change per route; returns the regressions beyond ``max_regression`` percent."""
+    regressions = []
+    differing = sorted(k for k, v in current["params"].items() if previous.get("params", {}).get(k) != v)
+    if differing:
+        print(f"Note: the runs differ in {', '.join(differing)}", file=sys.stderr)
+    print(f"{'route':<18}{'metric':<12}{'previous':>12}{'current':>12}{'change':>10}")
+    for name, result in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if not old:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps", "error_rate"):
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else None
+            print(f"{name:<18}{metric:<12}{before:>12}{after:>12}"
+                  f"{f'{change:+.1f}%' if change is not None else 'n/a':>10}")
+            if max_regression is None:
+                continue
+            if metric == "p95_ms" and change is not None and change > max_regression:
+                regressions.append(f"{name} {metric} {before} -> {after} ms ({change:+.1f}%)")
+            elif metric == "error_rate" and after > before:
+                regressions.append(f"{name} error rate {before:.2%} -> {after:.2%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--library", type=int, default=500, help="downloaded models seeded into the database")
+    parser.add_argument("--models", type=int, default=200,
+                        help="models served by the fake API (at least --library)")
+    parser.add_argument("--jobs", type=int, default=50, help="finished download jobs seeded into the database")
+    parser.add_argument("--file-size", default="1KB", help="recorded size of each library file")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=15.0, help="measured seconds of load")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load before measuring")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated routes to drive")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API latency per request in seconds")
+    parser.add_argument("--page-cache-ttl", type=int, default=None,
+                        help="PAGE_CACHE_TTL of the app (default: the configured value; 0 disables)")
+    parser.add_argument("--scan", action="store_true",
+                        help="write the library to disk and scan it while the load runs")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the request order")
+    parser.add_argument("-o", "--output", help="write results JSON to this file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="with --compare, exit 1 if a route's p95 grew by more than this percent "
+                             "or its error rate rose")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    args = parser.parse_args(argv)
+
+    routes = [name for name in args.routes.split(",") if name]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}; choose from {', '.join(ROUTES)}")
+    file_size = parse_size(args.file_size)
+    settings = {"EMBEDDED_WORKER": args.scan}
+    if args.page_cache_ttl is not None:
+        settings["PAGE_CACHE_TTL"] = args.page_cache_ttl
+    workdir = tempfile.mkdtemp(prefix="civitr-load-")
+
+    fake = FakeCivitai(latency=args.latency).start()
+    server = None
+    try:
+        catalog = build_catalog(max(args.models, args.library), file_size, "LORA", fake.base_url)
+        fake.load_catalog(catalog)
+
+        from app import api
+
+        api.BASE_URL = fake.api_url
+        seed_database(make_app(workdir, EMBEDDED_WORKER=False), workdir, catalog, args.library, args.jobs,
+                      write_files=args.scan)
+
+        server, base_url = start_server(workdir, fake.api_url, settings)
+        print(f"Serving {base_url}; {args.warmup:g} s warm-up, {args.duration:g} s at "
+              f"concurrency {args.concurrency}", file=sys.stderr)
+        fake.reset_counters()
+        if args.scan:
+            requests.post(f"{base_url}/settings/scan", allow_redirects=False, timeout=REQUEST_TIMEOUT)
+        generator = LoadGenerator(base_url, routes, catalog, args.concurrency, args.seed)
+        samples = generator.run(args.duration, args.warmup)
+        api_requests = fake.request_count
+        scan = requests.get(f"{base_url}/api/library/scan", timeout=REQUEST_TIMEOUT).json() if args.scan else None
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+        fake.stop()
+        if args.keep:
+            print(f"Working directory kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "library": args.library,
+            "models": len(catalog),
+            "jobs": args.jobs,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "routes": routes,
+            "latency": args.latency,
+            "page_cache_ttl": args.page_cache_ttl,
+            "scan": args.scan,
+            "seed": args.seed,
+        },
+        "api_requests": api_requests,
+        "scan": scan,
+        "results": summarize(samples, args.duration),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Offline benchmarks for the scanner and downloader.
+
+Runs ``scan_directory``, ``download_file`` and ``download_model`` against a
+local fake Civitai server and a synthetic library, and writes the results
+as JSON so runs can be compared. CPU time is for the whole process, so it
+includes the in-process fake server; compare runs, not absolute numbers.
+
+    python -m benchmarks.run_benchmarks --files 200 --file-size 4MB -o before.json
+    python -m benchmarks.run_benchmarks --files 200 --file-size 4MB --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_civitai import FakeCivitai
+from benchmarks.synthetic_library import build_catalog, write_library
+
+BENCHMARKS = ("scan_cold", "scan_warm", "download_file", "download_model")
+
+
+def parse_size(value):
+    units = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+    value = value.strip().upper()
+    for suffix, factor in units.items():
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * factor)
+    return int(value)
+
+
+def make_app(workdir):
+    from app import create_app
+    from app.config import Config
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(workdir, "bench.db")
+        # No task worker or schedulers sending their own requests to the fake server
+        EMBEDDED_WORKER = False
+        # The scanned library holds every catalog file; download_model must transfer, not link them
+        DOWNLOAD_REUSE_LOCAL = False
+
+    return create_app(BenchmarkConfig)
+
+
+class Measurement:
+    """Wall-clock and CPU time of a block, plus fake server request count."""
+
+    def __init__(self, fake):
+        self.fake = fake
+
+    def __enter__(self):
+        self.fake.reset_counters()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        self.requests = self.fake.request_count
+
+
+def summarize(runs, items, total_bytes):
+    wall = statistics.median(r.wall for r in runs)
+    cpu = statistics.median(r.cpu for r in runs)
+    result = {
+        "runs": len(runs),
+        "wall_s": round(wall, 4),
+        "wall_s_all": [round(r.wall, 4) for r in runs],
+        "cpu_s": round(cpu, 4),
+        "items": items,
+        "bytes": total_bytes,
+        "items_per_s": round(items / wall, 2) if wall else None,
+        "mb_per_s": round(total_bytes / wall / 1024 ** 2, 2) if wall else None,
+        "cpu_s_per_gb": round(cpu / (total_bytes / 1024 ** 3), 3) if total_bytes else None,
+        "api_requests": runs[-1].requests,
+    }
+    return result
+
+
+def bench_scan(app, fake, workdir, catalog, file_size, repeat):
+    from app import db
+    from app.models import Download, LocalFile, Setting, UnresolvedHash
+    from app.scanner import scan_directory
+
+    directory = os.path.join(workdir, "library", "LORA")
+    write_library(directory, catalog)
+
+    results = {}
+    with app.app_context():
+        setting = Setting.query.get("dir_LORA") or Setting(key="dir_LORA")
+        setting.value = directory
+        db.session.add(setting)
+        db.session.commit()
+
+        cold_runs = []
+        for _ in range(repeat):
+            for model in (Download, LocalFile, UnresolvedHash):
+                model.query.delete()
+            db.session.commit()
+            with Measurement(fake) as m:
+                scan_directory(directory, "LORA")
+            cold_runs.append(m)
+        results["scan_cold"] = summarize(cold_runs, len(catalog), len(catalog) * file_size)
+
+        warm_runs = []
+        for _ in range(repeat):
+            with Measurement(fake) as m:
+                scan_directory(directory, "LORA")
+            warm_runs.append(m)
+        results["scan_warm"] = summarize(warm_runs, len(catalog), len(catalog) * file_size)
+    return results
+
+
+def bench_download_file(fake, workdir, catalog, file_size, repeat):
+    from app.downloader import download_file
+
+    target = os.path.join(workdir, "download_file")
+    runs = []
+    for _ in range(repeat):
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(target)
+        progress = []
+        with Measurement(fake) as m:
+            for model in catalog:
+                file_info = model["modelVersions"][0]["files"][0]
+                download_file(file_info["downloadUrl"], os.path.join(target, file_info["name"]),
+                              progress_callback=lambda *args: progress.append(args))
+        runs.append(m)
+    result = summarize(runs, len(catalog), len(catalog) * file_size)
+    result["progress_callbacks_per_file"] = len(progress) // max(len(catalog), 1)
+    return result
+
+
+def bench_download_model(app, fake, workdir, catalog, file_size, repeat):
+    from app import db
+    from app.downloader import download_model
+    from app.models import Download, Setting
+
+    target = os.path.join(workdir, "download_model")
+    runs = []
+    with app.app_context():
+        setting = Setting.query.get("dir_LORA") or Setting(key="dir_LORA")
+        setting.value = target
+        db.session.add(setting)
+        db.session.commit()
+        for _ in range(repeat):
+            shutil.rmtree(target, ignore_errors=True)
+            Download.query.delete()
+            db.session.commit()
+            with Measurement(fake) as m:
+                for model in catalog:
+                    version = model["modelVersions"][0]
+                    success, message = download_model(model["id"], version["id"])
+                    if not success:
+                        raise RuntimeError(f"download_model failed: {message}")
+            runs.append(m)
+    return summarize(runs, len(catalog), len(catalog) * file_size)
+
+
+def compare(current, previous):
+    print(f"{'benchmark':<16}{'metric':<14}{'previous':>12}{'current':>12}{'change':>10}")
+    for name, result in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if not old:
+            continue
+        for metric in ("wall_s", "cpu_s", "items_per_s", "mb_per_s", "api_requests"):
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{name:<16}{metric:<14}{before:>12}{after:>12}{change:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50, help="synthetic models in the library")
+    parser.add_argument("--file-size", default="1MB", help="size of each model file, e.g. 512KB, 4MB")
+    parser.add_argument("--download-files", type=int, default=None,
+                        help="models to download in the download benchmarks (default: --files)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API latency per request in seconds")
+    parser.add_argument("--bandwidth", default=None, help="fake server bandwidth per connection, e.g. 50MB")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per benchmark; the median is reported")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmarks to run")
+    parser.add_argument("-o", "--output", help="write results JSON to this file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    args = parser.parse_args(argv)
+
+    file_size = parse_size(args.file_size)
+    bandwidth = parse_size(args.bandwidth) if args.bandwidth else None
+    selected = set(args.only.split(","))
+    workdir = tempfile.mkdtemp(prefix="civitr-bench-")
+
+    from app import api
+
+    fake = FakeCivitai(latency=args.latency, bandwidth=bandwidth).start()
+    api.BASE_URL = fake.api_url
+    try:
+        catalog = build_catalog(args.files, file_size, "LORA", fake.base_url)
+        fake.load_catalog(catalog)
+        download_catalog = catalog[:args.download_files or args.files]
+        app = make_app(workdir)
+
+        results = {}
+        if selected & {"scan_cold", "scan_warm"}:
+            scan_results = bench_scan(app, fake, workdir, catalog, file_size, args.repeat)
+            results.update({k: v for k, v in scan_results.items() if k in selected})
+        if "download_file" in selected:
+            results["download_file"] = bench_download_file(fake, workdir, download_catalog, file_size, args.repeat)
+        if "download_model" in selected:
+            results["download_model"] = bench_download_model(app, fake, workdir, download_catalog,
+                                                             file_size, args.repeat)
+    finally:
+        fake.stop()
+        if args.keep:
+            print(f"Working directory kept at {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "files": args.files,
+            "file_size": file_size,
+            "download_files": len(download_catalog),
+            "latency": args.latency,
+            "bandwidth": bandwidth,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return report
+
+
+if __name__ == "__main__":
+    main()
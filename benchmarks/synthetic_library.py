@@ -0,0 +1,153 @@
+"""
+Deterministic synthetic model libraries for benchmarks.
+
+Every synthetic file is a minimal, valid ``.safetensors`` file: an 8-byte
+header length, a small JSON header and a filler payload. The bytes depend
+only on the file index and size, so the same parameters always produce the
+same SHA256s and the fake Civitai server can stream identical content
+without touching the disk.
+"""
+import hashlib
+import json
+import os
+import random
+import struct
+
+FILLER_BLOCK_SIZE = 1024 * 1024
+_filler_block = None
+
+BASE_MODELS = ["SD 1.5", "SDXL 1.0", "Pony", "Illustrious", "Flux.1 D"]
+
+
+def _filler():
+    global _filler_block
+    if _filler_block is None:
+        _filler_block = random.Random(0).randbytes(FILLER_BLOCK_SIZE)
+    return _filler_block
+
+
+def _header(index, size):
+    """Build the safetensors header for file ``index`` of total ``size`` bytes."""
+    header = {
+        "__metadata__": {
+            "ss_output_name": f"synthetic_{index:05d}",
+            "ss_base_model_version": "sd_v1",
+            "modelspec.title": f"Synthetic Model {index}",
+        },
+    }
+    # The payload length is written into the header, so size the header with
+    # a generous payload first and pad it with spaces to fill the gap.
+    header["weight"] = {"dtype": "U8", "shape": [size], "data_offsets": [0, size]}
+    reserved = len(json.dumps(header, separators=(",", ":"))) + 8
+    reserved += -(reserved + 8) % 8
+    payload = max(size - 8 - reserved, 0)
+    header["weight"] = {"dtype": "U8", "shape": [payload], "data_offsets": [0, payload]}
+    raw = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    raw += b" " * (reserved - len(raw))
+    return struct.pack("<Q", len(raw)) + raw
+
+
+def iter_file_bytes(index, size, chunk_size=FILLER_BLOCK_SIZE):
+    """Yield the content of synthetic file ``index`` in chunks."""
+    head = _header(index, size)
+    yield head[:size]
+    remaining = size - len(head)
+    filler = _filler()
+    # The content must not depend on chunk_size, or served files would not match their hashes
+    offset = 0
+    while remaining > 0:
+        n = min(chunk_size, remaining, len(filler) - offset)
+        yield filler[offset:offset + n]
+        offset = (offset + n) % len(filler)
+        remaining -= n
+
+
+def file_sha256(index, size):
+    sha256 = hashlib.sha256()
+    for chunk in iter_file_bytes(index, size):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def build_catalog(num_models, file_size, model_type="LORA", base_url="", start_id=1000):
+    """
+    Build the model JSON for ``num_models`` single-version models.
+
+    ``base_url`` is the root of the fake server, used for download and image
+    URLs. Each entry mirrors the shape returned by ``/api/v1/models/<id>``.
+    """
+    catalog = []
+    for index in range(num_models):
+        model_id = start_id + index
+        version_id = start_id * 10 + index
+        name = f"Synthetic {model_type} {index:05d}"
+        filename = f"synthetic_{model_type.lower()}_{index:05d}.safetensors"
+        model = {
+            "id": model_id,
+            "name": name,
+            "type": model_type,
+            "nsfw": False,
+            "tags": ["synthetic", "benchmark"],
+            "creator": {"username": f"creator{index % 25}", "image": None},
+            "stats": {"downloadCount": index * 7, "rating": 5},
+            "modelVersions": [
+                {
+                    "id": version_id,
+                    "modelId": model_id,
+                    "name": "v1.0",
+                    "baseModel": BASE_MODELS[index % len(BASE_MODELS)],
+                    "model": {"name": name, "type": model_type},
+                    "images": [{"url": f"{base_url}/images/{version_id}/original=true/{version_id}.png",
+                                "width": 1024, "height": 1536}],
+                    "files": [
+                        {
+                            "name": filename,
+                            "sizeKB": file_size / 1024,
+                            "primary": True,
+                            "downloadUrl": f"{base_url}/api/download/models/{version_id}",
+                            "hashes": {"SHA256": file_sha256(index, file_size).upper()},
+                            "_index": index,
+                            "_size": file_size,
+                        }
+                    ],
+                }
+            ],
+        }
+        catalog.append(model)
+    return catalog
+
+
+def write_library(directory, catalog, with_metadata=False, with_images=False):
+    """
+    Write the primary file of every catalog entry into ``directory``.
+
+    ``with_metadata`` also writes the ``<name>.metadata.json`` sidecar the
+    downloader produces, ``with_images`` a tiny preview image.
+    Returns the list of written model file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for model in catalog:
+        version = model["modelVersions"][0]
+        file_info = version["files"][0]
+        path = os.path.join(directory, file_info["name"])
+        with open(path, "wb") as f:
+            for chunk in iter_file_bytes(file_info["_index"], file_info["_size"]):
+                f.write(chunk)
+        base_name = os.path.splitext(path)[0]
+        if with_metadata:
+            with open(f"{base_name}.metadata.json", "w") as f:
+                json.dump(model, f, indent=4)
+        if with_images:
+            with open(f"{base_name}.png", "wb") as f:
+                f.write(b"\x89PNG\r\n\x1a\n")
+        paths.append(path)
+    return paths
+
+
+def generate_library(directory, num_models, file_size, model_type="LORA", base_url="",
+                     with_metadata=False, with_images=False, start_id=1000):
+    """Build a catalog and write it to ``directory`` in one step."""
+    catalog = build_catalog(num_models, file_size, model_type, base_url, start_id)
+    write_library(directory, catalog, with_metadata, with_images)
+    return catalog
@@ -0,0 +1,112 @@
+import os
+import tempfile
+
+import pytest
+
+from app import api, create_app, db
+from app.config import Config
+from app.cursors import MAX_CURSOR_WALK, MAX_SEARCH_WALK, PageOutOfReach, get_models_page
+from app.models import PageCursor
+from benchmarks.fake_civitai import FakeCivitai
+from benchmarks.synthetic_library import build_catalog
+
+MODELS = 30
+LIMIT = 1
+
+
+@pytest.fixture(scope="module")
+def fake():
+    with FakeCivitai() as fake:
+        fake.load_catalog(build_catalog(MODELS, 1024, "LORA", fake.base_url))
+        yield fake
+
+
+@pytest.fixture(scope="module")
+def app(fake):
+    work = tempfile.mkdtemp()
+
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = "sqlite:///" + os.path.join(work, "test.db")
+        EMBEDDED_WORKER = False
+        DB_WRITE_QUEUE = False
+
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def ctx(app, fake, monkeypatch):
+    monkeypatch.setattr(api, "BASE_URL", fake.api_url)
+    with app.app_context():
+        PageCursor.query.delete()
+        db.session.commit()
+        fake.reset_counters()
+        yield
+
+
+def ids(response):
+    return [m["id"] for m in response["items"]]
+
+
+def browse(page):
+    return get_models_page({"limit": LIMIT, "types": "LORA"}, page)
+
+
+def search(page):
+    return get_models_page({"limit": LIMIT, "query": "Synthetic"}, page)
+
+
+def test_next_page_uses_stored_cursor(ctx, fake):
+    first = browse(1)
+    assert fake.request_count == 1
+    assert PageCursor.query.filter_by(page=2).one().cursor == first["metadata"]["nextCursor"]
+
+    second = browse(2)
+    assert fake.request_count == 2
+    assert ids(second) != ids(first)
+    assert "totalItems" not in second["metadata"]  # served by cursor
+
+
+def test_cold_jump_requests_page_directly(ctx, fake):
+    response = browse(4)
+    assert fake.request_count == 1
+    assert response["metadata"]["currentPage"] == 4
+
+
+def test_walks_from_nearest_cursor_within_reach(ctx, fake):
+    browse(1)
+    fake.reset_counters()
+    response = browse(2 + MAX_CURSOR_WALK)
+    assert fake.request_count == MAX_CURSOR_WALK + 1
+    assert ids(response) == [m["id"] for m in list(fake.models.values())[1 + MAX_CURSOR_WALK:2 + MAX_CURSOR_WALK]]
+    assert PageCursor.query.filter_by(page=2 + MAX_CURSOR_WALK + 1).count() == 1
+
+
+def test_falls_back_to_page_beyond_walk(ctx, fake):
+    browse(1)
+    fake.reset_counters()
+    response = browse(3 + MAX_CURSOR_WALK)
+    assert fake.request_count == 1
+    assert response["metadata"]["currentPage"] == 3 + MAX_CURSOR_WALK
+
+
+def test_search_walks_from_first_page(ctx, fake):
+    response = search(4)
+    assert fake.request_count == 4
+    assert "totalItems" not in response["metadata"]
+    assert ids(response) == [m["id"] for m in list(fake.models.values())[3:4]]
+
+
+def test_search_past_walk_cap_is_refused(ctx, fake):
+    with pytest.raises(PageOutOfReach):
+        search(2 + MAX_SEARCH_WALK)
+    assert fake.request_count == 0
+
+
+def test_search_past_end_is_empty(ctx, fake):
+    # Leaves a cursor for the page MAX_SEARCH_WALK before the one past the end
+    search(MODELS - MAX_SEARCH_WALK)
+    fake.reset_counters()
+    response = search(MODELS + 1)
+    assert response == {"items": [], "metadata": {}}
+    assert fake.request_count == MAX_SEARCH_WALK
@@ -0,0 +1,122 @@
+import socket
+import time
+
+import pytest
+import requests
+
+from app.upstream import UpstreamGovernor, parse_retry_after
+from benchmarks.fake_civitai import FakeCivitai
+
+
+def test_success_grows_limit_by_one_slot_per_window():
+    governor = UpstreamGovernor(initial=4, maximum=16)
+    governor.release(200, started=governor.acquire())
+    assert governor.limit == 4.25
+    for _ in range(3):
+        governor.release(200, started=governor.acquire())
+    assert 4.9 < governor.limit < 5
+
+
+def test_success_is_capped_at_maximum():
+    governor = UpstreamGovernor(initial=4, maximum=4)
+    governor.release(200, started=governor.acquire())
+    assert governor.limit == 4
+
+
+def test_throttle_halves_limit_and_pauses_for_retry_after():
+    governor = UpstreamGovernor(initial=8, minimum=3)
+    before = time.monotonic()
+    governor.release(429, "30", started=governor.acquire())
+    assert governor.limit == 4
+    assert governor.blocked_until == pytest.approx(before + 30, abs=1)
+    assert governor.throttled == 1 and governor.active == 0
+
+    governor.blocked_until = 0.0
+    governor.release(503, started=governor.acquire())
+    assert governor.limit == 3  # never below minimum
+
+
+def test_throttle_without_retry_after_uses_default_backoff():
+    governor = UpstreamGovernor(default_backoff=2.0)
+    before = time.monotonic()
+    governor.active = 1
+    governor.release(429, started=before)
+    assert governor.blocked_until == pytest.approx(before + 2.0, abs=0.5)
+
+
+def test_failures_from_one_window_count_once():
+    governor = UpstreamGovernor(initial=16)
+    started = [governor.acquire() for _ in range(3)]
+    for start in started:
+        governor.release(429, "0", started=start)
+    assert governor.limit == 8
+    assert governor.throttled == 3
+
+    # A call started after the decrease counts again
+    governor.release(429, "0", started=governor.acquire())
+    assert governor.limit == 4
+
+
+def test_network_error_halves_without_pause():
+    governor = UpstreamGovernor(initial=4)
+    governor.release(None, started=governor.acquire())
+    assert governor.limit == 2
+    assert governor.errors == 1
+    assert governor.blocked_until == 0.0
+
+
+def test_server_error_leaves_limit_alone():
+    governor = UpstreamGovernor(initial=4)
+    governor.release(500, started=governor.acquire())
+    assert governor.limit == 4
+
+
+def test_background_calls_leave_interactive_reserve():
+    governor = UpstreamGovernor(initial=2, interactive_reserve=1)
+    assert governor._capacity(interactive=False) == 1
+    assert governor._capacity(interactive=True) == 2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_get_retries_throttled_background_calls():
+    with FakeCivitai(max_concurrency=0, retry_after=0) as fake:
+        governor = UpstreamGovernor(initial=4, retries=2)
+        response = governor.get(f"{fake.api_url}/models")
+    assert response.status_code == 429
+    assert fake.request_count == 3
+    assert governor.throttled == 3
+    assert governor.limit == 1
+    assert governor.active == 0
+
+
+def test_get_retries_interactive_calls_once():
+    with FakeCivitai(max_concurrency=0, retry_after=0) as fake:
+        governor = UpstreamGovernor(retries=3)
+        governor.get(f"{fake.api_url}/models", interactive=True)
+    assert fake.request_count == 2
+
+
+def test_get_succeeds_and_grows_limit():
+    with FakeCivitai(max_concurrency=4) as fake:
+        governor = UpstreamGovernor(initial=2)
+        response = governor.get(f"{fake.api_url}/models")
+    assert response.status_code == 200
+    assert governor.limit == 2.5
+
+
+def test_get_applies_default_timeout():
+    # Accepts connections but never answers
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        governor = UpstreamGovernor(timeout=(1.0, 0.2))
+        with pytest.raises(requests.Timeout):
+            governor.get(f"http://127.0.0.1:{server.getsockname()[1]}/")
+    assert governor.errors == 1
+    assert governor.active == 0
@@ -0,0 +1,22 @@
+"""
+Standalone task worker.
+
+Runs queued downloads, library scans and update checks from the shared
+database. Use it when the web app is served by several processes, with the
+embedded worker disabled:
+
+    EMBEDDED_WORKER=false gunicorn -w 4 run:app
+    python worker.py
+"""
+import os
+
+# This process is the worker; don't also start one from the blueprint hook
+os.environ['EMBEDDED_WORKER'] = 'false'
+
+from app import create_app
+from app.download_manager import download_manager
+
+app = create_app()
+
+if __name__ == '__main__':
+    download_manager.run()